@@ -0,0 +1,382 @@
+#!/usr/bin/python3
+"""Time a complete britney run on a synthetic archive
+
+Generates a synthetic testing/unstable archive (see --help for the
+knobs), runs britney on it and reports the time spent in each of the
+major phases of the run.  The results can be stored as JSON (--output)
+and compared with the results of a previous run (--compare), e.g. to
+look for regressions between two commits.
+
+Phases can nest (compile_nuninst is also called while building the
+installability tester and while checking the final result), so their
+times do not add up to the total.
+"""
+
+import argparse
+import contextlib
+import functools
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+import britney  # noqa: E402
+from britney2.excusefinder import ExcuseFinder  # noqa: E402
+from britney2.inputs.suiteloader import DebMirrorLikeSuiteContentLoader  # noqa: E402
+
+
+RESULT_FORMAT = 1
+
+BRITNEY_CONF = '''
+TESTING           = data/testing
+UNSTABLE          = data/unstable
+
+NONINST_STATUS    = data/testing/non-installable-status
+EXCUSES_OUTPUT    = output/excuses.html
+EXCUSES_YAML_OUTPUT = output/excuses.yaml
+UPGRADE_OUTPUT    = output/output.txt
+HEIDI_OUTPUT      = output/HeidiResult
+
+STATIC_INPUT_DIR  = data/testing/input
+STATE_DIR         = data/testing/state
+
+ARCHITECTURES     = {architectures}
+NOBREAKALL_ARCHES = {architectures}
+OUTOFSYNC_ARCHES  =
+BREAK_ARCHES      =
+NEW_ARCHES        =
+
+MINDAYS_LOW       = 0
+MINDAYS_MEDIUM    = 0
+MINDAYS_HIGH      = 0
+MINDAYS_CRITICAL  = 0
+MINDAYS_EMERGENCY = 0
+DEFAULT_URGENCY   = medium
+NO_PENALTIES      = high critical emergency
+BOUNTY_MIN_AGE    = 8
+
+HINTSDIR = data/hints
+
+HINTS_FREEZE      = block block-all block-udeb
+HINTS_FREEZE-EXCEPTION = unblock unblock-udeb
+HINTS_SATBRITNEY  = easy
+HINTS_AUTO-REMOVALS = remove
+
+SMOOTH_UPDATES    = libs oldlibs
+
+IGNORE_CRUFT      = 0
+
+REMOVE_OBSOLETE   = no
+
+ADT_ENABLE        = no
+PIUPARTS_ENABLE   = no
+'''
+
+# The phases reported by this benchmark as (owner, attribute name, phase name)
+PHASES = [
+    (DebMirrorLikeSuiteContentLoader, 'load_suites', 'load_suites'),
+    (britney, 'build_installability_tester', 'build_installability_tester'),
+    (britney, 'compile_nuninst', 'compile_nuninst'),
+    (ExcuseFinder, 'find_actionable_excuses', 'excuses'),
+    (britney.Britney, 'iter_packages', 'iter_packages'),
+    (britney, 'write_excuses', 'output'),
+    (britney, 'write_heidi', 'output'),
+    (britney, 'write_heidi_delta', 'output'),
+    (britney, 'write_nuninst', 'output'),
+]
+
+
+class SyntheticArchive(object):
+    """A synthetic testing/unstable archive
+
+    The sources form layers: a source only depends on binaries of sources
+    with a lower number.  The first sources are libraries ("libN-S" with
+    S being the SONAME), of which some have a SONAME transition in
+    unstable together with a part of their reverse dependencies.
+    """
+
+    def __init__(self, args):
+        self._args = args
+        self._rnd = random.Random(args.seed)
+        # suite -> source name -> (version, section, [binary fields])
+        self.suites = {'testing': {}, 'unstable': {}}
+        self._generate()
+
+    def _pick_lower(self, i):
+        # Bias the dependencies towards the "low-level" sources
+        return int(self._rnd.random() ** 3 * i)
+
+    def _binary_names(self, i, soname):
+        if i < self._libraries:
+            names = ['lib%d-%d' % (i, soname)]
+        else:
+            names = ['src%d' % i]
+        names.extend('src%d-extra%d' % (i, j) for j in range(1, self._binary_counts[i]))
+        return names
+
+    def _relation(self, i):
+        """Pick a dependency for source i as (source, use virtual package, alternative source)"""
+        rnd = self._rnd
+        args = self._args
+        dep_src = self._pick_lower(i)
+        virtual = dep_src in self._virtuals and rnd.random() < args.provides
+        alt_src = self._pick_lower(i) if rnd.random() < args.alternatives else None
+        return dep_src, virtual, alt_src
+
+    def _render_relation(self, relation, sonames):
+        dep_src, virtual, alt_src = relation
+        if virtual:
+            dep = self._virtuals[dep_src]
+        else:
+            dep = self._binary_names(dep_src, sonames[dep_src])[0]
+        if alt_src is not None:
+            dep = '%s | %s' % (dep, self._binary_names(alt_src, sonames[alt_src])[0])
+        return dep
+
+    def _generate(self):
+        rnd = self._rnd
+        args = self._args
+        sources = args.sources
+        new_sources = int(sources * args.new_sources)
+        self._libraries = max(1, sources * 3 // 10)
+        self._binary_counts = [max(1, int(rnd.expovariate(1 / args.binaries_per_source) + 0.5))
+                               for _ in range(sources)]
+        # New sources (only in unstable) have a single binary
+        self._binary_counts.extend(1 for _ in range(new_sources))
+        self._virtuals = {i: 'virtual%d' % (i % 50) for i in range(sources) if rnd.random() < args.provides}
+        transitions = set(rnd.sample(range(self._libraries), min(args.transitions, self._libraries)))
+        testing_sonames = [1] * (sources + new_sources)
+        unstable_sonames = [2 if i in transitions else 1 for i in range(sources + new_sources)]
+        updated = {i for i in range(sources) if i in transitions or rnd.random() < args.updates}
+
+        testing = self.suites['testing']
+        unstable = self.suites['unstable']
+        for i in range(sources + new_sources):
+            name = 'src%d' % i
+            upper = min(i, sources)
+            relations = [self._relation(upper) for _ in range(rnd.randint(0, 4) if upper else 0)]
+            conflicts = []
+            if i and rnd.random() < args.conflicts:
+                conflicts.append('src%d' % rnd.randrange(self._libraries, sources))
+            if i >= sources:
+                depends = [self._render_relation(r, unstable_sonames) for r in relations]
+                unstable[name] = self._source(i, '1.0-1', 1, depends, conflicts)
+                continue
+            depends = [self._render_relation(r, testing_sonames) for r in relations]
+            testing[name] = self._source(i, '1.0-1', testing_sonames[i], depends, conflicts)
+            if i in updated:
+                # The new version (e.g. a rebuild for a transition) picks up the new SONAMEs
+                depends = [self._render_relation(r, unstable_sonames) for r in relations]
+                unstable[name] = self._source(i, '1.0-2', unstable_sonames[i], depends, conflicts)
+            else:
+                unstable[name] = testing[name]
+
+    def _source(self, i, version, soname, depends, conflicts):
+        rnd = self._rnd
+        args = self._args
+        section = 'libs' if i < self._libraries else 'utils'
+        binaries = []
+        for name in self._binary_names(i, soname):
+            fields = {
+                'Package': name,
+                'Source': 'src%d' % i,
+                'Version': version,
+                'Architecture': 'all' if rnd.random() < args.arch_all else 'any',
+                'Section': section,
+                'Priority': 'optional',
+                'Maintainer': 'Jane Doe <jane@example.org>',
+                'Description': 'synthetic package',
+            }
+            if i < 3:
+                fields['Essential'] = 'yes'
+            if depends:
+                fields['Depends'] = ', '.join(sorted(set(depends)))
+            if conflicts:
+                fields['Conflicts'] = ', '.join(conflicts)
+            if name == self._binary_names(i, soname)[0] and i in self._virtuals:
+                fields['Provides'] = self._virtuals[i]
+            binaries.append(fields)
+        return version, section, binaries
+
+    @property
+    def binary_count(self):
+        return sum(len(binaries) for suite in self.suites.values() for _, _, binaries in suite.values())
+
+    def write(self, path, architectures):
+        for suite, sources in self.suites.items():
+            suite_dir = os.path.join(path, 'data', suite)
+            os.makedirs(suite_dir)
+            for filename in ('Dates', 'Blocks', 'Urgency', 'BugsV'):
+                open(os.path.join(suite_dir, filename), 'w').close()
+            with open(os.path.join(suite_dir, 'Sources'), 'w') as fd:
+                for source, (version, section, _) in sources.items():
+                    fd.write('Package: %s\nVersion: %s\nSection: %s\nMaintainer: Jane Doe <jane@example.org>\n\n'
+                             % (source, version, section))
+            for arch in architectures:
+                with open(os.path.join(suite_dir, 'Packages_' + arch), 'w') as fd:
+                    for _, _, binaries in sources.values():
+                        for fields in binaries:
+                            if fields['Architecture'] == 'any':
+                                fields = dict(fields, Architecture=arch)
+                            fd.write(''.join('%s: %s\n' % item for item in fields.items()))
+                            fd.write('\n')
+        os.makedirs(os.path.join(path, 'data', 'hints'))
+        for hinter in ('freeze', 'freeze-exception', 'satbritney', 'auto-removals'):
+            open(os.path.join(path, 'data', 'hints', hinter), 'w').close()
+        os.makedirs(os.path.join(path, 'data', 'testing', 'state'))
+        os.makedirs(os.path.join(path, 'output'))
+        with open(os.path.join(path, 'britney.conf'), 'w') as fd:
+            fd.write(BRITNEY_CONF.format(architectures=' '.join(architectures)))
+
+
+class PhaseTimer(object):
+
+    def __init__(self):
+        self.phases = {}
+        self._originals = []
+
+    def _wrap(self, phase, func):
+        @functools.wraps(func)
+        def _timed(*args, **kwargs):
+            start_wall = time.perf_counter()
+            start_cpu = time.process_time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                stats = self.phases.setdefault(phase, {'calls': 0, 'wall': 0.0, 'cpu': 0.0})
+                stats['calls'] += 1
+                stats['wall'] += time.perf_counter() - start_wall
+                stats['cpu'] += time.process_time() - start_cpu
+        return _timed
+
+    def install(self, phases):
+        for owner, name, phase in phases:
+            func = getattr(owner, name)
+            self._originals.append((owner, name, func))
+            setattr(owner, name, self._wrap(phase, func))
+
+    def uninstall(self):
+        for owner, name, func in reversed(self._originals):
+            setattr(owner, name, func)
+        self._originals = []
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=PROJECT_DIR, universal_newlines=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_britney(path, verbose):
+    timer = PhaseTimer()
+    timer.install(PHASES)
+    old_cwd = os.getcwd()
+    old_argv = sys.argv
+    try:
+        os.chdir(path)
+        sys.argv = ['britney.py', '-c', os.path.join(path, 'britney.conf')]
+        with contextlib.ExitStack() as stack:
+            if not verbose:
+                # Britney logs to stdout
+                stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, 'w'))))
+            start = time.perf_counter()
+            britney.Britney().main()
+            total = time.perf_counter() - start
+    finally:
+        sys.argv = old_argv
+        os.chdir(old_cwd)
+        timer.uninstall()
+    return timer.phases, total
+
+
+def compare(results, old_results):
+    print("%-28s %10s %10s %8s" % ('phase', 'old (s)', 'new (s)', 'change'))
+    rows = [(phase, old_results['phases'].get(phase, {}).get('wall'), stats['wall'])
+            for phase, stats in results['phases'].items()]
+    rows.append(('total', old_results.get('total'), results['total']))
+    for phase, old, new in rows:
+        if old is None:
+            print("%-28s %10s %10.3f" % (phase, '-', new))
+        else:
+            change = (new - old) / old * 100 if old else 0.0
+            print("%-28s %10.3f %10.3f %+7.1f%%" % (phase, old, new, change))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sources', type=int, default=2000, help='Number of source packages in testing')
+    parser.add_argument('--binaries-per-source', type=float, default=2.0,
+                        help='Average number of binary packages per source package')
+    parser.add_argument('--architectures', default='amd64 arm64 i386', help='Architectures (space separated)')
+    parser.add_argument('--arch-all', type=float, default=0.2, help='Fraction of arch:all binary packages')
+    parser.add_argument('--provides', type=float, default=0.05,
+                        help='Fraction of sources providing a virtual package (and of dependencies using one)')
+    parser.add_argument('--alternatives', type=float, default=0.1,
+                        help='Fraction of dependencies with an alternative')
+    parser.add_argument('--conflicts', type=float, default=0.02, help='Fraction of sources with a conflict')
+    parser.add_argument('--updates', type=float, default=0.2,
+                        help='Fraction of sources with a new version in unstable')
+    parser.add_argument('--new-sources', type=float, default=0.02,
+                        help='Number of sources only in unstable (relative to --sources)')
+    parser.add_argument('--transitions', type=int, default=10, help='Number of library SONAME transitions')
+    parser.add_argument('--seed', type=int, default=1, help='Seed for the random generator')
+    parser.add_argument('--verbose', action='store_true', help='Show the log of britney')
+    parser.add_argument('--keep', help='Generate the archive in this (new) directory and keep it')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    parser.add_argument('--compare', help='Compare the results with a JSON file written by --output')
+    args = parser.parse_args()
+
+    architectures = args.architectures.split()
+    archive = SyntheticArchive(args)
+    path = args.keep or tempfile.mkdtemp(prefix='bench-britney.')
+    try:
+        archive.write(path, architectures)
+        phases, total = run_britney(path, args.verbose)
+    finally:
+        if not args.keep:
+            shutil.rmtree(path)
+
+    results = {
+        'format': RESULT_FORMAT,
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'parameters': {k: v for k, v in vars(args).items() if k not in ('verbose', 'keep', 'output', 'compare')},
+        'archive': {
+            'sources': {suite: len(sources) for suite, sources in archive.suites.items()},
+            'binaries': archive.binary_count,
+        },
+        'phases': phases,
+        'total': total,
+    }
+
+    if args.output:
+        with open(args.output, 'w') as fd:
+            json.dump(results, fd, indent=2, sort_keys=True)
+            fd.write('\n')
+
+    if args.compare:
+        with open(args.compare) as fd:
+            old_results = json.load(fd)
+        if old_results.get('parameters') != results['parameters']:
+            print("Warning: %s was generated with different parameters" % args.compare)
+        compare(results, old_results)
+    else:
+        print("%-28s %6s %10s %10s" % ('phase', 'calls', 'wall (s)', 'cpu (s)'))
+        for phase, stats in phases.items():
+            print("%-28s %6d %10.3f %10.3f" % (phase, stats['calls'], stats['wall'], stats['cpu']))
+        print("%-28s %6s %10.3f" % ('total', '', total))
+
+
+if __name__ == '__main__':
+    main()
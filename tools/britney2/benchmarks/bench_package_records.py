@@ -0,0 +1,134 @@
+#!/usr/bin/python3
+"""Measure the memory used by the binary package records
+
+Loads synthetic testing and unstable Packages files for a number of
+architectures (see --help) once the way the suite loader does it and
+once with a record per package that shares nothing (i.e. the relations
+kept as separate strings and lists for every suite and architecture).
+It reports the memory retained by each and the difference per package.
+"""
+
+import argparse
+import gc
+import os
+import random
+import sys
+import tempfile
+import tracemalloc
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import apt_pkg  # noqa: E402
+
+from britney2 import BinaryPackage, BinaryPackageId, SourcePackage  # noqa: E402
+from britney2.inputs.suiteloader import DebMirrorLikeSuiteContentLoader, iter_packages_file  # noqa: E402
+
+
+def write_packages_file(filename, arch, packages, updated, seed):
+    """Write a Packages file; the same seed gives the same relations on all architectures"""
+    rnd = random.Random(seed)
+    with open(filename, 'w', encoding='utf-8') as fd:
+        for i in range(packages):
+            arch_all = rnd.random() < 0.2
+            revision = 2 if i in updated else 1
+            fd.write('Package: pkg%d\nSource: src%d\nVersion: 1.%d-%d\n' % (i, i // 2, i, revision))
+            fd.write('Architecture: %s\nSection: utils\n' % ('all' if arch_all else arch))
+            if rnd.random() < 0.1:
+                fd.write('Multi-Arch: same\n')
+            depends = ', '.join('pkg%d (>= 1.0)' % rnd.randrange(packages) for _ in range(rnd.randint(0, 6)))
+            if depends:
+                fd.write('Depends: libc6 (>= 2.36), %s\n' % depends)
+            if rnd.random() < 0.1:
+                fd.write('Breaks: pkg%d (<< 1.0)\n' % rnd.randrange(packages))
+            if rnd.random() < 0.1:
+                fd.write('Provides: virtual%d (= 1.0), virtual%d\n' % (rnd.randrange(100), rnd.randrange(100)))
+            if rnd.random() < 0.02:
+                fd.write('Built-Using: src%d (= 1.0-1)\n' % rnd.randrange(packages // 2))
+            fd.write('Description: synthetic package\n\n')
+
+
+def new_sources(packages):
+    return {'src%d' % i: SourcePackage('src%d' % i, '1.0-1', 'utils', set(), None, False, None, None, (), ())
+            for i in range(packages // 2 + 1)}
+
+
+def load_with_loader(files, architectures, packages):
+    loader = DebMirrorLikeSuiteContentLoader(types.SimpleNamespace(architectures=architectures,
+                                                                   nobreakall_arches=None,
+                                                                   outofsync_arches=None,
+                                                                   break_arches=None,
+                                                                   new_arches=None))
+    suites = {}
+    for suite, arch_files in files.items():
+        srcdist = new_sources(packages)
+        suites[suite] = {arch: loader._add_packages(iter_packages_file(filename, arch), arch, srcdist, {})
+                         for arch, filename in arch_files.items()}
+    return suites, loader
+
+
+def load_unshared(files, architectures, packages, intern=sys.intern):
+    suites = {}
+    for suite, arch_files in files.items():
+        srcdist = new_sources(packages)
+        suites[suite] = binaries = {}
+        for arch, filename in arch_files.items():
+            binaries[arch] = table = {}
+            for (pkg, version, section, source, source_version, raw_arch, multi_arch, deps, conflicts, provides, ess,
+                 builtusing) in iter_packages_file(filename, arch):
+                pkg_id = BinaryPackageId(intern(pkg), intern(version), arch)
+                srcdist[source].binaries.add(pkg_id)
+                table[pkg_id.package_name] = BinaryPackage(pkg_id.version, intern(section), intern(source),
+                                                           intern(source_version), intern(raw_arch), multi_arch, deps,
+                                                           conflicts, provides, ess, pkg_id, builtusing)
+    return suites, srcdist
+
+
+def measure(func, *args):
+    gc.collect()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    result = func(*args)
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    entries = sum(len(table) for binaries in result[0].values() for table in binaries.values())
+    del result
+    return retained, entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--packages', type=int, default=20000, help='Number of packages per architecture')
+    parser.add_argument('--architectures', default='amd64 arm64 armhf i386 ppc64el s390x',
+                        help='Architectures (space separated)')
+    parser.add_argument('--updates', type=float, default=0.1,
+                        help='Fraction of packages with a different version in unstable')
+    parser.add_argument('--seed', type=int, default=1, help='Seed for the random generator')
+    args = parser.parse_args()
+
+    apt_pkg.init()
+    architectures = args.architectures.split()
+    rnd = random.Random(args.seed)
+    updated = {i for i in range(args.packages) if rnd.random() < args.updates}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        files = {}
+        for suite in ('testing', 'unstable'):
+            files[suite] = {}
+            for arch in architectures:
+                filename = os.path.join(tmpdir, 'Packages_%s_%s' % (suite, arch))
+                write_packages_file(filename, arch, args.packages, updated if suite == 'unstable' else (), args.seed)
+                files[suite][arch] = filename
+
+        unshared, entries = measure(load_unshared, files, architectures, args.packages)
+        loader, _ = measure(load_with_loader, files, architectures, args.packages)
+
+    print("%d binary packages in %d suites on %d architectures" % (entries, 2, len(architectures)))
+    print("%-24s %10s %12s" % ('layout', 'MiB', 'bytes/pkg'))
+    for label, retained in (('unshared records', unshared), ('suite loader', loader)):
+        print("%-24s %10.1f %12.1f" % (label, retained / (1024 * 1024), retained / entries))
+    print("%-24s %10.1f %12.1f" % ('saved', (unshared - loader) / (1024 * 1024), (unshared - loader) / entries))
+
+
+if __name__ == '__main__':
+    main()
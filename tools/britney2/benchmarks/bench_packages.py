@@ -0,0 +1,142 @@
+#!/usr/bin/python3
+"""Compare ways of reading Packages files
+
+Reads a Packages file (or a synthetic one, see --help) and reports the
+time needed for tokenising it with apt_pkg.TagFile and with a bulk
+mmap + regular expression scanner, as well as the time needed for
+iter_packages_file with and without the cyclic garbage collector.
+"""
+
+import argparse
+import gc
+import mmap
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import apt_pkg  # noqa: E402
+
+from britney2.inputs.suiteloader import iter_packages_file  # noqa: E402
+
+
+FIELDS = ['Package', 'Version', 'Section', 'Source', 'Architecture', 'Multi-Arch', 'Pre-Depends', 'Depends',
+          'Conflicts', 'Breaks', 'Provides', 'Essential', 'Built-Using']
+
+
+def generate_packages_file(fd, packages, seed):
+    """Write a Packages file with fields and sizes resembling those of the archive"""
+    rnd = random.Random(seed)
+    for i in range(packages):
+        fd.write('Package: pkg%d\n' % i)
+        if rnd.random() < 0.3:
+            fd.write('Source: src%d (%d.0-1)\n' % (i // 3, i % 7))
+        fd.write('Version: 1.%d-1\nInstalled-Size: 123\n' % i)
+        fd.write('Maintainer: Jane Doe <jane@example.org>\nArchitecture: amd64\n')
+        if rnd.random() < 0.1:
+            fd.write('Multi-Arch: same\n')
+        depends = ', '.join('pkg%d (>= 1.0)' % rnd.randrange(packages) for _ in range(rnd.randint(0, 6)))
+        if depends:
+            fd.write('Depends: %s\n' % depends)
+        if rnd.random() < 0.1:
+            fd.write('Pre-Depends: libc6 (>= 2.30)\n')
+        if rnd.random() < 0.1:
+            fd.write('Breaks: pkg%d (<< 1.0)\n' % rnd.randrange(packages))
+        if rnd.random() < 0.1:
+            fd.write('Provides: virt%d (= 1.0), virt%d\n' % (rnd.randrange(100), rnd.randrange(100)))
+        fd.write('Description: synthetic package\n This is the long description\n of package number %d.\n' % i)
+        fd.write(' .\n It has a second paragraph.\n')
+        fd.write('Filename: pool/main/p/pkg%d/pkg%d_1.%d-1_amd64.deb\nSize: 12345\n' % (i, i, i))
+        fd.write('MD5sum: %032x\nSHA256: %064x\nSection: utils\nPriority: optional\n\n' % (i, i))
+
+
+def tokenise_tagfile(filename):
+    tag_file = apt_pkg.TagFile(filename)
+    get_field = tag_file.section.get
+    step = tag_file.step
+    stanzas = 0
+    while step():
+        for field in FIELDS:
+            get_field(field)
+        stanzas += 1
+    return stanzas
+
+
+def tokenise_mmap_re(filename):
+    names = '|'.join(re.escape(x) for x in FIELDS).encode('ascii')
+    # A field of interest (with its continuation lines) or the end of a stanza
+    scanner = re.compile(rb'\n(?:(' + names + rb'):[ \t]*([^\n]*(?:\n[ \t][^\n]*)*)|(?=\n))')
+    first_field = re.compile(rb'(' + names + rb'):[ \t]*([^\n]*(?:\n[ \t][^\n]*)*)')
+    stanzas = 0
+    with open(filename, 'rb') as fd, mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        fields = {}
+        m = first_field.match(buf)
+        if m:
+            fields[m.group(1).decode('ascii')] = m.group(2).decode('utf-8').rstrip()
+        for name, value in scanner.findall(buf):
+            if name:
+                fields[name.decode('ascii')] = value.decode('utf-8').rstrip()
+            elif fields:
+                stanzas += 1
+                fields = {}
+        if fields:
+            stanzas += 1
+    return stanzas
+
+
+def read_rows(filename):
+    return len(list(iter_packages_file(filename, 'amd64')))
+
+
+def read_rows_without_gc(filename):
+    gc.disable()
+    try:
+        return len(list(iter_packages_file(filename, 'amd64')))
+    finally:
+        gc.enable()
+
+
+def measure(func, filename, repeat):
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = func(filename)
+        duration = time.perf_counter() - start
+        if best is None or duration < best:
+            best = duration
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--packages-file', help='Packages file to read (default: generate a synthetic one)')
+    parser.add_argument('--packages', type=int, default=60000, help='Number of packages in the synthetic file')
+    parser.add_argument('--seed', type=int, default=1, help='Seed for the random generator')
+    parser.add_argument('--repeat', type=int, default=3, help='Use the best of this many runs')
+    args = parser.parse_args()
+
+    apt_pkg.init()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = args.packages_file
+        if filename is None:
+            filename = os.path.join(tmpdir, 'Packages')
+            with open(filename, 'w', encoding='utf-8') as fd:
+                generate_packages_file(fd, args.packages, args.seed)
+        print("Reading %s (%.1f MB)" % (filename, os.path.getsize(filename) / (1024 * 1024)))
+
+        for label, func in (('tokenise (apt_pkg.TagFile)', tokenise_tagfile),
+                            ('tokenise (mmap + re)', tokenise_mmap_re),
+                            ('iter_packages_file', read_rows),
+                            ('iter_packages_file (gc paused)', read_rows_without_gc),
+                            ):
+            stanzas, duration = measure(func, filename, args.repeat)
+            print("%-32s %8d stanzas %8.3fs" % (label, stanzas, duration))
+
+
+if __name__ == '__main__':
+    main()
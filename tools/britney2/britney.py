@@ -198,8 +198,10 @@ from britney2.hints import HintParser
 from britney2.inputs.suiteloader import DebMirrorLikeSuiteContentLoader, MissingRequiredConfigurationError
 from britney2.installability.builder import build_installability_tester
 from britney2.installability.solver import InstallabilitySolver
+from britney2.installability.warmstart import WarmStartCache
 from britney2.migration import MigrationManager
 from britney2.migrationitem import MigrationItemFactory
+from britney2.profiler import PhaseProfiler
 from britney2.policies.policy import (AgePolicy,
                                       RCBugPolicy,
                                       PiupartsPolicy,
@@ -219,7 +221,8 @@ from britney2.utils import (log_and_format_old_libraries,
                             write_excuses, write_heidi_delta,
                             old_libraries, is_nuninst_asgood_generous,
                             clone_nuninst, compile_nuninst, parse_provides,
-                            MigrationConstraintException,
+                            MigrationConstraintException, ForkedProcessPool,
+                            DependencySolverCache,
                             )
 
 __author__ = 'Fabio Tranchitella and the Debian Release Team'
@@ -345,9 +348,16 @@ class Britney(object):
             }
 
         self.logger.info("Compiling Installability tester")
-        self.pkg_universe, self._inst_tester = build_installability_tester(self.suite_info, self.options.architectures)
+        self.dependency_solvers = DependencySolverCache()
+        with self._profiler.phase('build_installability_tester'):
+            self.pkg_universe, self._inst_tester = build_installability_tester(
+                self.suite_info, self.options.architectures,
+                dependency_solvers=self.dependency_solvers)
         target_suite = self.suite_info.target_suite
         target_suite.inst_tester = self._inst_tester
+        target_suite.dependency_solvers = self.dependency_solvers
+        if self.options.trial_overlay:
+            target_suite.use_layers()
 
         self.allow_uninst = {}
         for arch in self.options.architectures:
@@ -359,11 +369,32 @@ class Britney(object):
                                                    self.hints)
 
         if not self.options.nuninst_cache:
-            self.logger.info("Building the list of non-installable packages for the full archive")
-            self._inst_tester.compute_installability()
-            nuninst = compile_nuninst(target_suite,
-                                      self.options.architectures,
-                                      self.options.nobreakall_arches)
+            nuninst = None
+            warm_start_cache = None
+            if hasattr(self.options, 'warm_start_cache'):
+                self.logger.info("Loading installability results from %s", self.options.warm_start_cache)
+                pkg_ids = (pkg.pkg_id for arch in self.options.architectures
+                           for pkg in target_suite.binaries[arch].values())
+                warm_start_cache = WarmStartCache(self.options.warm_start_cache, self.pkg_universe,
+                                                  self._inst_tester, pkg_ids, self.options.architectures,
+                                                  self.options.nobreakall_arches)
+                nuninst = warm_start_cache.load()
+                for stat in warm_start_cache.stats():
+                    self.logger.info(">  %s", stat)
+            if nuninst is None:
+                self.logger.info("Building the list of non-installable packages for the full archive")
+                with self._profiler.phase('compute_nuninst'):
+                    if self.options.installability_processes <= 1:
+                        self._inst_tester.compute_installability()
+                    # With several processes, compile_nuninst computes the installability per architecture
+                    nuninst = compile_nuninst(target_suite,
+                                              self.options.architectures,
+                                              self.options.nobreakall_arches,
+                                              processes=self.options.installability_processes)
+                if warm_start_cache is not None:
+                    warm_start_cache.save(nuninst)
+            else:
+                self.logger.info("The target suite is unchanged; reusing the non-installable packages of the last run")
             self.nuninst_orig = nuninst
             for arch in self.options.architectures:
                 self.logger.info("> Found %d non-installable packages", len(nuninst[arch]))
@@ -399,7 +430,8 @@ class Britney(object):
         except AttributeError:
             self.read_hints(os.path.join(self.suite_info['unstable'].path, 'Hints'))
 
-        self._policy_engine.initialise(self, self.hints)
+        with self._profiler.phase('initialise_policies'):
+            self._policy_engine.initialise(self, self.hints)
 
     def __parse_arguments(self):
         """Parse the command line arguments
@@ -479,10 +511,29 @@ class Britney(object):
             self.logger.error("Britney will read the value from the Release file automatically")
             sys.exit(1)
 
+        if not hasattr(self.options, 'phase_profile_interval'):
+            self.options.phase_profile_interval = 10
+        else:
+            self.options.phase_profile_interval = int(self.options.phase_profile_interval)
+
+        if not hasattr(self.options, 'phase_profile_stacks_format'):
+            self.options.phase_profile_stacks_format = 'collapsed'
+        elif self.options.phase_profile_stacks_format not in ('collapsed', 'speedscope'):  # pragma: no cover
+            self.logger.error("PHASE_PROFILE_STACKS_FORMAT must be either \"collapsed\" or \"speedscope\"")
+            sys.exit(1)
+
+        sample_interval = None
+        if hasattr(self.options, 'phase_profile_stacks'):
+            sample_interval = self.options.phase_profile_interval / 1000
+        self._profiler = PhaseProfiler(enabled=hasattr(self.options, 'phase_profile_output'),
+                                       sample_interval=sample_interval)
+        self._profiler.start()
+
         suite_loader = DebMirrorLikeSuiteContentLoader(self.options)
 
         try:
-            self.suite_info = suite_loader.load_suites()
+            with self._profiler.phase('load_suites'):
+                self.suite_info = suite_loader.load_suites()
         except MissingRequiredConfigurationError as e:   # pragma: no cover
             self.logger.error("Could not load the suite content due to missing configuration: %s", str(e))
             sys.exit(1)
@@ -522,6 +573,27 @@ class Britney(object):
         if not hasattr(self.options, 'build_url'):
             self.options.build_url = ''
 
+        if not hasattr(self.options, 'trial_overlay') or \
+                self.options.trial_overlay not in ('yes', '1'):
+            self.options.trial_overlay = False
+        else:
+            self.options.trial_overlay = True
+
+        if not hasattr(self.options, 'speculative_trials'):
+            self.options.speculative_trials = 1
+        else:
+            self.options.speculative_trials = int(self.options.speculative_trials)
+
+        if not hasattr(self.options, 'installability_processes'):
+            self.options.installability_processes = 1
+        else:
+            self.options.installability_processes = int(self.options.installability_processes)
+
+        if not hasattr(self.options, 'excuse_processes'):
+            self.options.excuse_processes = 1
+        else:
+            self.options.excuse_processes = int(self.options.excuse_processes)
+
         self._policy_engine.load_policies(self.options, self.suite_info, MIGRATION_POLICIES)
 
     @property
@@ -792,10 +864,12 @@ class Britney(object):
 
         mi_factory = self._migration_item_factory
         excusefinder = ExcuseFinder(self.options, self.suite_info, self.all_binaries,
-                                    self.pkg_universe, self._policy_engine, mi_factory, self.hints)
+                                    self.pkg_universe, self._policy_engine, mi_factory, self.hints,
+                                    processes=self.options.excuse_processes)
 
         excuses, upgrade_me = excusefinder.find_actionable_excuses()
         self.excuses = excuses
+        self._policy_engine.excuses_computed()
 
         # sort the list of candidates
         self.upgrade_me = sorted(upgrade_me)
@@ -813,6 +887,13 @@ class Britney(object):
                 self.logger.info("> Writing YAML Excuses to %s", self.options.excuses_yaml_output)
                 write_excuses(excuses, self.options.excuses_yaml_output,
                               output_format="yaml")
+            if hasattr(self.options, 'excuses_jsonl_output'):
+                self.logger.info("> Writing JSON Lines Excuses to %s", self.options.excuses_jsonl_output)
+                write_excuses(excuses, self.options.excuses_jsonl_output,
+                              output_format="jsonl")
+            if hasattr(self.options, 'policy_stats_output'):
+                self.logger.info("> Writing policy stats to %s", self.options.policy_stats_output)
+                self._policy_engine.stats.write(self.options.policy_stats_output)
 
         self.logger.info("Update Excuses generation completed")
 
@@ -850,6 +931,51 @@ class Britney(object):
             res.append("%s-%d" % (arch[0], n))
         return "%d+%d: %s" % (total, totalbreak, ":".join(res))
 
+    def _new_speculation_pool(self, items, nuninst_last_accepted):
+        """Create a pool of worker processes trying migration components speculatively
+
+        Each component is tried on its own against the target suite as it is
+        when the pool is first used (i.e. as if it was the next component on
+        the worklist) and rolled back again.  Nothing is changed in this
+        process, but the pool must be closed once a component is accepted.
+
+        The components are passed to the workers as the indexes of their items
+        in "items".  For each component, the workers return None if it was
+        accepted (it must then be migrated for real by the caller) and
+        otherwise the list of lines to log about why it was skipped.
+
+        :param items: list of all MigrationItems that may be part of a component
+        :param nuninst_last_accepted: the uninstallability counters of the current target suite
+        """
+        def try_comp(indexes):
+            return self._try_in_worker([items[idx] for idx in indexes], nuninst_last_accepted)
+        return ForkedProcessPool(try_comp, self.options.speculative_trials)
+
+    def _try_in_worker(self, comp, nuninst_last_accepted):
+        mm = self._migration_manager
+        target_suite = self.suite_info.target_suite
+        with mm.start_transaction() as transaction:
+            try:
+                accepted, nuninst_after, failed_arch, _ = mm.migrate_items_to_target_suite(
+                    comp,
+                    nuninst_last_accepted
+                )
+            except MigrationConstraintException as e:
+                transaction.rollback()
+                return ["    got exception: %s" % (repr(e))]
+            transaction.rollback()
+        if self.options.check_consistency_level >= 3:
+            target_suite.check_suite_source_pkg_consistency('speculative trial after rollback')
+        if accepted:
+            return None
+        broken = sorted(b for b in nuninst_after[failed_arch]
+                        if b not in nuninst_last_accepted[failed_arch])
+        compare_nuninst = None
+        if any(item for item in comp if item.architecture != 'source'):
+            compare_nuninst = nuninst_last_accepted
+        return ["    got: %s" % self.eval_nuninst(nuninst_after, compare_nuninst),
+                "    * %s: %s" % (failed_arch, ", ".join(broken))]
+
     def iter_packages(self, packages, selected, nuninst=None):
         """Iter on the list of actions and apply them one-by-one
 
@@ -886,6 +1012,10 @@ class Britney(object):
             nuninst_orig = self.nuninst_orig
 
         nuninst_last_accepted = nuninst_orig
+        speculative_trials = self.options.speculative_trials
+        speculated = {}
+        speculation_pool = None
+        speculation_items = None
 
         output_logger.info("recur: [] %s %d/0", ",".join(x.uvname for x in selected), len(packages))
         while rescheduled_packages:
@@ -899,84 +1029,127 @@ class Britney(object):
                 comp = worklist.pop()
                 comp_name = ' '.join(item.uvname for item in comp)
                 output_logger.info("trying: %s" % comp_name)
-                with mm.start_transaction() as transaction:
+                rejected_by_worker = None
+                if speculative_trials > 1:
+                    key = tuple(comp)
+                    if key not in speculated:
+                        # Try this component and the next ones on the worklist in parallel
+                        batch = [comp]
+                        for other in reversed(worklist):
+                            if len(batch) >= speculative_trials:
+                                break
+                            if tuple(other) not in speculated and other not in batch:
+                                batch.append(other)
+                        # A single component is simply tried here
+                        if len(batch) > 1:
+                            if speculation_pool is None:
+                                items = list(group_info)
+                                speculation_items = {item: idx for idx, item in enumerate(items)}
+                                speculation_pool = self._new_speculation_pool(items, nuninst_last_accepted)
+                            outcomes = speculation_pool.map([[speculation_items[x] for x in other] for other in batch])
+                            speculated.update(zip((tuple(x) for x in batch), outcomes))
+                    rejected_by_worker = speculated.get(key)
+
+                if rejected_by_worker is not None:
+                    # Nothing has been accepted since the worker tried this component, so
+                    # the component would be rejected here in exactly the same way.
                     accepted = False
-                    try:
-                        accepted, nuninst_after, failed_arch, new_cruft = mm.migrate_items_to_target_suite(
-                            comp,
-                            nuninst_last_accepted
-                        )
-                        if accepted:
-                            selected.extend(comp)
-                            transaction.commit()
-                            output_logger.info("accepted: %s", comp_name)
-                            output_logger.info("   ori: %s", self.eval_nuninst(nuninst_orig))
-                            output_logger.info("   pre: %s", self.eval_nuninst(nuninst_last_accepted))
-                            output_logger.info("   now: %s", self.eval_nuninst(nuninst_after))
-                            if new_cruft:
-                                output_logger.info(
-                                    "   added new cruft items to list: %s",
-                                    " ".join(x.uvname for x in sorted(new_cruft)))
-
-                            if len(selected) <= 20:
-                                output_logger.info("   all: %s", " ".join(x.uvname for x in selected))
-                            else:
-                                output_logger.info("  most: (%d) .. %s",
-                                                   len(selected),
-                                                   " ".join(x.uvname for x in selected[-20:]))
-                            if self.options.check_consistency_level >= 3:
-                                target_suite.check_suite_source_pkg_consistency('iter_packages after commit')
-                            nuninst_last_accepted = nuninst_after
-                            for cruft_item in new_cruft:
-                                try:
-                                    _, updates, rms, _ = mm.compute_groups(cruft_item)
-                                    result = (cruft_item, sorted(updates), sorted(rms))
-                                    group_info[cruft_item] = result
-                                    worklist.append([cruft_item])
-                                except MigrationConstraintException as e:
+                    output_logger.info("skipped: %s (%d, %d, %d)",
+                                       comp_name,
+                                       len(rescheduled_packages),
+                                       len(maybe_rescheduled_packages),
+                                       len(worklist)
+                                       )
+                    for line in rejected_by_worker:
+                        output_logger.info("%s", line)
+                else:
+                    with mm.start_transaction() as transaction:
+                        accepted = False
+                        try:
+                            accepted, nuninst_after, failed_arch, new_cruft = mm.migrate_items_to_target_suite(
+                                comp,
+                                nuninst_last_accepted
+                            )
+                            if accepted:
+                                selected.extend(comp)
+                                transaction.commit()
+                                output_logger.info("accepted: %s", comp_name)
+                                output_logger.info("   ori: %s", self.eval_nuninst(nuninst_orig))
+                                output_logger.info("   pre: %s", self.eval_nuninst(nuninst_last_accepted))
+                                output_logger.info("   now: %s", self.eval_nuninst(nuninst_after))
+                                if new_cruft:
                                     output_logger.info(
-                                        "    got exception adding cruft item %s to list: %s" %
-                                        (cruft_item.uvname, repr(e)))
-                            rescheduled_packages.extend(maybe_rescheduled_packages)
-                            maybe_rescheduled_packages.clear()
-                        else:
+                                        "   added new cruft items to list: %s",
+                                        " ".join(x.uvname for x in sorted(new_cruft)))
+
+                                if len(selected) <= 20:
+                                    output_logger.info("   all: %s", " ".join(x.uvname for x in selected))
+                                else:
+                                    output_logger.info("  most: (%d) .. %s",
+                                                       len(selected),
+                                                       " ".join(x.uvname for x in selected[-20:]))
+                                if self.options.check_consistency_level >= 3:
+                                    target_suite.check_suite_source_pkg_consistency('iter_packages after commit')
+                                nuninst_last_accepted = nuninst_after
+                                # Any speculative results (and the state of the workers)
+                                # are based on the old state
+                                speculated.clear()
+                                if speculation_pool is not None:
+                                    speculation_pool.close()
+                                    speculation_pool = None
+                                for cruft_item in new_cruft:
+                                    try:
+                                        _, updates, rms, _ = mm.compute_groups(cruft_item)
+                                        result = (cruft_item, sorted(updates), sorted(rms))
+                                        group_info[cruft_item] = result
+                                        worklist.append([cruft_item])
+                                    except MigrationConstraintException as e:
+                                        output_logger.info(
+                                            "    got exception adding cruft item %s to list: %s" %
+                                            (cruft_item.uvname, repr(e)))
+                                rescheduled_packages.extend(maybe_rescheduled_packages)
+                                maybe_rescheduled_packages.clear()
+                            else:
+                                transaction.rollback()
+                                broken = sorted(b for b in nuninst_after[failed_arch]
+                                                if b not in nuninst_last_accepted[failed_arch])
+                                compare_nuninst = None
+                                if any(item for item in comp if item.architecture != 'source'):
+                                    compare_nuninst = nuninst_last_accepted
+                                # NB: try_migration already reverted this for us, so just print the results and move on
+                                output_logger.info("skipped: %s (%d, %d, %d)",
+                                                   comp_name,
+                                                   len(rescheduled_packages),
+                                                   len(maybe_rescheduled_packages),
+                                                   len(worklist)
+                                                   )
+                                output_logger.info("    got: %s", self.eval_nuninst(nuninst_after, compare_nuninst))
+                                output_logger.info("    * %s: %s", failed_arch, ", ".join(broken))
+                                if self.options.check_consistency_level >= 3:
+                                    target_suite.check_suite_source_pkg_consistency('iter_package after rollback (not accepted)')
+
+                        except MigrationConstraintException as e:
                             transaction.rollback()
-                            broken = sorted(b for b in nuninst_after[failed_arch]
-                                            if b not in nuninst_last_accepted[failed_arch])
-                            compare_nuninst = None
-                            if any(item for item in comp if item.architecture != 'source'):
-                                compare_nuninst = nuninst_last_accepted
-                            # NB: try_migration already reverted this for us, so just print the results and move on
                             output_logger.info("skipped: %s (%d, %d, %d)",
                                                comp_name,
                                                len(rescheduled_packages),
                                                len(maybe_rescheduled_packages),
                                                len(worklist)
                                                )
-                            output_logger.info("    got: %s", self.eval_nuninst(nuninst_after, compare_nuninst))
-                            output_logger.info("    * %s: %s", failed_arch, ", ".join(broken))
+                            output_logger.info("    got exception: %s" % (repr(e)))
                             if self.options.check_consistency_level >= 3:
-                                target_suite.check_suite_source_pkg_consistency('iter_package after rollback (not accepted)')
-
-                    except MigrationConstraintException as e:
-                        transaction.rollback()
-                        output_logger.info("skipped: %s (%d, %d, %d)",
-                                           comp_name,
-                                           len(rescheduled_packages),
-                                           len(maybe_rescheduled_packages),
-                                           len(worklist)
-                                           )
-                        output_logger.info("    got exception: %s" % (repr(e)))
-                        if self.options.check_consistency_level >= 3:
-                            target_suite.check_suite_source_pkg_consistency(
-                                'iter_package after rollback (MigrationConstraintException)')
-
-                    if not accepted:
-                        if len(comp) > 1:
-                            output_logger.info("    - splitting the component into single items and retrying them")
-                            worklist.extend([item] for item in comp)
-                        else:
-                            maybe_rescheduled_packages.append(comp[0])
+                                target_suite.check_suite_source_pkg_consistency(
+                                    'iter_package after rollback (MigrationConstraintException)')
+
+                if not accepted:
+                    if len(comp) > 1:
+                        output_logger.info("    - splitting the component into single items and retrying them")
+                        worklist.extend([item] for item in comp)
+                    else:
+                        maybe_rescheduled_packages.append(comp[0])
+
+        if speculation_pool is not None:
+            speculation_pool.close()
 
         output_logger.info(" finish: [%s]", ",".join(x.uvname for x in selected))
         output_logger.info("endloop: %s", self.eval_nuninst(self.nuninst_orig))
@@ -1447,58 +1620,76 @@ class Britney(object):
             # TODO migrated items should be removed from upgrade_me, so this
             # should not happen
             if not valid:
-                raise AssertionError("excuse no longer valid %s" % (item))
+                raise AssertionError("excuse no longer valid %s" % (excuse.name))
             return valid
 
         # consider only excuses which are valid candidates and still relevant.
         valid_excuses = frozenset(e.name for n, e in excuses.items()
                                   if e.item in upgrade_me
                                   and excuse_still_valid(e))
-        excuses_deps = {name: valid_excuses.intersection(excuse.get_deps())
-                        for name, excuse in excuses.items() if name in valid_excuses}
+
+        # Find the connected components of the dependency graph of the
+        # excuses with a union-find (by size and with path compression)
+        parent = {name: name for name in valid_excuses}
+        size = dict.fromkeys(valid_excuses, 1)
+
+        def find(name):
+            root = name
+            while parent[root] != root:
+                root = parent[root]
+            while parent[name] != root:
+                parent[name], name = root, parent[name]
+            return root
+
+        has_deps = set()
         excuses_rdeps = defaultdict(set)
-        for name, deps in excuses_deps.items():
-            for dep in deps:
+        for name in valid_excuses:
+            deps = excuses[name].get_deps()
+            if deps:
+                has_deps.add(name)
+            for dep in valid_excuses.intersection(deps):
                 excuses_rdeps[dep].add(name)
-
-        # loop on them
+                root, other = find(name), find(dep)
+                if root != other:
+                    if size[root] < size[other]:
+                        root, other = other, root
+                    parent[other] = root
+                    size[root] += size[other]
+
+        components = defaultdict(set)
+        for name in valid_excuses:
+            components[find(name)].add(excuses[name].item)
+        components = {root: frozenset(items) for root, items in components.items()}
+
+        # Beginning with each excuse that does not depend on any other
+        # excuse, the smallest hint is the excuse and the excuses that
+        # depend on it and the largest hint is its connected component.
         candidates = []
         mincands = []
         seen_hints = set()
         for e in valid_excuses:
-            excuse = excuses[e]
-            if not excuse.get_deps():
-                items = [excuse.item]
-                orig_size = 1
-                looped = False
-                seen_items = set()
-                seen_items.update(items)
-
-                for item in items:
-                    # excuses which depend on "item" or are depended on by it
-                    new_items = {excuses[x].item for x in chain(excuses_deps[item.name], excuses_rdeps[item.name])}
-                    new_items -= seen_items
-                    items.extend(new_items)
-                    seen_items.update(new_items)
-
-                    if not looped and len(items) > 1:
-                        orig_size = len(items)
-                        h = frozenset(seen_items)
-                        if h not in seen_hints:
-                            mincands.append(h)
-                            seen_hints.add(h)
-                    looped = True
-                if len(items) != orig_size:
-                    h = frozenset(seen_items)
-                    if h != mincands[-1] and h not in seen_hints:
-                        candidates.append(h)
-                        seen_hints.add(h)
+            if e in has_deps or not excuses_rdeps[e]:
+                continue
+            h = frozenset(excuses[x].item for x in chain((e,), excuses_rdeps[e]))
+            if h not in seen_hints:
+                mincands.append(h)
+                seen_hints.add(h)
+            component = components[find(e)]
+            if len(component) != len(h) and component not in seen_hints:
+                candidates.append(component)
+                seen_hints.add(component)
         return [candidates, mincands]
 
     def run_auto_hinter(self):
+        mm = self._migration_manager
+        tried = 0
+        groups_cache_hits = mm.groups_cache_hits
         for lst in self.get_auto_hinter_hints(self.upgrade_me):
             for hint in lst:
+                tried += 1
                 self.do_hint("easy", "autohinter", sorted(hint))
+        self.logger.info("> Auto hinter: tried %d hint(s), reused %d compute_groups result(s)",
+                         tried, mm.groups_cache_hits - groups_cache_hits)
 
     def nuninst_arch_report(self, nuninst, arch):
         """Print a report of uninstallable packages for one architecture."""
@@ -1526,7 +1717,8 @@ class Britney(object):
             return
         # if no actions are provided, build the excuses and sort them
         elif not self.options.actions:
-            self.write_excuses()
+            with self._profiler.phase('write_excuses'):
+                self.write_excuses()
         # otherwise, use the actions provided by the command line
         else:
             self.upgrade_me = self.options.actions.split()
@@ -1551,15 +1743,35 @@ class Britney(object):
                 self.hint_tester()
             # run the upgrade test
             else:
-                self.upgrade_testing()
+                with self._profiler.phase('upgrade_testing'):
+                    self.upgrade_testing()
 
             self.logger.info('> Stats from the installability tester')
             for stat in self._inst_tester.stats.stats():
                 self.logger.info('>   %s', stat)
+            self.logger.info('> Stats from the dependency solver cache')
+            for stat in self.dependency_solvers.stats.stats():
+                self.logger.info('>   %s', stat)
+            self.logger.info('> Stats from the policy engine')
+            for stat in self._policy_engine.stats.stats():
+                self.logger.info('>   %s', stat)
         else:
             self.logger.info('Migration computation skipped as requested.')
         if not self.options.dry_run:
-            self._policy_engine.save_state(self)
+            with self._profiler.phase('save_state'):
+                self._policy_engine.save_state(self)
+        self._profiler.stop()
+        if self._profiler.enabled:
+            self.logger.info('> Stats from the phase profiler')
+            for stat in self._profiler.stats():
+                self.logger.info('>   %s', stat)
+            if hasattr(self.options, 'phase_profile_output'):
+                self.logger.info("> Writing phase profile to %s", self.options.phase_profile_output)
+                self._profiler.write(self.options.phase_profile_output)
+            if hasattr(self.options, 'phase_profile_stacks'):
+                self.logger.info("> Writing sampled stacks to %s", self.options.phase_profile_stacks)
+                self._profiler.write_stacks(self.options.phase_profile_stacks,
+                                            self.options.phase_profile_stacks_format)
         logging.shutdown()
 
 
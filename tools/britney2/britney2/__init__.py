@@ -2,6 +2,8 @@ import logging
 from collections import namedtuple
 from enum import Enum, unique
 
+from britney2.transaction import LayeredDict
+
 
 class DependencyType(Enum):
     DEPENDS = ('Depends', 'depends', 'dependency')
@@ -122,9 +124,59 @@ class TargetSuite(Suite):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.inst_tester = None
+        self.dependency_solvers = None
+        # The binaries added or removed in each layer (see use_layers)
+        self._layers = None
         logger_name = ".".join((self.__class__.__module__, self.__class__.__name__))
         self._logger = logging.getLogger(logger_name)
 
+    @property
+    def uses_layers(self):
+        return self._layers is not None
+
+    def use_layers(self):
+        """Record changes to the suite in layers that can be discarded
+
+        After this call, the sources, the binaries and the provides table
+        (of each architecture) are LayeredDicts.  push_layer starts a new
+        layer of changes of the suite (and the installability tester),
+        which can later be thrown away by discard_layer or kept by
+        merge_layer.
+        """
+        self.sources = LayeredDict(self.sources)
+        self.binaries = {arch: LayeredDict(packages) for arch, packages in self.binaries.items()}
+        self.provides_table = {arch: LayeredDict(provides) for arch, provides in self.provides_table.items()}
+        self._layers = []
+
+    def _layered_dicts(self):
+        yield self.sources
+        yield from self.binaries.values()
+        yield from self.provides_table.values()
+
+    def push_layer(self):
+        for d in self._layered_dicts():
+            d.push_layer()
+        self.inst_tester.push_layer()
+        self._layers.append([])
+
+    def discard_layer(self):
+        for d in self._layered_dicts():
+            d.discard_layer()
+        self.inst_tester.discard_layer()
+        self._all_binaries_in_suite = None
+        changed = self._layers.pop()
+        if self.dependency_solvers is not None:
+            for pkg_id in changed:
+                self._invalidate_dependency_solvers(pkg_id)
+
+    def merge_layer(self):
+        for d in self._layered_dicts():
+            d.merge_layer()
+        self.inst_tester.merge_layer()
+        changed = self._layers.pop()
+        if self._layers:
+            self._layers[-1].extend(changed)
+
     def is_installable(self, pkg_id):
         """Determine whether the given package can be installed in the suite
 
@@ -147,6 +199,10 @@ class TargetSuite(Suite):
         # more sense to do that here instead
         self.inst_tester.add_binary(pkg_id)
         self._all_binaries_in_suite = None
+        if self._layers:
+            self._layers[-1].append(pkg_id)
+        if self.dependency_solvers is not None:
+            self._invalidate_dependency_solvers(pkg_id)
 
     def remove_binary(self, pkg_id):
         """Remove a binary from the suite
@@ -161,6 +217,21 @@ class TargetSuite(Suite):
         # more sense to do that here instead
         self.inst_tester.remove_binary(pkg_id)
         self._all_binaries_in_suite = None
+        if self._layers:
+            self._layers[-1].append(pkg_id)
+        if self.dependency_solvers is not None:
+            self._invalidate_dependency_solvers(pkg_id)
+
+    def _invalidate_dependency_solvers(self, pkg_id):
+        pkg_name, _, arch = pkg_id
+        names = [pkg_name]
+        # The caller may or may not have updated the binaries table yet.  If it has not, the
+        # package is removed and its provides only matter if it was a solution, in which case
+        # the cache has recorded its name.
+        pkg_data = self.binaries[arch].get(pkg_name)
+        if pkg_data is not None and pkg_data.pkg_id == pkg_id:
+            names.extend(provided_pkg for provided_pkg, _, _ in pkg_data.provides)
+        self.dependency_solvers.invalidate(self, arch, names)
 
     def check_suite_source_pkg_consistency(self, comment):
         sources_t = self.sources
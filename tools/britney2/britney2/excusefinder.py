@@ -1,19 +1,61 @@
+from functools import partial
 from itertools import chain
 from urllib.parse import quote
 
 import apt_pkg
+import io
 import logging
+import pickle
 
-from britney2 import PackageId
+from britney2 import PackageId, Suite
 from britney2.excuse import Excuse
+from britney2.hints import Hint
 from britney2.migrationitem import MigrationItem
 from britney2.policies import PolicyVerdict
-from britney2.utils import invalidate_excuses, find_smooth_updateable_binaries
+from britney2.utils import invalidate_excuses, find_smooth_updateable_binaries, map_in_forked_processes
+
+
+class _ExcusePickler(pickle.Pickler):
+    """Pickler for the results of a worker process
+
+    Suites and hints are replaced by references, which _ExcuseUnpickler
+    resolves to the corresponding objects of the main process.
+    """
+
+    def __init__(self, file, hints):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self._hint_ids = {id(hint): i for i, hint in enumerate(hints)}
+
+    def persistent_id(self, obj):
+        if isinstance(obj, Suite):
+            return ('suite', obj.name)
+        if isinstance(obj, Hint) and id(obj) in self._hint_ids:
+            return ('hint', self._hint_ids[id(obj)])
+        return None
+
+
+class _ExcuseUnpickler(pickle.Unpickler):
+
+    def __init__(self, file, suite_info, hints):
+        super().__init__(file)
+        self._suite_info = suite_info
+        self._hints = hints
+
+    def persistent_load(self, pid):
+        (kind, key) = pid
+        if kind == 'suite':
+            return self._suite_info[key]
+        return self._hints[key]
 
 
 class ExcuseFinder(object):
 
-    def __init__(self, options, suite_info, all_binaries, pkg_universe, policy_engine, mi_factory, hints):
+    # Number of chunks per worker process the source packages are split
+    # into, so that workers finishing early can pick up more work
+    CHUNKS_PER_PROCESS = 4
+
+    def __init__(self, options, suite_info, all_binaries, pkg_universe, policy_engine, mi_factory, hints,
+                 *, processes=1):
         logger_name = ".".join((self.__class__.__module__, self.__class__.__name__))
         self.logger = logging.getLogger(logger_name)
         self.options = options
@@ -23,6 +65,7 @@ class ExcuseFinder(object):
         self._policy_engine = policy_engine
         self._migration_item_factory = mi_factory
         self.hints = hints
+        self.processes = processes
         self.excuses = {}
 
     def _get_build_link(self, arch, src, ver, label=None):
@@ -463,15 +506,86 @@ class ExcuseFinder(object):
         self.excuses[excuse.name] = excuse
         return excuse.is_valid
 
+    def _compute_upgrade_excuses(self, candidates):
+        """Compute the excuses for upgrading the given source packages
+
+        :param candidates: A list of (source suite, source package name) pairs
+        :return: A list of the actionable items
+        """
+        # list of local methods and variables (for better performance)
+        architectures = self.options.architectures
+        should_upgrade_srcarch = self._should_upgrade_srcarch
+        should_upgrade_src = self._should_upgrade_src
+        sources_t = self.suite_info.target_suite.sources
+        actionable_items = []
+        actionable_items_add = actionable_items.append
+
+        for suite, pkg in candidates:
+            src_s_data = suite.sources[pkg]
+            if src_s_data.is_fakesrc:
+                continue
+            src_t_data = sources_t.get(pkg)
+
+            if src_t_data is None or apt_pkg.version_compare(src_s_data.version, src_t_data.version) != 0:
+                item = MigrationItem(package=pkg,
+                                     version=src_s_data.version,
+                                     suite=suite)
+                # check if the source package should be upgraded
+                if should_upgrade_src(item):
+                    actionable_items_add(item)
+            else:
+                # package has same version in source and target suite; check if any of the
+                # binaries have changed on the various architectures
+                for arch in architectures:
+                    item = MigrationItem(package=pkg,
+                                         version=src_s_data.version,
+                                         architecture=arch,
+                                         suite=suite)
+                    if should_upgrade_srcarch(item):
+                        actionable_items_add(item)
+
+        return actionable_items
+
+    def _compute_upgrade_excuses_in_worker(self, chunks, chunk_no):
+        # Only return the excuses of this chunk (and the changes of the policies)
+        self.excuses = {}
+        self._policy_engine.start_worker()
+        actionable_items = self._compute_upgrade_excuses(chunks[chunk_no])
+        f = io.BytesIO()
+        _ExcusePickler(f, self.hints.search(onlyactive=False)).dump(
+            (self.excuses, actionable_items, self._policy_engine.worker_state()))
+        return f.getvalue()
+
+    def _compute_upgrade_excuses_in_parallel(self, candidates):
+        """Like _compute_upgrade_excuses, but split over worker processes
+
+        The workers see the suites and policies as they are now.  Their
+        excuses, and the changes they made to the state of the policies,
+        are merged in the same order as the candidates are processed in
+        _compute_upgrade_excuses.
+        """
+        n = min(len(candidates), self.processes * self.CHUNKS_PER_PROCESS)
+        chunks = [candidates[len(candidates) * i // n:len(candidates) * (i + 1) // n] for i in range(n)]
+        self.logger.info("Computing excuses for %d source packages in %d worker processes",
+                         len(candidates), self.processes)
+        results = map_in_forked_processes(partial(self._compute_upgrade_excuses_in_worker, chunks),
+                                          range(n), self.processes)
+
+        hints = self.hints.search(onlyactive=False)
+        actionable_items = []
+        for data in results:
+            excuses, items, policy_state = _ExcuseUnpickler(io.BytesIO(data), self.suite_info, hints).load()
+            self.excuses.update(excuses)
+            actionable_items.extend(items)
+            self._policy_engine.merge_worker_state(policy_state)
+        return actionable_items
+
     def _compute_excuses_and_initial_actionable_items(self):
         # list of local methods and variables (for better performance)
         excuses = self.excuses
         suite_info = self.suite_info
         pri_source_suite = suite_info.primary_source_suite
-        architectures = self.options.architectures
         should_remove_source = self._should_remove_source
-        should_upgrade_srcarch = self._should_upgrade_srcarch
-        should_upgrade_src = self._should_upgrade_src
 
         sources_ps = pri_source_suite.sources
         sources_t = suite_info.target_suite.sources
@@ -493,31 +607,12 @@ class ExcuseFinder(object):
                     actionable_items_add(item)
 
         # for every source package in the source suites, check if it should be upgraded
-        for suite in chain((pri_source_suite, *suite_info.additional_source_suites)):
-            sources_s = suite.sources
-            for pkg in sources_s:
-                src_s_data = sources_s[pkg]
-                if src_s_data.is_fakesrc:
-                    continue
-                src_t_data = sources_t.get(pkg)
-
-                if src_t_data is None or apt_pkg.version_compare(src_s_data.version, src_t_data.version) != 0:
-                    item = MigrationItem(package=pkg,
-                                         version=src_s_data.version,
-                                         suite=suite)
-                    # check if the source package should be upgraded
-                    if should_upgrade_src(item):
-                        actionable_items_add(item)
-                else:
-                    # package has same version in source and target suite; check if any of the
-                    # binaries have changed on the various architectures
-                    for arch in architectures:
-                        item = MigrationItem(package=pkg,
-                                             version=src_s_data.version,
-                                             architecture=arch,
-                                             suite=suite)
-                        if should_upgrade_srcarch(item):
-                            actionable_items_add(item)
+        candidates = [(suite, pkg) for suite in chain((pri_source_suite, *suite_info.additional_source_suites))
+                      for pkg in suite.sources]
+        if self.processes > 1 and len(candidates) > 1:
+            actionable_items.update(self._compute_upgrade_excuses_in_parallel(candidates))
+        else:
+            actionable_items.update(self._compute_upgrade_excuses(candidates))
 
         # process the `remove' hints, if the given package is not yet in actionable_items
         for hint in self.hints['remove']:
@@ -14,6 +14,7 @@
 
 import logging
 
+from collections import defaultdict
 from itertools import chain
 
 
@@ -24,6 +25,12 @@ class MalformedHintException(Exception):
 class HintCollection(object):
     def __init__(self):
         self._hints = []
+        # Secondary indexes mapping a value to the hints (in the order they were added)
+        # that have that value.  All of them are based on the first package of the hint.
+        self._by_type = defaultdict(list)
+        self._by_package = defaultdict(list)
+        self._by_package_version = defaultdict(list)
+        self._by_architecture = defaultdict(list)
 
     @property
     def is_empty(self):
@@ -35,7 +42,20 @@ class HintCollection(object):
     def search(self, type=None, onlyactive=True, package=None,
                version=None, architecture=None, suite=None, removal=None):
 
-        return [hint for hint in self._hints if
+        # Start from the smallest applicable index; the remaining criteria are
+        # checked on the hints in it.
+        candidates = self._hints
+        if type is not None:
+            candidates = self._smallest(candidates, self._by_type, type)
+        if package is not None:
+            if version is not None:
+                candidates = self._smallest(candidates, self._by_package_version, (package, version))
+            else:
+                candidates = self._smallest(candidates, self._by_package, package)
+        if architecture is not None:
+            candidates = self._smallest(candidates, self._by_architecture, architecture)
+
+        return [hint for hint in candidates if
                 (type is None or type == hint.type) and
                 (hint.active or not onlyactive) and
                 (package is None or package == hint.packages[0].package) and
@@ -44,8 +64,19 @@ class HintCollection(object):
                 (suite is None or suite == hint.packages[0].suite) and
                 (removal is None or removal == hint.packages[0].is_removal)]
 
+    @staticmethod
+    def _smallest(candidates, index, key):
+        indexed = index.get(key, ())
+        return indexed if len(indexed) < len(candidates) else candidates
+
     def add_hint(self, hint):
         self._hints.append(hint)
+        self._by_type[hint.type].append(hint)
+        if hint.packages:
+            first = hint.packages[0]
+            self._by_package[first.package].append(hint)
+            self._by_package_version[(first.package, first.version)].append(hint)
+            self._by_architecture[first.architecture].append(hint)
 
 
 class Hint(object):
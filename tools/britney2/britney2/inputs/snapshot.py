@@ -0,0 +1,60 @@
+import logging
+import os
+import pickle
+
+
+class SuiteSnapshotCache(object):
+    """Persistent on-disk cache of parsed suite contents
+
+    Every entry is stored in its own file together with a fingerprint
+    of the input files it was parsed from.  An entry is only used if the
+    fingerprint given to `load` is identical to the stored one, so a
+    changed Sources/Packages file (or a changed Release checksum for it)
+    causes that entry (and only that entry) to be re-parsed.
+    """
+
+    FORMAT_VERSION = 3
+
+    def __init__(self, cache_dir):
+        self._cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        logger_name = ".".join((self.__class__.__module__, self.__class__.__name__))
+        self.logger = logging.getLogger(logger_name)
+
+    def _path(self, key):
+        return os.path.join(self._cache_dir, "%s.pickle" % '_'.join(key))
+
+    def load(self, key, fingerprint):
+        """Return the data stored for key or None if it is missing or stale"""
+        filename = self._path(key)
+        try:
+            with open(filename, 'rb') as fd:
+                version, stored_fingerprint, data = pickle.load(fd)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError, TypeError, ValueError) as e:
+            self.logger.warning("Ignoring unreadable snapshot %s: %s", filename, str(e))
+            self.misses += 1
+            return None
+
+        if version != self.FORMAT_VERSION or stored_fingerprint != fingerprint:
+            self.logger.info("Snapshot %s is outdated", filename)
+            self.misses += 1
+            return None
+
+        self.logger.info("Using snapshot %s", filename)
+        self.hits += 1
+        return data
+
+    def store(self, key, fingerprint, data):
+        """Store data for key
+
+        The data is serialised immediately, so callers are free to mutate it afterwards.
+        """
+        filename = self._path(key)
+        os.makedirs(self._cache_dir, exist_ok=True)
+        with open(filename + '.new', 'wb') as fd:
+            pickle.dump((self.FORMAT_VERSION, fingerprint, data), fd, protocol=pickle.HIGHEST_PROTOCOL)
+        os.rename(filename + '.new', filename)
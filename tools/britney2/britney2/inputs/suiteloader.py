@@ -1,10 +1,14 @@
 from abc import abstractmethod
+from concurrent.futures import ProcessPoolExecutor
 import apt_pkg
+import gc
 import logging
+import multiprocessing
 import os
 import sys
 
 from britney2 import SuiteClass, Suite, TargetSuite, Suites, BinaryPackage, BinaryPackageId, SourcePackage
+from britney2.inputs.snapshot import SuiteSnapshotCache
 from britney2.utils import (
     read_release_file, possibly_compressed, read_sources_file, create_provides_map, parse_provides, parse_builtusing
 )
@@ -14,6 +18,77 @@ class MissingRequiredConfigurationError(RuntimeError):
     pass
 
 
+def iter_packages_file(filename, arch, logger=None):
+    """Iterate over the stanzas of a Packages file
+
+    Yields a tuple of the field values needed for a BinaryPackage per stanza
+    (package, version, section, source, source version, architecture,
+    multi-arch, depends, conflicts, provides, essential, built-using).  The
+    values are not interned and no state is shared, so this can be used in a
+    separate process.
+    """
+    tag_file = apt_pkg.TagFile(filename)
+    get_field = tag_file.section.get
+    step = tag_file.step
+
+    while step():
+        pkg = get_field('Package')
+        version = get_field('Version')
+
+        # Merge Pre-Depends with Depends and Conflicts with
+        # Breaks. Britney is not interested in the "finer
+        # semantic differences" of these fields anyway.
+        #
+        # This is merge_fields unrolled for two fields; this loop
+        # runs once per binary package in the archive, so the
+        # function calls and the generator are measurable.
+        deps = get_field('Depends')
+        pre_deps = get_field('Pre-Depends')
+        if pre_deps:
+            deps = pre_deps + ', ' + deps if deps else pre_deps
+        elif not deps:
+            deps = None
+        conflicts = get_field('Conflicts')
+        breaks = get_field('Breaks')
+        if breaks:
+            conflicts = conflicts + ', ' + breaks if conflicts else breaks
+        elif not conflicts:
+            conflicts = None
+
+        ess = get_field('Essential') == 'yes'
+
+        source = pkg
+        source_version = version
+        # retrieve the name and the version of the source package
+        source_raw = get_field('Source')
+        if source_raw:
+            source = source_raw.split(" ")[0]
+            if "(" in source_raw:
+                source_version = source_raw[source_raw.find("(")+1:source_raw.find(")")]
+
+        provides_raw = get_field('Provides')
+        builtusing_raw = get_field('Built-Using')
+        if provides_raw or builtusing_raw:
+            pkg_id = BinaryPackageId(pkg, version, arch)
+        if provides_raw:
+            provides = parse_provides(provides_raw, pkg_id=pkg_id, logger=logger)
+        else:
+            provides = []
+
+        if builtusing_raw:
+            builtusing = parse_builtusing(builtusing_raw, pkg_id=pkg_id, logger=logger)
+        else:
+            builtusing = []
+
+        yield (pkg, version, get_field('Section'), source, source_version, get_field('Architecture'),
+               get_field('Multi-Arch'), deps, conflicts, provides, ess, builtusing)
+
+
+def parse_packages_files(filenames, arch, logger=None):
+    """Parse all the Packages files of an architecture (the worker side of the parallel loader)"""
+    return [row for filename in filenames for row in iter_packages_file(filename, arch, logger=logger)]
+
+
 class SuiteContentLoader(object):
 
     def __init__(self, base_config):
@@ -80,6 +155,15 @@ class DebMirrorLikeSuiteContentLoader(SuiteContentLoader):
         'provides',
     ]
 
+    def __init__(self, base_config):
+        super().__init__(base_config)
+        snapshot_dir = getattr(base_config, 'suite_snapshot_dir', None)
+        self._snapshot = SuiteSnapshotCache(snapshot_dir) if snapshot_dir else None
+        self._release_checksums = {}
+        self._pool = None
+        # Provides and Built-Using tuples shared between binaries
+        self._shared_relations = {}
+
     def load_suites(self):
         suites = []
         target_suite = None
@@ -110,11 +194,31 @@ class DebMirrorLikeSuiteContentLoader(SuiteContentLoader):
         # - Load testing last as some live-data tests have more complete information in
         #   unstable
         # - Load all sources before any of the binaries.
-        for suite in suites:
-            sources = self._read_sources(suite.path)
-            self._update_suite_name(suite)
-            suite.sources = sources
-            (suite.binaries, suite.provides_table) = self._read_binaries(suite, self._architectures)
+        processes = int(getattr(self._base_config, 'suite_loader_processes', None) or 1)
+        if processes > 1:
+            self.logger.info("Parsing Packages files with %d processes", processes)
+            self._pool = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('fork'))
+        # Nearly everything allocated while loading the suites is kept for
+        # the entire run, so the cyclic garbage collector would repeatedly
+        # traverse a growing heap without finding anything to free.
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for suite in suites:
+                sources = self._load_sources(suite)
+                self._update_suite_name(suite)
+                suite.sources = sources
+                (suite.binaries, suite.provides_table) = self._read_binaries(suite, self._architectures)
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+        if self._snapshot is not None:
+            self.logger.info("Suite snapshot cache: %d entries reused, %d entries (re-)parsed",
+                             self._snapshot.hits, self._snapshot.misses)
 
         return Suites(suites[0], suites[1:])
 
@@ -180,6 +284,92 @@ class DebMirrorLikeSuiteContentLoader(SuiteContentLoader):
             self._architectures = sorted(x for x in release_file['Architectures'].split() if x != 'all')
             self.logger.info("Using architectures listed in Release file: %s", ' '.join(self._architectures))
 
+    @staticmethod
+    def _snapshot_key(suite):
+        # The suite name may be replaced by the one in the Release file, so
+        # use something that is stable between runs.
+        return suite.suite_short_name or suite.suite_class.name.lower()
+
+    def _file_fingerprint(self, basedir, filename):
+        """Identify the content of a given input file of a suite
+
+        Prefer the checksum listed in the Release file of the suite; fall
+        back to the size and modification time of the file for the layouts
+        without a Release file.
+        """
+        try:
+            checksums = self._release_checksums[basedir]
+        except KeyError:
+            checksums = {}
+            try:
+                release_file = read_release_file(basedir)
+            except FileNotFoundError:
+                release_file = None
+            if release_file is not None:
+                for line in release_file.get('SHA256', '').splitlines():
+                    parts = line.split()
+                    if len(parts) == 3:
+                        checksums[parts[2]] = parts[0]
+            self._release_checksums[basedir] = checksums
+
+        path = os.path.relpath(filename, basedir)
+        try:
+            return (path, checksums[path])
+        except KeyError:
+            stat = os.stat(filename)
+            return (path, stat.st_size, stat.st_mtime_ns)
+
+    def _suite_fingerprint(self, basedir, filenames):
+        return (os.path.abspath(basedir), tuple(self._file_fingerprint(basedir, f) for f in filenames))
+
+    def _sources_files(self, basedir):
+        if not self._components:
+            return [os.path.join(basedir, "Sources")]
+        filenames = []
+        for component in self._components:
+            filename = os.path.join(basedir, component, "source", "Sources")
+            try:
+                filename = possibly_compressed(filename)
+            except FileNotFoundError:
+                if component == "non-free-firmware":
+                    self.logger.info("Skipping %s as it doesn't exist", filename)
+                    continue
+                raise
+            filenames.append(filename)
+        return filenames
+
+    def _load_sources(self, suite):
+        """Load the source packages of a suite (possibly from the snapshot cache)"""
+        if self._snapshot is None:
+            return self._read_sources(suite.path)
+        key = (self._snapshot_key(suite), 'source')
+        fingerprint = self._suite_fingerprint(suite.path, self._sources_files(suite.path))
+        sources = self._snapshot.load(key, fingerprint)
+        if sources is None:
+            sources = self._read_sources(suite.path)
+            self._snapshot.store(key, fingerprint, sources)
+        else:
+            sources = self._intern_sources(sources)
+        return sources
+
+    @staticmethod
+    def _intern_sources(sources, intern=sys.intern):
+        """Intern the strings of unpickled source packages (like read_sources_file does)"""
+        interned = {}
+        for src in sources.values():
+            src.source = intern(src.source)
+            src.version = intern(src.version)
+            if src.section:
+                src.section = intern(src.section)
+            if src.maintainer:
+                src.maintainer = intern(src.maintainer)
+            if src.build_deps_arch is not None:
+                src.build_deps_arch = intern(src.build_deps_arch)
+            if src.build_deps_indep is not None:
+                src.build_deps_indep = intern(src.build_deps_indep)
+            interned[src.source] = src
+        return interned
+
     def _read_sources(self, basedir):
         """Read the list of source packages from the specified directory
 
@@ -194,15 +384,7 @@ class DebMirrorLikeSuiteContentLoader(SuiteContentLoader):
 
         if self._components:
             sources = {}
-            for component in self._components:
-                filename = os.path.join(basedir, component, "source", "Sources")
-                try:
-                    filename = possibly_compressed(filename)
-                except FileNotFoundError:
-                    if component == "non-free-firmware":
-                        self.logger.info("Skipping %s as it doesn't exist", filename)
-                        continue
-                    raise
+            for filename in self._sources_files(basedir):
                 self.logger.info("Loading source packages from %s", filename)
                 read_sources_file(filename, sources)
         else:
@@ -218,21 +400,28 @@ class DebMirrorLikeSuiteContentLoader(SuiteContentLoader):
         """
         return separator.join(filter(None, (get_field(x) for x in field_names))) or None
 
-    def _read_packages_file(self, filename, arch, srcdist, packages=None, intern=sys.intern):
+    def _read_packages_file(self, filename, arch, srcdist, packages=None):
         self.logger.info("Loading binary packages from %s", filename)
 
         if packages is None:
             packages = {}
 
-        all_binaries = self._all_binaries
+        self._add_packages(iter_packages_file(filename, arch, logger=self.logger), arch, srcdist, packages)
 
-        tag_file = apt_pkg.TagFile(filename)
-        get_field = tag_file.section.get
-        step = tag_file.step
+        return packages
+
+    def _add_packages(self, rows, arch, srcdist, packages, intern=sys.intern):
+        """Add rows from iter_packages_file to the package table of a given architecture
+
+        This is the part of loading a Packages file that updates the shared
+        state (the source packages and all_binaries), so it must happen in
+        the main process even if the rows were produced by a worker.
+        """
+        all_binaries = self._all_binaries
+        shared_relations = self._shared_relations.setdefault
 
-        while step():
-            pkg = get_field('Package')
-            version = get_field('Version')
+        for (pkg, version, section, source, source_version, raw_arch, multi_arch, deps, conflicts, provides, ess,
+             builtusing) in rows:
 
             # There may be multiple versions of any arch:all packages
             # (in unstable) if some architectures have out-of-date
@@ -258,48 +447,42 @@ class DebMirrorLikeSuiteContentLoader(SuiteContentLoader):
                 if pkg_id not in old_src_binaries:
                     old_src_binaries.add(pkg_id)
 
-            # Merge Pre-Depends with Depends and Conflicts with
-            # Breaks. Britney is not interested in the "finer
-            # semantic differences" of these fields anyway.
-            deps = DebMirrorLikeSuiteContentLoader.merge_fields(get_field, 'Pre-Depends', 'Depends')
-            conflicts = DebMirrorLikeSuiteContentLoader.merge_fields(get_field, 'Conflicts', 'Breaks')
-
-            ess = False
-            if get_field('Essential', 'no') == 'yes':
-                ess = True
-
-            source = pkg
-            source_version = version
-            # retrieve the name and the version of the source package
-            source_raw = get_field('Source')
-            if source_raw:
-                source = intern(source_raw.split(" ")[0])
-                if "(" in source_raw:
-                    source_version = intern(source_raw[source_raw.find("(")+1:source_raw.find(")")])
-
-            provides_raw = get_field('Provides')
-            if provides_raw:
-                provides = parse_provides(provides_raw, pkg_id=pkg_id, logger=self.logger)
+            source = intern(source)
+            source_version = intern(source_version)
+
+            # The relations are interned and stored as (shared) tuples, as
+            # most of them are identical for all architectures and suites.
+            # This also covers rows parsed in another process, which do not
+            # share our interned strings.
+            if deps:
+                deps = intern(deps)
+            if conflicts:
+                conflicts = intern(conflicts)
+            if provides:
+                provides = tuple((intern(provided), intern(provided_version), intern(op))
+                                 for provided, provided_version, op in provides)
+                provides = shared_relations(provides, provides)
+            else:
+                provides = ()
+            if builtusing:
+                builtusing = tuple((intern(bu), intern(bu_version)) for bu, bu_version in builtusing)
+                builtusing = shared_relations(builtusing, builtusing)
             else:
-                provides = []
+                builtusing = ()
+            if multi_arch:
+                multi_arch = intern(multi_arch)
 
-            raw_arch = intern(get_field('Architecture'))
+            raw_arch = intern(raw_arch)
             if raw_arch not in {'all', arch}:  # pragma: no cover
                 raise AssertionError("%s has wrong architecture (%s) - should be either %s or all" % (
                     str(pkg_id), raw_arch, arch))
 
-            builtusing_raw = get_field('Built-Using')
-            if builtusing_raw:
-                builtusing = parse_builtusing(builtusing_raw, pkg_id=pkg_id, logger=self.logger)
-            else:
-                builtusing = []
-
             dpkg = BinaryPackage(version,
-                                 intern(get_field('Section')),
+                                 intern(section),
                                  source,
                                  source_version,
                                  raw_arch,
-                                 get_field('Multi-Arch'),
+                                 multi_arch,
                                  deps,
                                  conflicts,
                                  provides,
@@ -320,12 +503,14 @@ class DebMirrorLikeSuiteContentLoader(SuiteContentLoader):
                     srcdist[source].binaries.add(pkg_id)
             # if the source package doesn't exist, create a fake one
             else:
-                srcdist[source] = SourcePackage(source, source_version, 'faux', {pkg_id}, None, True, None, None, [], [])
+                srcdist[source] = SourcePackage(source, source_version, 'faux', {pkg_id}, None, True, None, None, (), ())
 
-            # add the resulting dictionary to the package list
-            packages[pkg] = dpkg
             if pkg_id in all_binaries:
-                self._merge_pkg_entries(pkg, arch, all_binaries[pkg_id], dpkg)
+                known_dpkg = all_binaries[pkg_id]
+                self._merge_pkg_entries(pkg, arch, known_dpkg, dpkg)
+                if dpkg == known_dpkg:
+                    # The same package is in another suite; share the record
+                    dpkg = known_dpkg
             else:
                 all_binaries[pkg_id] = dpkg
 
@@ -364,59 +549,98 @@ class DebMirrorLikeSuiteContentLoader(SuiteContentLoader):
         if self._components:
             release_file = read_release_file(basedir)
             listed_archs = set(release_file['Architectures'].split())
-            for arch in architectures:
-                packages = {}
-                if arch not in listed_archs:
-                    self.logger.info("Skipping arch %s for %s: It is not listed in the Release file",
-                                     arch, suite.name)
-                    binaries[arch] = {}
-                    provides_table[arch] = {}
-                    continue
-                for component in self._components:
-                    binary_dir = "binary-%s" % arch
-                    filename = os.path.join(basedir,
-                                            component,
-                                            binary_dir,
-                                            'Packages')
-                    try:
-                        filename = possibly_compressed(filename)
-                    except FileNotFoundError:
-                        if component == "non-free-firmware":
-                            self.logger.info("Skipping %s as it doesn't exist", filename)
-                            continue
-                        raise
-                    udeb_filename = os.path.join(basedir,
-                                                 component,
-                                                 "debian-installer",
-                                                 binary_dir,
-                                                 "Packages")
-                    # We assume the udeb Packages file is present if the
-                    # regular one is present
-                    udeb_filename = possibly_compressed(udeb_filename)
-                    self._read_packages_file(filename,
-                                             arch,
-                                             suite.sources,
-                                             packages)
-                    self._read_packages_file(udeb_filename,
-                                             arch,
-                                             suite.sources,
-                                             packages)
-                # create provides
-                provides = create_provides_map(packages)
-                binaries[arch] = packages
-                provides_table[arch] = provides
         else:
-            for arch in architectures:
-                filename = os.path.join(basedir, "Packages_%s" % arch)
-                packages = self._read_packages_file(filename,
-                                                    arch,
-                                                    suite.sources)
-                provides = create_provides_map(packages)
-                binaries[arch] = packages
-                provides_table[arch] = provides
+            listed_archs = None
+
+        to_load = []
+        for arch in architectures:
+            if listed_archs is not None and arch not in listed_archs:
+                self.logger.info("Skipping arch %s for %s: It is not listed in the Release file",
+                                 arch, suite.name)
+                binaries[arch] = {}
+                provides_table[arch] = {}
+                continue
+            to_load.append((arch, self._packages_files(basedir, arch)))
+
+        # The snapshot holds the rows parsed from the Packages files rather
+        # than the resulting packages, so that both go through _add_packages
+        # (which handles duplicate stanzas and interns the strings).
+        snapshot = self._snapshot
+        cached = {}
+        if snapshot is not None:
+            for arch, filenames in to_load:
+                rows = snapshot.load(self._packages_snapshot_key(suite, arch),
+                                     self._suite_fingerprint(basedir, filenames))
+                if rows is not None:
+                    cached[arch] = rows
+
+        # Let the workers parse everything up front; the results are merged in the
+        # order of the architectures below to keep the outcome deterministic.
+        parsed = {}
+        if self._pool is not None:
+            for arch, filenames in to_load:
+                if arch not in cached:
+                    parsed[arch] = self._pool.submit(parse_packages_files, filenames, arch, logger=self.logger)
+
+        for arch, filenames in to_load:
+            packages = {}
+            if arch in cached:
+                self._add_packages(cached.pop(arch), arch, suite.sources, packages)
+            elif arch in parsed or snapshot is not None:
+                for filename in filenames:
+                    self.logger.info("Loading binary packages from %s", filename)
+                if arch in parsed:
+                    rows = parsed.pop(arch).result()
+                else:
+                    rows = parse_packages_files(filenames, arch, logger=self.logger)
+                self._add_packages(rows, arch, suite.sources, packages)
+                if snapshot is not None:
+                    snapshot.store(self._packages_snapshot_key(suite, arch),
+                                   self._suite_fingerprint(basedir, filenames),
+                                   rows)
+            else:
+                for filename in filenames:
+                    self._read_packages_file(filename, arch, suite.sources, packages)
+            # create provides
+            provides = create_provides_map(packages)
+            binaries[arch] = packages
+            provides_table[arch] = provides
 
         return (binaries, provides_table)
 
+    def _packages_files(self, basedir, arch):
+        """List the Packages files (including udebs) for a given architecture of a suite"""
+        if not self._components:
+            return [os.path.join(basedir, "Packages_%s" % arch)]
+        filenames = []
+        binary_dir = "binary-%s" % arch
+        for component in self._components:
+            filename = os.path.join(basedir,
+                                    component,
+                                    binary_dir,
+                                    'Packages')
+            try:
+                filename = possibly_compressed(filename)
+            except FileNotFoundError:
+                if component == "non-free-firmware":
+                    self.logger.info("Skipping %s as it doesn't exist", filename)
+                    continue
+                raise
+            udeb_filename = os.path.join(basedir,
+                                         component,
+                                         "debian-installer",
+                                         binary_dir,
+                                         "Packages")
+            # We assume the udeb Packages file is present if the
+            # regular one is present
+            udeb_filename = possibly_compressed(udeb_filename)
+            filenames.append(filename)
+            filenames.append(udeb_filename)
+        return filenames
+
+    def _packages_snapshot_key(self, suite, arch):
+        return (self._snapshot_key(suite), 'binary', arch)
+
     def _merge_pkg_entries(self, package, parch, pkg_entry1, pkg_entry2):
         bad = []
         for f in self.CHECK_FIELDS:
@@ -21,22 +21,31 @@ from britney2.installability.tester import InstallabilityTester
 from britney2.installability.universe import BinaryPackageRelation, BinaryPackageUniverse
 
 
-def build_installability_tester(suite_info, archs):
-    """Create the installability tester"""
+def build_installability_tester(suite_info, archs, *, dependency_solvers=None):
+    """Create the installability tester
+
+    If dependency_solvers (a DependencySolverCache) is given, it is used to
+    resolve the relations of the packages.
+    """
 
     builder = InstallabilityTesterBuilder()
 
     for (suite, arch) in product(suite_info, archs):
-        _build_inst_tester_on_suite_arch(builder, suite_info, suite, arch)
+        _build_inst_tester_on_suite_arch(builder, suite_info, suite, arch, dependency_solvers)
 
     return builder.build()
 
 
-def _build_inst_tester_on_suite_arch(builder, suite_info, suite, arch):
+def _build_inst_tester_on_suite_arch(builder, suite_info, suite, arch, dependency_solvers):
     packages_s_a = suite.binaries[arch]
     is_target = suite.suite_class.is_target
-    bin_prov = [(s.binaries[arch], s.provides_table[arch]) for s in suite_info]
-    solvers = get_dependency_solvers
+    # bin_prov holds the arguments (besides the block) for each suite to pass to solvers
+    if dependency_solvers is not None:
+        bin_prov = [(s, arch) for s in suite_info]
+        solvers = dependency_solvers.solvers
+    else:
+        bin_prov = [(s.binaries[arch], s.provides_table[arch]) for s in suite_info]
+        solvers = get_dependency_solvers
     for pkgdata in packages_s_a.values():
         pkg_id = pkgdata.pkg_id
         if not builder.add_binary(pkg_id,
@@ -72,7 +72,7 @@ def compute_scc(graph):
                 continue
             succ_num = len(low)
             low[succ] = succ_num
-            work_stack.append((succ, len(node_stack), succ_num, graph[succ].before))
+            work_stack.append((succ, len(node_stack), succ_num, sorted(graph[succ].before)))
             node_stack.append(succ)
             # "Recurse" into the child node first
             return True
@@ -91,11 +91,12 @@ def compute_scc(graph):
         low[n] = root_num
         # DFS work-stack needed to avoid call recursion.  It (more or less)
         # replaces the variables on the call stack in Tarjan's algorithm
-        work_stack = [(n, len(node_stack), root_num, graph[n].before)]
+        # (The successors of a node are sorted once and consumed as they are handled)
+        work_stack = [(n, len(node_stack), root_num, sorted(graph[n].before))]
         node_stack.append(n)
         while work_stack:
             node, stack_idx, orig_node_num, successors = work_stack[-1]
-            if successors and _handle_succ(node, low[node], sorted(successors)):
+            if successors and _handle_succ(node, low[node], successors):
                 # _handle_succ has pushed a new node on to work_stack
                 # and we need to "restart" the loop to handle that first
                 continue
@@ -137,23 +138,23 @@ def compute_scc(graph):
     return result
 
 
-def apply_order(key, other, order, logger, order_cause, invert=False, order_sub_cause=''):
-    if other == key:
-        # "Self-relation" => ignore
-        return
-    order_key = order[key]
-    if invert:
-        order[other].after.add(key)
-        order_set = order_key.before
-    else:
-        order[other].before.add(key)
-        order_set = order_key.after
-    if logger.isEnabledFor(logging.DEBUG) and other not in order_set:  # pragma: no cover
-        if order_sub_cause:
-            order_sub_cause = ' (%s)' % order_sub_cause
-        logger.debug("%s induced order%s: %s before %s", order_cause, order_sub_cause, key, other)
-    # Defer adding until the end to ensure we only log the first time a dependency order is introduced.
-    order_set.add(other)
+class _OrderCheck(object):
+    """A check that may induce order constraints for the group of an item
+
+    The outcome of a check only depends on the packages in "watched": whether
+    they are in the suite and which of the groups (if any) adds or removes
+    them.  Therefore, the check only has to be evaluated again if that changes
+    for one of them.
+    """
+
+    __slots__ = ['key', 'kind', 'watched', 'data', 'edges']
+
+    def __init__(self, key, kind, watched, data):
+        self.key = key
+        self.kind = kind
+        self.watched = watched
+        self.data = data
+        self.edges = frozenset()
 
 
 class InstallabilitySolver(object):
@@ -162,28 +163,94 @@ class InstallabilitySolver(object):
         """Create a new installability solver
 
         universe is a BinaryPackageUniverse.
+
+        The solver keeps the order constraints between the groups of
+        solve_groups, so when it is called again with (mostly) the same
+        groups, only the constraints affected by the changes to the groups
+        and to the suite are computed again.
         """
         self._universe = universe
         self._inst_tester = inst_tester
         logger_name = ".".join((self.__class__.__module__, self.__class__.__name__))
         self.logger = logging.getLogger(logger_name)
+        # key => (group, list of _OrderCheck)
+        self._checks = {}
+        # pkg_id => set of _OrderCheck watching it
+        self._watchers = {}
+        # (key, other) => number of checks inducing that order
+        self._edges = {}
+        # The state of the previous call to solve_groups
+        self._ptable = {}
+        self._going_in = set()
+        self._going_out = set()
+        self._in_suite = set()
+
+    def _add_order(self, edges, key, other, order_cause, invert=False, order_sub_cause=''):
+        if other == key:
+            # "Self-relation" => ignore
+            return
+        edge = (other, key) if invert else (key, other)
+        if self.logger.isEnabledFor(logging.DEBUG) and edge not in edges:  # pragma: no cover
+            if order_sub_cause:
+                order_sub_cause = ' (%s)' % order_sub_cause
+            self.logger.debug("%s induced order%s: %s before %s", order_cause, order_sub_cause, key, other)
+        edges.add(edge)
+
+    def _create_checks(self, key, adds, rms):
+        universe = self._universe
+        checks = []
+
+        oldcons = set(chain.from_iterable(universe.negative_dependencies_of(r) for r in rms))
+        newcons = set(chain.from_iterable(universe.negative_dependencies_of(a) for a in adds))
+        oldcons -= newcons
+        if oldcons:
+            checks.append(_OrderCheck(key, 'conflict', oldcons, oldcons))
+
+        for rdep in set(chain.from_iterable(universe.reverse_dependencies_of(r) for r in rms)):
+            depgroups = universe.dependencies_of(rdep)
+            watched = set(chain.from_iterable(depgroups))
+            watched.add(rdep)
+            checks.append(_OrderCheck(key, 'removal', watched, (rdep, depgroups)))
+
+        for depgroup in set(chain.from_iterable(universe.dependencies_of(a) for a in adds)):
+            checks.append(_OrderCheck(key, 'dependency', depgroup, depgroup))
 
-    def _compute_group_order_rms(self, rms, order, key, ptable, going_out):
+        return checks
+
+    def _evaluate_check(self, check, ptable, going_out, going_in):
         sat_in_testing = self._inst_tester.any_of_these_are_in_the_suite
-        universe = self._universe
-        logger = self.logger
-        for rdep in chain.from_iterable(universe.reverse_dependencies_of(r) for r in rms):
+        key = check.key
+        edges = set()
+
+        if check.kind == 'conflict':
+            # "key" removes a conflict with one of "other"'s binaries, so it
+            # is probably a good idea to migrate "key" before "other"
+            for o in ifilter_only(ptable, check.data):
+                self._add_order(edges, key, ptable[o], 'Conflict', invert=True)
+        elif check.kind == 'removal':
             # The binaries have reverse dependencies in testing;
             # check if we can/should migrate them first.
-            for depgroup in universe.dependencies_of(rdep):
-                rigid = depgroup - going_out
-                if sat_in_testing(rigid):
-                    # (partly) satisfied by testing, assume it is okay
-                    continue
-                if rdep in ptable:
-                    apply_order(key, ptable[rdep], order, logger, 'Removal')
+            rdep, depgroups = check.data
+            if rdep in ptable:
+                for depgroup in depgroups:
+                    rigid = depgroup - going_out
+                    if not sat_in_testing(rigid):
+                        self._add_order(edges, key, ptable[rdep], 'Removal')
+                        break
+        elif not ptable.keys().isdisjoint(check.data):
+            # Check if this item should migrate before others
+            # (e.g. because they depend on a new [version of a]
+            # binary provided by this item).
+            depgroup = check.data
+            rigid = depgroup - going_out
+            if not sat_in_testing(rigid):
+                # (otherwise, it is (partly) satisfied by testing and
+                # assumed to be okay)
+                self._compute_order_for_dependency(edges, key, depgroup, ptable, going_in)
 
-    def _compute_order_for_dependency(self, key, depgroup, ptable, order, going_in):
+        return frozenset(edges)
+
+    def _compute_order_for_dependency(self, edges, key, depgroup, ptable, going_in):
         # We got three cases:
         # - "swap" (replace existing binary with a newer version)
         # - "addition" (add new binary without removing any)
@@ -194,7 +261,6 @@ class InstallabilitySolver(object):
         # affect us.
         other_adds = set()
         other_rms = set()
-        logger = self.logger
         for d in ifilter_only(ptable, depgroup):
             other = ptable[d]
             if d in going_in:
@@ -207,37 +273,45 @@ class InstallabilitySolver(object):
                 other_rms.add(other)
 
         for other in other_adds - other_rms:
-            apply_order(key, other, order, logger, 'Dependency', order_sub_cause='add')
+            self._add_order(edges, key, other, 'Dependency', order_sub_cause='add')
         for other in other_rms - other_adds:
-            apply_order(key, other, order, logger, 'Dependency', order_sub_cause='remove', invert=True)
+            self._add_order(edges, key, other, 'Dependency', order_sub_cause='remove', invert=True)
 
-    def _compute_group_order_adds(self, adds, order, key, ptable, going_out, going_in):
-        sat_in_testing = self._inst_tester.any_of_these_are_in_the_suite
-        universe = self._universe
-        for depgroup in chain.from_iterable(universe.dependencies_of(a) for a in adds):
-            # Check if this item should migrate before others
-            # (e.g. because they depend on a new [version of a]
-            # binary provided by this item).
-            rigid = depgroup - going_out
-            if sat_in_testing(rigid):
-                # (partly) satisfied by testing, assume it is okay
-                continue
-            self._compute_order_for_dependency(key, depgroup, ptable, order, going_in)
+    def _set_edges(self, check, edges):
+        counts = self._edges
+        for edge in check.edges - edges:
+            if counts[edge] == 1:
+                del counts[edge]
+            else:
+                counts[edge] -= 1
+        for edge in edges - check.edges:
+            counts[edge] = counts.get(edge, 0) + 1
+        check.edges = edges
+
+    def _drop_checks(self, checks):
+        watchers = self._watchers
+        for check in checks:
+            self._set_edges(check, frozenset())
+            for pkg_id in check.watched:
+                pkg_watchers = watchers[pkg_id]
+                pkg_watchers.discard(check)
+                if not pkg_watchers:
+                    del watchers[pkg_id]
 
     def _compute_group_order(self, groups, key2item):
-        universe = self._universe
         ptable = {}
-        order = {}
         going_out = set()
         going_in = set()
-        logger = self.logger
-        debug_solver = logger.isEnabledFor(logging.DEBUG)
+        current = {}
+        watchers = self._watchers
+        debug_solver = self.logger.isEnabledFor(logging.DEBUG)
 
         # Build the tables
-        for (item, adds, rms) in groups:
+        for group in groups:
+            (item, adds, rms) = group
             key = str(item)
             key2item[key] = item
-            order[key] = OrderNode()
+            current[key] = group
             going_in.update(adds)
             going_out.update(rms)
             for x in chain(adds, rms):
@@ -246,23 +320,57 @@ class InstallabilitySolver(object):
         if debug_solver:  # pragma: no cover
             self._dump_groups(groups)
 
-        # This large loop will add ordering constrains on each "item"
-        # that migrates based on various rules.
-        for (item, adds, rms) in groups:
-            key = str(item)
-            oldcons = set(chain.from_iterable(universe.negative_dependencies_of(r) for r in rms))
-            newcons = set(chain.from_iterable(universe.negative_dependencies_of(a) for a in adds))
-            oldcons -= newcons
-            # Some of the old binaries have "conflicts" that will
-            # be removed.
-            for o in ifilter_only(ptable, oldcons):
-                # "key" removes a conflict with one of
-                # "other"'s binaries, so it is probably a good
-                # idea to migrate "key" before "other"
-                apply_order(key, ptable[o], order, logger, 'Conflict', invert=True)
-
-            self._compute_group_order_rms(rms, order, key, ptable, going_out)
-            self._compute_group_order_adds(adds, order, key, ptable, going_out, going_in)
+        # Forget the checks of the groups that are gone (or changed) and
+        # create the checks for new groups
+        dirty = set()
+        for key, (group, checks) in list(self._checks.items()):
+            new_group = current.get(key)
+            if new_group is not group and new_group != group:
+                self._drop_checks(checks)
+                del self._checks[key]
+        for key, group in current.items():
+            if key in self._checks:
+                continue
+            (item, adds, rms) = group
+            checks = self._create_checks(key, adds, rms)
+            self._checks[key] = (group, checks)
+            for check in checks:
+                for pkg_id in check.watched:
+                    try:
+                        watchers[pkg_id].add(check)
+                    except KeyError:
+                        watchers[pkg_id] = {check}
+            dirty.update(checks)
+
+        # Any other check must be evaluated again if one of the packages it
+        # watches has been added to or removed from the suite, or the groups
+        # adding or removing it changed since the last time.
+        old_ptable = self._ptable
+        changed = going_in ^ self._going_in
+        changed |= going_out ^ self._going_out
+        changed.update(x for x, key in ptable.items() if old_ptable.get(x) != key)
+        changed.update(x for x in old_ptable if x not in ptable)
+        in_suite = self._inst_tester.intersect_with_the_suite(watchers.keys())
+        changed |= in_suite ^ self._in_suite
+        for pkg_id in changed:
+            dirty.update(watchers.get(pkg_id, ()))
+
+        for check in dirty:
+            self._set_edges(check, self._evaluate_check(check, ptable, going_out, going_in))
+
+        if debug_solver:  # pragma: no cover
+            checks = sum(len(checks) for _, checks in self._checks.values())
+            self.logger.debug("Evaluated %d of %d order checks", len(dirty), checks)
+
+        self._ptable = ptable
+        self._going_in = going_in
+        self._going_out = going_out
+        self._in_suite = in_suite
+
+        order = {key: OrderNode() for key in current}
+        for (key, other) in self._edges:
+            order[other].before.add(key)
+            order[key].after.add(other)
 
         return order
 
@@ -378,7 +486,9 @@ class InstallabilitySolver(object):
                     # Add it to queue:
                     # - if it is ready, it will be emitted.
                     # - else, it will be dropped and re-added later.
-                    queue.extend(sorted(order[cur].before - emitted, key=len))
+                    # (Sorted by name first, so the result does not depend on
+                    # the iteration order of the set)
+                    queue.extend(sorted(sorted(order[cur].before - emitted), key=len))
 
         if debug_solver:  # pragma: no cover
             self.logger.debug("-- END LINEARIZED ORDER --")
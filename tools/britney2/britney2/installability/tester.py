@@ -20,6 +20,44 @@ from itertools import chain, filterfalse
 from britney2.utils import iter_except, add_transitive_dependencies_flatten
 
 
+class _TesterLayer(object):
+    """The changes of an InstallabilityTester since push_layer
+
+    The sets of the tester are used directly by the solver, so they are
+    always kept up to date.  A layer records what is needed to restore
+    them: the packages added to and removed from the suite and the cached
+    installable packages added and evicted since the layer was started.
+    The (small) set of broken packages and the essential cache are copied.
+    """
+
+    def __init__(self, cache_broken, cache_broken_by_deps, cache_ess):
+        self.added = set()
+        self.removed = set()
+        self.inst_added = set()
+        self.inst_evicted = set()
+        self.caches_dropped = False
+        self.broken = set(cache_broken)
+        self.broken_by_deps = set(cache_broken_by_deps)
+        self.ess = dict(cache_ess)
+
+    def merge_into(self, parent):
+        readded = self.added & parent.removed
+        parent.removed -= readded
+        parent.added |= self.added - readded
+        unadded = self.removed & parent.added
+        parent.added -= unadded
+        parent.removed |= self.removed - unadded
+        if self.caches_dropped:
+            parent.caches_dropped = True
+        else:
+            recached = self.inst_added & parent.inst_evicted
+            parent.inst_evicted -= recached
+            parent.inst_added |= self.inst_added - recached
+            uncached = self.inst_evicted & parent.inst_added
+            parent.inst_added -= uncached
+            parent.inst_evicted |= self.inst_evicted - uncached
+
+
 class InstallabilityTester(object):
 
     def __init__(self, universe, suite_contents):
@@ -45,6 +83,11 @@ class InstallabilityTester(object):
         # Cache of packages known to be broken - we deliberately do not
         # include "broken" in it.  See _optimize for more info.
         self._cache_broken = set()
+        # The subset of _cache_broken that is broken because of a dependency
+        # without any candidates (or a conflict with the essential set).
+        # Only these can be fixed by an added package through a chain of
+        # broken reverse dependencies (see add_binary).
+        self._cache_broken_by_deps = set()
         # Cache of packages known to be installable
         self._cache_inst = set()
         # Per "arch" cache of the "minimal" (possibly incomplete)
@@ -62,13 +105,63 @@ class InstallabilityTester(object):
         add_transitive_dependencies_flatten(universe, essential_w_transitive_deps)
         self._cache_essential_transitive_dependencies = essential_w_transitive_deps
 
-    def compute_installability(self):
+        # Stack of _TesterLayer (see push_layer)
+        self._layers = []
+
+    def push_layer(self):
+        """Start recording the changes, so they can be undone by discard_layer"""
+        self._layers.append(_TesterLayer(self._cache_broken, self._cache_broken_by_deps, self._cache_ess))
+
+    def discard_layer(self):
+        """Restore the suite contents and caches from the time of the last push_layer"""
+        layer = self._layers.pop()
+        suite_contents = self._suite_contents
+        cbroken = self._cache_broken
+        suite_contents -= layer.added
+        cbroken -= layer.added
+        # Packages marked as broken since then may be installable again, and
+        # the packages that were broken then are still broken
+        newly_broken = cbroken - layer.broken
+        cbroken -= newly_broken
+        suite_contents |= newly_broken
+        no_longer_broken = layer.broken - cbroken
+        suite_contents -= no_longer_broken
+        cbroken |= no_longer_broken
+        suite_contents |= layer.removed - layer.broken
+        self._cache_broken_by_deps = layer.broken_by_deps
+        self._cache_ess = layer.ess
+        if layer.caches_dropped:
+            self._cache_inst = set()
+        else:
+            self._cache_inst -= layer.inst_added
+            self._cache_inst |= layer.inst_evicted
+
+    def merge_layer(self):
+        """Keep the changes since the last push_layer (as part of the previous layer, if any)"""
+        layer = self._layers.pop()
+        if self._layers:
+            layer.merge_into(self._layers[-1])
+
+    def _cache_installable(self, pkgs):
+        """Add packages to the cache of installable packages"""
+        if self._layers:
+            layer = self._layers[-1]
+            new = set(pkgs) - self._cache_inst
+            recached = new & layer.inst_evicted
+            layer.inst_evicted -= recached
+            layer.inst_added |= new - recached
+            pkgs = new
+        self._cache_inst.update(pkgs)
+
+    def compute_installability(self, architecture=None):
         """Computes the installability of all the packages in the suite
 
         This method computes the installability of all packages in
         the suite and caches the result.  This has the advantage of
         making "is_installable" queries very fast for all packages
         in the suite.
+
+        :param architecture: If given, only the packages of this architecture are computed
         """
 
         universe = self._universe
@@ -76,7 +169,10 @@ class InstallabilityTester(object):
         cbroken = self._cache_broken
         cache_inst = self._cache_inst
         suite_contents = self._suite_contents
-        tcopy = [x for x in suite_contents]
+        if architecture is None:
+            tcopy = [x for x in suite_contents]
+        else:
+            tcopy = [x for x in suite_contents if x.architecture == architecture]
         for t in filterfalse(cache_inst.__contains__, tcopy):
             if t in cbroken:
                 continue
@@ -84,11 +180,43 @@ class InstallabilityTester(object):
             if t in universe.equivalent_packages:
                 eqv = (x for x in universe.packages_equivalent_to(t) if x in suite_contents)
                 if res:
-                    cache_inst.update(eqv)
+                    self._cache_installable(eqv)
                 else:
                     eqv_set = frozenset(eqv)
                     suite_contents -= eqv_set
                     cbroken |= eqv_set
+                    if t in self._cache_broken_by_deps:
+                        # The equivalent packages have the same relations
+                        self._cache_broken_by_deps |= eqv_set
+
+    def cached_results(self, architecture):
+        """Export the cached installability results of an architecture
+
+        The result can be passed to merge_cached_results of another tester
+        (e.g. the one in the parent of a worker process) for the same
+        universe and the same suite contents.
+
+        :param architecture: The architecture to export the results for
+        :return: An opaque (but picklable) value
+        """
+        return (frozenset(x for x in self._cache_inst if x.architecture == architecture),
+                frozenset(x for x in self._cache_broken if x.architecture == architecture),
+                frozenset(x for x in self._cache_broken_by_deps if x.architecture == architecture),
+                self._cache_ess.get(architecture))
+
+    def merge_cached_results(self, architecture, results):
+        """Import cached installability results from cached_results
+
+        :param architecture: The architecture the results were exported for
+        :param results: The return value of cached_results
+        """
+        installable, broken, broken_by_deps, ess = results
+        self._cache_installable(installable)
+        self._cache_broken |= broken
+        self._cache_broken_by_deps |= broken_by_deps & broken
+        self._suite_contents -= broken
+        if ess is not None and architecture not in self._cache_ess:
+            self._cache_ess[architecture] = ess
 
     @property
     def stats(self):
@@ -118,6 +246,14 @@ class InstallabilityTester(object):
         """
         yield from (x for x in pkgs if x in self._suite_contents)
 
+    def intersect_with_the_suite(self, pkgs):
+        """Find the packages of a given collection that are in the suite
+
+        :param pkgs: An iterable of package ids
+        :return: A new set of the package ids that are in the suite
+        """
+        return self._suite_contents.intersection(pkgs)
+
     def add_binary(self, pkg_id):
         """Add a binary package to the suite
 
@@ -130,21 +266,27 @@ class InstallabilityTester(object):
         if pkg_id not in self._universe:  # pragma: no cover
             raise KeyError(str(pkg_id))
 
+        if self._layers and pkg_id not in self._suite_contents and pkg_id not in self._cache_broken:
+            layer = self._layers[-1]
+            if pkg_id in layer.removed:
+                layer.removed.remove(pkg_id)
+            else:
+                layer.added.add(pkg_id)
+
         if pkg_id in self._universe.broken_packages:
             self._suite_contents.add(pkg_id)
         elif pkg_id not in self._suite_contents:
             self._suite_contents.add(pkg_id)
-            if self._cache_inst:
-                self._stats.cache_drops += 1
-            self._cache_inst = set()
-            if self._cache_broken:
-                # Re-add broken packages as some of them may now be installable
-                self._suite_contents |= self._cache_broken
-                self._cache_broken = set()
             if pkg_id in self._cache_essential_transitive_dependencies and pkg_id.architecture in self._cache_ess:
                 # Adds new possibly pseudo-essential => "pseudo-essential" set needs to be
-                # recomputed
+                # recomputed and that affects every package on the architecture
                 del self._cache_ess[pkg_id.architecture]
+                self._drop_caches()
+            elif self._cache_broken:
+                # Adding a package cannot make an installable package uninstallable
+                # (unless it is pseudo-essential).  However, it can fix broken
+                # packages that (transitively) depend on it.
+                self._readd_broken_packages(pkg_id)
 
         return True
 
@@ -159,24 +301,106 @@ class InstallabilityTester(object):
         if pkg_id not in self._universe:  # pragma: no cover
             raise KeyError(str(pkg_id))
 
+        if self._layers and (pkg_id in self._suite_contents or pkg_id in self._cache_broken):
+            layer = self._layers[-1]
+            if pkg_id in layer.added:
+                layer.added.remove(pkg_id)
+            else:
+                layer.removed.add(pkg_id)
+
         self._cache_broken.discard(pkg_id)
+        self._cache_broken_by_deps.discard(pkg_id)
 
         if pkg_id in self._suite_contents:
             self._suite_contents.remove(pkg_id)
             if pkg_id.architecture in self._cache_ess and pkg_id in self._cache_ess[pkg_id.architecture][0]:
                 # Removes a package from the "pseudo-essential set"
                 del self._cache_ess[pkg_id.architecture]
+                self._drop_caches()
+                return True
 
             if not self._universe.reverse_dependencies_of(pkg_id):
                 # no reverse relations - safe
                 return True
             if pkg_id not in self._universe.broken_packages and pkg_id in self._cache_inst:
-                # It is in our cache (and not guaranteed to be broken) - throw out the cache
-                self._cache_inst = set()
-                self._stats.cache_drops += 1
+                # It is in our cache (and not guaranteed to be broken) - evict everything
+                # that might have relied on it
+                self._evict_reverse_dependencies(pkg_id)
 
         return True
 
+    def _drop_caches(self):
+        """Forget all cached installability results"""
+        if self._cache_inst:
+            self._stats.cache_drops += 1
+        if self._layers:
+            self._layers[-1].caches_dropped = True
+        self._cache_inst = set()
+        if self._cache_broken:
+            # Re-add broken packages as some of them may now be installable
+            self._suite_contents |= self._cache_broken
+            self._cache_broken = set()
+            self._cache_broken_by_deps = set()
+
+    def _evict_reverse_dependencies(self, pkg_id):
+        """Remove the cached installable packages that may depend on pkg_id
+
+        Whenever a package is cached as installable, so are all the packages
+        used to install it.  Therefore, only cached packages can have pkg_id
+        in their installation set and it suffices to follow the reverse
+        dependencies through the cache.
+        """
+        universe = self._universe
+        cache_inst = self._cache_inst
+        cache_inst.discard(pkg_id)
+        evicted = [pkg_id]
+        queue = [pkg_id]
+        for cur in iter_except(queue.pop, IndexError):
+            for rdep in universe.reverse_dependencies_of(cur):
+                if rdep in cache_inst:
+                    cache_inst.remove(rdep)
+                    queue.append(rdep)
+                    evicted.append(rdep)
+        if self._layers:
+            layer = self._layers[-1]
+            for evicted_pkg_id in evicted:
+                if evicted_pkg_id in layer.inst_added:
+                    layer.inst_added.remove(evicted_pkg_id)
+                else:
+                    layer.inst_evicted.add(evicted_pkg_id)
+        self._stats.cache_partial_invalidations += 1
+        self._stats.cache_evicted += len(evicted)
+
+    def _readd_broken_packages(self, pkg_id):
+        """Move the broken packages that pkg_id may fix back into the suite
+
+        A package in _cache_broken_by_deps is broken because one of its
+        dependencies cannot be satisfied by any non-broken package (or because
+        it conflicts with the essential set), so it can only be fixed by
+        pkg_id through a chain of broken reverse dependencies.  Any other
+        broken package (e.g. one that failed due to a conflict) may be fixed
+        through packages that are not broken, so these are all moved back.
+        """
+        universe = self._universe
+        cache_broken = self._cache_broken
+        suite_contents = self._suite_contents
+        queue = [pkg_id]
+        queue.extend(cache_broken - self._cache_broken_by_deps)
+        cache_broken.difference_update(queue)
+        suite_contents.update(queue)
+        readded = len(queue) - 1
+        for cur in iter_except(queue.pop, IndexError):
+            for rdep in universe.reverse_dependencies_of(cur):
+                if rdep in cache_broken:
+                    cache_broken.remove(rdep)
+                    suite_contents.add(rdep)
+                    queue.append(rdep)
+                    readded += 1
+        self._cache_broken_by_deps &= cache_broken
+        if readded:
+            self._stats.cache_partial_invalidations += 1
+            self._stats.cache_broken_readded += readded
+
     def is_installable(self, pkg_id):
         """Test if a package is installable in this package set
 
@@ -244,6 +468,7 @@ class InstallabilityTester(object):
                 # t conflicts with something in the essential set or the essential
                 # set conflicts with t - either way, t is f***ed
                 cbroken.add(t)
+                self._cache_broken_by_deps.add(t)
                 suite_contents.remove(t)
                 stats.conflicts_essential += 1
                 return False
@@ -341,7 +566,7 @@ class InstallabilityTester(object):
 
         if verdict:
             # if t is installable, then so are all packages in musts
-            self._cache_inst.update(musts)
+            self._cache_installable(musts)
             stats.solved_installable += 1
         else:
             stats.solved_uninstallable += 1
@@ -470,6 +695,7 @@ class InstallabilityTester(object):
                         # cur's dependency cannot be satisfied even if never was empty.
                         # This means that cur itself is broken (as well).
                         cbroken.add(cur)
+                        self._cache_broken_by_deps.add(cur)
                         suite_contents.remove(cur)
                     return False
                 if len(candidates) == 1:
@@ -586,6 +812,9 @@ class InstallabilityStats(object):
         self.cache_hits = 0
         self.cache_misses = 0
         self.cache_drops = 0
+        self.cache_partial_invalidations = 0
+        self.cache_evicted = 0
+        self.cache_broken_readded = 0
         self.backtrace_restore_point_created = 0
         self.backtrace_restore_point_used = 0
         self.backtrace_last_option = 0
@@ -604,6 +833,7 @@ class InstallabilityStats(object):
         formats = [
             "Requests - is_installable: {is_installable_calls}",
             "Cache - hits: {cache_hits}, misses: {cache_misses}, drops: {cache_drops}",
+            "Cache invalidation - partial: {cache_partial_invalidations}, evicted: {cache_evicted}, broken re-added: {cache_broken_readded}",  # nopep8
             "Choices - pre-solved: {choice_presolved}, No RP: {choice_resolved_without_restore_point}",
             "Backtrace - RP created: {backtrace_restore_point_created}, RP used: {backtrace_restore_point_used}, reached last option: {backtrace_last_option}",  # nopep8
             "Solved - installable: {solved_installable}, uninstallable: {solved_uninstallable}, conflicts essential: {conflicts_essential}",  # nopep8
@@ -0,0 +1,162 @@
+import hashlib
+import logging
+import os
+import pickle
+
+from britney2.utils import add_transitive_dependencies_flatten, iter_except
+
+
+# BinaryPackageIds are tuples of strings
+_pkg_id_str = '/'.join
+
+
+class WarmStartCache(object):
+    """Installability results of a previous run, reused at start up
+
+    The cache stores the non-installable report and the cached results of
+    the installability tester together with a digest of the relations of
+    every package in the target suite.  When it is loaded, the results of
+    packages that (transitively) depend on a package that was added,
+    removed or whose relations changed since then are discarded, so only
+    those have to be computed again.  Any change to the (pseudo-)essential
+    set of an architecture discards all results of that architecture.
+    """
+
+    VERSION = 2
+
+    def __init__(self, filename, universe, inst_tester, pkg_ids, architectures, nobreakall_arches):
+        """Create a warm start cache
+
+        :param filename: The file the cache is read from and written to
+        :param universe: The BinaryPackageUniverse of this run
+        :param inst_tester: The InstallabilityTester of this run
+        :param pkg_ids: The ids of all binary packages in the target suite
+        :param architectures: List of architectures
+        :param nobreakall_arches: List of architectures where arch:all packages must be installable
+        """
+        self._filename = filename
+        self._universe = universe
+        self._inst_tester = inst_tester
+        self._architectures = list(architectures)
+        self._config = (sorted(architectures), sorted(nobreakall_arches))
+        self._packages = {pkg_id: self._relations_digest(pkg_id) for pkg_id in pkg_ids}
+        self._fingerprint = self._compute_fingerprint()
+        self._is_current = False
+        logger_name = ".".join((self.__class__.__module__, self.__class__.__name__))
+        self.logger = logging.getLogger(logger_name)
+
+        self.changed_packages = 0
+        self.reused_results = 0
+        self.discarded_results = 0
+
+    def _relations_digest(self, pkg_id):
+        universe = self._universe
+        dependencies = sorted(sorted(map(_pkg_id_str, clause)) for clause in universe.dependencies_of(pkg_id))
+        conflicts = sorted(map(_pkg_id_str, universe.negative_dependencies_of(pkg_id)))
+        broken = pkg_id in universe.broken_packages
+        data = repr((dependencies, conflicts, broken)).encode('utf-8')
+        return hashlib.blake2b(data, digest_size=16).digest()
+
+    def _compute_fingerprint(self):
+        fingerprint = hashlib.blake2b(repr(self._config).encode('utf-8'))
+        for pkg_id in sorted(self._packages):
+            fingerprint.update(_pkg_id_str(pkg_id).encode('utf-8'))
+            fingerprint.update(self._packages[pkg_id])
+        return fingerprint.hexdigest()
+
+    @property
+    def fingerprint(self):
+        """A digest of the target suite (and its relations)"""
+        return self._fingerprint
+
+    def load(self):
+        """Load the results of the previous run into the installability tester
+
+        :return: The non-installable report of the previous run if the target
+          suite has not changed since then, None otherwise.
+        """
+        try:
+            with open(self._filename, 'rb') as fd:
+                data = pickle.load(fd)
+        except FileNotFoundError:
+            self.logger.info("No warm start cache at %s", self._filename)
+            return None
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError) as e:
+            self.logger.warning("Ignoring unreadable warm start cache %s: %s", self._filename, e)
+            return None
+
+        if not isinstance(data, dict) or data.get('version') != self.VERSION:
+            self.logger.info("Ignoring warm start cache %s from an incompatible version", self._filename)
+            return None
+        if data['config'] != self._config:
+            self.logger.info("Ignoring warm start cache %s for different architectures", self._filename)
+            return None
+
+        universe = self._universe
+        inst_tester = self._inst_tester
+        old_packages = data['packages']
+        new_packages = self._packages
+        changed = {pkg_id for pkg_id, digest in new_packages.items() if old_packages.get(pkg_id) != digest}
+        # Packages that are no longer in the universe at all show up as a
+        # change of the relations of their reverse dependencies
+        changed.update(pkg_id for pkg_id in old_packages if pkg_id not in new_packages and pkg_id in universe)
+        self.changed_packages = len(changed)
+
+        affected = set(changed)
+        queue = list(changed)
+        for cur in iter_except(queue.pop, IndexError):
+            for rdep in universe.reverse_dependencies_of(cur):
+                if rdep not in affected:
+                    affected.add(rdep)
+                    queue.append(rdep)
+
+        essential = set(universe.essential_packages)
+        add_transitive_dependencies_flatten(universe, essential)
+        stale_archs = {pkg_id.architecture for pkg_id in changed if pkg_id in essential}
+
+        for arch in self._architectures:
+            installable, broken, broken_by_deps, ess = data['results'][arch]
+            if arch in stale_archs:
+                self.discarded_results += len(installable) + len(broken)
+                continue
+            valid_installable = installable - affected
+            valid_broken = broken - affected
+            self.reused_results += len(valid_installable) + len(valid_broken)
+            self.discarded_results += len(installable) + len(broken) - len(valid_installable) - len(valid_broken)
+            inst_tester.merge_cached_results(arch, (valid_installable, valid_broken, broken_by_deps - affected, ess))
+
+        if data['fingerprint'] == self._fingerprint:
+            self._is_current = True
+            return data['nuninst']
+        return None
+
+    def save(self, nuninst):
+        """Store the results of this run
+
+        This must be done before the target suite is changed (i.e. before any
+        migration is attempted).  Nothing is written if the cache loaded by
+        load was already up to date.
+
+        :param nuninst: The non-installable report of the target suite
+        """
+        if self._is_current:
+            return
+        inst_tester = self._inst_tester
+        data = {
+            'version': self.VERSION,
+            'config': self._config,
+            'fingerprint': self._fingerprint,
+            'packages': self._packages,
+            'results': {arch: inst_tester.cached_results(arch) for arch in self._architectures},
+            'nuninst': nuninst,
+        }
+        tmp_filename = self._filename + '.new'
+        with open(tmp_filename, 'wb') as fd:
+            pickle.dump(data, fd, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_filename, self._filename)
+        self._is_current = True
+
+    def stats(self):
+        return ["Changed packages: %d" % self.changed_packages,
+                "Reused results: %d, discarded results: %d" % (self.reused_results, self.discarded_results),
+                ]
@@ -1,11 +1,13 @@
 import apt_pkg
 import contextlib
 import copy
+from functools import partial
+from itertools import count
 
 from britney2.transaction import MigrationTransactionState
 from britney2.utils import (
     MigrationConstraintException, compute_reverse_tree, check_installability, clone_nuninst,
-    find_smooth_updateable_binaries,
+    find_smooth_updateable_binaries, map_in_forked_processes,
 )
 
 
@@ -36,8 +38,19 @@ def is_nuninst_worse(must_be_installable, nuninst_now_arch, nuninst_after_arch,
     return False
 
 
+def _check_installability_in_worker(target_suite, updates, nobreakall_arches, nuninst, arch):
+    check_installability(target_suite, target_suite.binaries, arch, updates,
+                         arch in nobreakall_arches, nuninst)
+    return nuninst[arch], nuninst[arch + "+all"]
+
+
 class MigrationManager(object):
 
+    # Minimum number of affected packages before the installability checks
+    # of a migration are spread over several processes (forking the process
+    # is not free, so it is only worth it for large migrations).
+    PARALLEL_CHECK_THRESHOLD = 1000
+
     def __init__(self, options, suite_info, all_binaries, pkg_universe,
                  constraints, allow_uninst, migration_item_factory, hints):
         self.options = options
@@ -50,6 +63,15 @@ class MigrationManager(object):
         self._transactions = []
         self._all_architectures = frozenset(self.options.architectures)
         self._migration_item_factory = migration_item_factory
+        # Identifies the state of the target suite; a new token is taken for
+        # every change and a rollback restores the token from before the change
+        self._state_tokens = count(1)
+        self._state_token = 0
+        # Results of compute_groups for the state of _groups_cache_token
+        self._groups_cache = {}
+        self._groups_cache_token = 0
+        self.groups_cache_hits = 0
+        self.groups_cache_misses = 0
 
     @property
     def current_transaction(self):
@@ -94,7 +116,28 @@ class MigrationManager(object):
 
         Unlike migrate_items_to_target_suite, this will not modify
         any data structure.
+
+        Unless "removals" is given, the result is cached until the
+        target suite changes, so the returned sets must not be
+        modified.
         """
+        if removals:
+            return self._compute_groups(item, allow_smooth_updates, removals)
+        if self._groups_cache_token != self._state_token:
+            self._groups_cache.clear()
+            self._groups_cache_token = self._state_token
+        key = (item, allow_smooth_updates)
+        try:
+            result = self._groups_cache[key]
+        except KeyError:
+            self.groups_cache_misses += 1
+            result = self._compute_groups(item, allow_smooth_updates, removals)
+            self._groups_cache[key] = result
+        else:
+            self.groups_cache_hits += 1
+        return result
+
+    def _compute_groups(self, item, allow_smooth_updates, removals):
         # local copies for better performances
         item_package = item.package
         target_suite = self.suite_info.target_suite
@@ -248,6 +291,9 @@ class MigrationManager(object):
 
         affected_all = set()
         updated_binaries = set()
+        # Compute the groups for the current state before it is changed
+        source_name, updates, rms, smooth_updates = self.compute_groups(item, removals=removals)
+        self._state_token = next(self._state_tokens)
 
         # local copies for better performance
         source_suite = item.suite
@@ -257,7 +303,6 @@ class MigrationManager(object):
         pkg_universe = self.pkg_universe
         transaction = self.current_transaction
 
-        source_name, updates, rms, smooth_updates = self.compute_groups(item, removals=removals)
         sources_t = target_suite.sources
         # Handle the source package
         old_source = sources_t.get(source_name)
@@ -299,8 +344,12 @@ class MigrationManager(object):
                 key = (provided_pkg, parch)
                 if key not in undo['virtual']:
                     undo['virtual'][key] = provides_t_a[provided_pkg].copy()
-                provides_t_a[provided_pkg].remove((binary, prov_version))
-                if not provides_t_a[provided_pkg]:
+                # replace the set rather than changing it, as it may be shared with
+                # a layer of the target suite that must be kept as is
+                providers = provides_t_a[provided_pkg] - {(binary, prov_version)}
+                if providers:
+                    provides_t_a[provided_pkg] = providers
+                else:
                     del provides_t_a[provided_pkg]
             # for source removal, the source is already gone
             if source_name in sources_t:
@@ -365,7 +414,7 @@ class MigrationManager(object):
                     if key not in undo['virtual']:
                         restore_as = provides_t_a[provided_pkg].copy() if provided_pkg in provides_t_a else None
                         undo['virtual'][key] = restore_as
-                    provides_t_a[provided_pkg].add((binary, prov_version))
+                    provides_t_a[provided_pkg] = provides_t_a.get(provided_pkg, set()) | {(binary, prov_version)}
                 if not equivalent_replacement:
                     # all the reverse dependencies are affected by the change
                     affected_all.add(updated_pkg_id)
@@ -436,13 +485,27 @@ class MigrationManager(object):
 
         nuninst_after = clone_nuninst(nuninst_now, packages_s=packages_t, architectures=affected_architectures)
         must_be_installable = self.constraints['keep-installable']
+        processes = self.options.installability_processes
+        precomputed = {}
+
+        if processes > 1 and len(affected_architectures) > 1 and len(affected_all) >= self.PARALLEL_CHECK_THRESHOLD:
+            # Check all architectures up front in worker processes.  The results are only
+            # used as far as the loop below gets, so the outcome is the same as when they
+            # are checked one at a time.
+            archs = sorted(affected_architectures)
+            worker = partial(_check_installability_in_worker, target_suite, affected_all,
+                             nobreakall_arches, nuninst_after)
+            precomputed = dict(zip(archs, map_in_forked_processes(worker, archs, processes)))
 
         # check the affected packages on all the architectures
         for arch in sorted(affected_architectures):
             check_archall = arch in nobreakall_arches
 
-            check_installability(target_suite, packages_t, arch, affected_all,
-                                 check_archall, nuninst_after)
+            if arch in precomputed:
+                nuninst_after[arch], nuninst_after[arch + "+all"] = precomputed[arch]
+            else:
+                check_installability(target_suite, packages_t, arch, affected_all,
+                                     check_archall, nuninst_after)
 
             # if the uninstallability counter is worse than before, break the loop
             if stop_on_first_regression:
@@ -461,6 +524,7 @@ class MigrationManager(object):
     @contextlib.contextmanager
     def start_transaction(self):
         tmts = MigrationTransactionState(self.suite_info, self.all_binaries, self.current_transaction)
+        state_token = self._state_token
         self._transactions.append(tmts)
         try:
             yield tmts
@@ -470,4 +534,7 @@ class MigrationManager(object):
             raise
         finally:
             self._transactions.pop()
+            if tmts.is_rolled_back:
+                # The target suite is back in the state it was in before
+                self._state_token = state_token
         assert tmts.is_rolled_back or tmts.is_committed
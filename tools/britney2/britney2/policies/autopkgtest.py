@@ -18,6 +18,7 @@
 
 import calendar
 import collections
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
 from enum import Enum
 import os
@@ -27,9 +28,12 @@ import io
 import itertools
 import re
 import sys
+import threading
 import time
+import http.client
+import urllib.error
 import urllib.parse
-from urllib.request import urlopen
+from urllib.request import getproxies, proxy_bypass, urlopen
 from functools import total_ordering
 
 import apt_pkg
@@ -38,6 +42,7 @@ import britney2.hints
 
 from britney2 import SuiteClass
 from britney2.policies.policy import BasePolicy, PolicyVerdict
+from britney2.policies.testresults import AutopkgtestResults, ResultsDatabase
 from britney2.utils import iter_except
 
 
@@ -124,8 +129,27 @@ class AutopkgtestPolicy(BasePolicy):
         # trigger -> src -> [arch]
         self.pending_tests = None
         self.pending_tests_file = os.path.join(self.state_dir, 'autopkgtest-pending.json')
+        # requests sent since pending_tests_file was last written, one
+        # [trigger, src, arch] per line
+        self.pending_journal_file = self.pending_tests_file + '.journal'
+        # AMQP requests waiting to be published: (queue, body, pending entry)
+        self._queued_requests = []
         self.testsuite_triggers = {}
         self.result_in_baseline_cache = collections.defaultdict(dict)
+        # arch -> binary package (in the target suite) -> its source, if that
+        # has an autopkgtest
+        self.tested_source_of_binary = {}
+        # arch -> binary package -> sources with an autopkgtest (and binaries
+        # on arch) in the target suite whose tests it triggers
+        self.tested_triggers_of_binary = {}
+        # arch -> binary (id) -> the sources with tests for it, as returned
+        # by tests_for_binary
+        self.tests_for_binary_cache = collections.defaultdict(dict)
+        self.tests_for_binary_cache_hits = 0
+        self.tests_for_binary_cache_misses = 0
+        # changes of the results and pending tests (and test requests) in a
+        # worker process, to be replayed in the main process (see start_worker)
+        self._worker_log = None
 
         # results map: trigger -> src -> arch -> [passed, version, run_id, seen]
         # - trigger is "source/version" of an unstable package that triggered
@@ -136,11 +160,14 @@ class AutopkgtestPolicy(BasePolicy):
         #   a given src/arch.
         # - "seen" is an approximate time stamp of the test run. How this is
         #   deduced depends on the interface used.
-        self.test_results = {}
+        self.test_results = AutopkgtestResults()
+        self.results_db = None
         if self.options.adt_shared_results_cache:
             self.results_cache_file = self.options.adt_shared_results_cache
         else:
             self.results_cache_file = os.path.join(self.state_dir, 'autopkgtest-results.cache')
+            if getattr(self.options, 'adt_results_db', None):
+                self.results_db = ResultsDatabase(self.options.adt_results_db)
 
         try:
             self.options.adt_ppas = self.options.adt_ppas.strip().split()
@@ -148,6 +175,8 @@ class AutopkgtestPolicy(BasePolicy):
             self.options.adt_ppas = []
 
         self.swift_container = 'autopkgtest-' + options.series
+        # connections to swift, kept open per downloading thread
+        self._swift_connections = threading.local()
         if self.options.adt_ppas:
             self.swift_container += '-' + options.adt_ppas[-1].replace('/', '-')
 
@@ -174,6 +203,9 @@ class AutopkgtestPolicy(BasePolicy):
                 for trigger in data.testsuite_triggers:
                     self.testsuite_triggers.setdefault(trigger, set()).add(src)
         target_suite_name = self.suite_info.target_suite.name
+        self.logger.info('Building map of the binaries with tests in %s', target_suite_name)
+        for arch in self.adt_arches:
+            self.build_tested_binaries_map(arch)
 
         os.makedirs(self.state_dir, exist_ok=True)
         self.read_pending_tests()
@@ -192,12 +224,30 @@ class AutopkgtestPolicy(BasePolicy):
             # Make adt_ignore_failure_for_new_tests optional
             setattr(self.options, 'adt_ignore_failure_for_new_tests', False)
 
+        if not hasattr(self.options, 'adt_swift_fetch_threads'):
+            self.options.adt_swift_fetch_threads = 1
+        else:
+            self.options.adt_swift_fetch_threads = int(self.options.adt_swift_fetch_threads)
+
+        if not hasattr(self.options, 'adt_amqp_batch_size'):
+            self.options.adt_amqp_batch_size = 100
+        else:
+            self.options.adt_amqp_batch_size = max(1, int(self.options.adt_amqp_batch_size))
+
         # read the cached results that we collected so far
-        if os.path.exists(self.results_cache_file):
+        if self.results_db is not None and self.results_db.exists():
+            self.test_results = self.check_and_upgrade_cache(self.results_db.load())
+            self.logger.info('Read previous results from %s', self.options.adt_results_db)
+        elif os.path.exists(self.results_cache_file):
             with open(self.results_cache_file) as f:
-                test_results = json.load(f)
+                test_results = AutopkgtestResults.from_nested(json.load(f))
                 self.test_results = self.check_and_upgrade_cache(test_results)
             self.logger.info('Read previous results from %s', self.results_cache_file)
+            if self.results_db is not None:
+                # One-time migration; the JSON file is not used anymore afterwards
+                self.logger.info('Moving the results from %s to %s', self.results_cache_file,
+                                 self.options.adt_results_db)
+                self.test_results.mark_all_changed()
         else:
             self.logger.info('%s does not exist, re-downloading all results from swift', self.results_cache_file)
 
@@ -253,6 +303,12 @@ class AutopkgtestPolicy(BasePolicy):
         if self.options.adt_baseline == 'reference':
             self.filter_old_results()
 
+        # Fetching the results of the pending tests one at a time when the
+        # policy gets to them is dominated by the round trips to swift, so
+        # download them all upfront in parallel
+        if not self.options.adt_swift_url.startswith('file://') and self.options.adt_swift_fetch_threads > 1:
+            self.prefetch_swift_results(self.options.adt_swift_url, self.pending_pairs_to_fetch())
+
         # we need sources, binaries, and installability tester, so for now
         # remember the whole britney object
         self.britney = britney
@@ -270,7 +326,12 @@ class AutopkgtestPolicy(BasePolicy):
             creds = urllib.parse.urlsplit(amqp_url, allow_fragments=False)
             self.amqp_con = amqp.Connection(creds.hostname, userid=creds.username,
                                             password=creds.password)
+            self.amqp_message = amqp.Message
             self.amqp_channel = self.amqp_con.channel()
+            # requests are published in batches, each in a transaction, so
+            # that the broker confirms the whole batch at once (see
+            # flush_test_requests)
+            self.amqp_channel.tx_select()
             self.logger.info('Connected to AMQP server')
         elif amqp_url.startswith('file://'):
             # or in Debian and in testing mode, adt_amqp will be a file:// URL
@@ -280,7 +341,7 @@ class AutopkgtestPolicy(BasePolicy):
             raise RuntimeError('Unknown ADT_AMQP schema %s' % amqp_url.split(':', 1)[0])
 
     def check_and_upgrade_cache(self, test_results):
-        for result in all_leaf_results(test_results):
+        for _, result in test_results.items():
             try:
                 result[0] = Result[result[0]]
             except KeyError:
@@ -309,14 +370,18 @@ class AutopkgtestPolicy(BasePolicy):
 
         test_results = self.test_results
 
-        for (trigger, trigger_data) in test_results.items():
-            for (src, results) in trigger_data.items():
-                for (arch, result) in results.items():
-                    if trigger == REF_TRIG and \
-                      result[3] < self._now - self.options.adt_reference_max_age:
-                        result[0] = mark_result_as_old(result[0])
-                    elif not self.test_version_in_any_suite(src, result[1]):
-                        result[0] = mark_result_as_old(result[0])
+        for (key, result) in list(test_results.items()):
+            (trigger, src, arch) = key
+            if (trigger == REF_TRIG and
+                    result[3] < self._now - self.options.adt_reference_max_age):
+                old_result = mark_result_as_old(result[0])
+            elif not self.test_version_in_any_suite(src, result[1]):
+                old_result = mark_result_as_old(result[0])
+            else:
+                continue
+            if old_result != result[0]:
+                result[0] = old_result
+                test_results[key] = result
 
     def test_version_in_any_suite(self, src, version):
         '''Check if the mentioned version of src is found in a suite
@@ -351,19 +416,51 @@ class AutopkgtestPolicy(BasePolicy):
         with open(self.pending_tests_file + '.new', 'w') as f:
             json.dump(self.pending_tests, f, indent=2)
         os.rename(self.pending_tests_file + '.new', self.pending_tests_file)
+        # the requests in the journal are included now
+        try:
+            os.unlink(self.pending_journal_file)
+        except FileNotFoundError:
+            pass
+
+    def journal_pending_tests(self, entries):
+        '''Append newly pending tests to the journal of pending_tests_file
+
+        The journal is read along with pending_tests_file (see
+        read_pending_tests) and compacted into it by save_pending_json.
+        '''
+        with open(self.pending_journal_file, 'a') as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def excuses_computed(self):
+        # request the tests of the excuses now rather than at the end of the run
+        self.flush_test_requests()
 
     def save_state(self, britney):
         super().save_state(britney)
 
-        # update the results on-disk cache, unless we are using a r/o shared one
+        self.logger.info('Tests for binaries: %d cache hits, %d misses',
+                         self.tests_for_binary_cache_hits, self.tests_for_binary_cache_misses)
+        self.flush_test_requests()
+
+        # update the results on-disk cache, unless we are using a r/o shared
+        # one (the results database is not used in that case either)
         if not self.options.adt_shared_results_cache:
-            self.logger.info('Updating results cache')
-            test_results = deepcopy(self.test_results)
-            for result in all_leaf_results(test_results):
-                result[0] = result[0].name
-            with open(self.results_cache_file + '.new', 'w') as f:
-                json.dump(test_results, f, indent=2)
-            os.rename(self.results_cache_file + '.new', self.results_cache_file)
+            if self.results_db is not None:
+                self.logger.info('Updating results database (%d new or changed results)',
+                                 len(self.test_results.changed()))
+                self.results_db.write(self.test_results)
+                self.test_results.clear_changed()
+            else:
+                self.logger.info('Updating results cache')
+                test_results = deepcopy(self.test_results.as_nested())
+                for result in all_leaf_results(test_results):
+                    result[0] = result[0].name
+                with open(self.results_cache_file + '.new', 'w') as f:
+                    json.dump(test_results, f, indent=2)
+                os.rename(self.results_cache_file + '.new', self.results_cache_file)
 
         self.save_pending_json()
 
@@ -703,6 +800,66 @@ class AutopkgtestPolicy(BasePolicy):
             (result, real_ver, run_id, url) = self.pkg_test_result(testsrc, testver, arch, trigger)
             pkg_arch_result[(testsrc, real_ver)][arch] = (result, run_id, url)
 
+    def build_tested_binaries_map(self, arch):
+        '''Map the binaries of the target suite on arch to the sources with tests for them
+
+        Fills tested_source_of_binary and tested_triggers_of_binary for arch
+        (see tests_for_binary).  The target suite doesn't change while the
+        excuses are computed, so this is only done once.
+        '''
+        target_suite = self.suite_info.target_suite
+        sources_info = target_suite.sources
+        tested_sources = set()
+        for (src, srcinfo) in sources_info.items():
+            if 'autopkgtest' in srcinfo.testsuite or self.has_autodep8(srcinfo):
+                tested_sources.add(src)
+
+        tested_source_of_binary = {}
+        for (pkg_name, binary) in target_suite.binaries[arch].items():
+            if binary.source in tested_sources:
+                tested_source_of_binary[pkg_name] = binary.source
+
+        tested_triggers_of_binary = {}
+        for (pkg_name, tdep_srcs) in self.testsuite_triggers.items():
+            tested = frozenset(tdep_src for tdep_src in tdep_srcs
+                               if tdep_src in tested_sources and
+                               any(pkg_id.architecture == arch for pkg_id in sources_info[tdep_src].binaries))
+            if tested:
+                tested_triggers_of_binary[pkg_name] = tested
+
+        self.tested_source_of_binary[arch] = tested_source_of_binary
+        self.tested_triggers_of_binary[arch] = tested_triggers_of_binary
+
+    def tests_for_binary(self, binary, arch):
+        '''Sources in the target suite with tests that a change of binary should trigger on arch
+
+        Returns a pair of sets: the sources of the direct reverse dependencies
+        of binary and the sources whose tests are triggered by it
+        (Testsuite-Triggers), in both cases only those that have an
+        autopkgtest and binaries on arch.
+        '''
+        cache = self.tests_for_binary_cache[arch]
+        try:
+            tests = cache[binary]
+            self.tests_for_binary_cache_hits += 1
+            return tests
+        except KeyError:
+            self.tests_for_binary_cache_misses += 1
+
+        if arch not in self.tested_source_of_binary:
+            self.build_tested_binaries_map(arch)
+        tested_source_of_binary = self.tested_source_of_binary[arch]
+        rdep_srcs = set()
+        for rdep in self.britney.pkg_universe.reverse_dependencies_of(binary):
+            try:
+                rdep_srcs.add(tested_source_of_binary[rdep.package_name])
+            except KeyError:
+                pass
+        tdep_srcs = self.tested_triggers_of_binary[arch].get(binary.package_name, frozenset())
+
+        tests = cache[binary] = (frozenset(rdep_srcs), tdep_srcs)
+        return tests
+
     def tests_for_source(self, src, ver, arch, excuse):
         '''Iterate over all tests that should be run for given source and arch'''
 
@@ -748,40 +905,20 @@ class AutopkgtestPolicy(BasePolicy):
         if not self.has_built_on_this_arch_or_is_arch_all(srcinfo, arch):
             return []
 
-        pkg_universe = self.britney.pkg_universe
         # plus all direct reverse dependencies and test triggers of its
         # binaries which have an autopkgtest
+        rdep_srcs = set()
+        tdep_srcs = set()
         for binary in itertools.chain(srcinfo.binaries, extra_bins):
-            rdeps = pkg_universe.reverse_dependencies_of(binary)
-            for rdep in rdeps:
-                try:
-                    rdep_src = binaries_info[rdep.package_name].source
-                    # Don't re-trigger the package itself here; this should
-                    # have been done above if the package still continues to
-                    # have an autopkgtest in unstable.
-                    if rdep_src == src:
-                        continue
-                except KeyError:
-                    continue
-
-                rdep_src_info = sources_info[rdep_src]
-                if 'autopkgtest' in rdep_src_info.testsuite or self.has_autodep8(rdep_src_info):
-                    if rdep_src not in reported_pkgs:
-                        tests.append((rdep_src, rdep_src_info.version))
-                        reported_pkgs.add(rdep_src)
-
-            for tdep_src in self.testsuite_triggers.get(binary.package_name, set()):
-                if tdep_src not in reported_pkgs:
-                    try:
-                        tdep_src_info = sources_info[tdep_src]
-                    except KeyError:
-                        continue
-                    if 'autopkgtest' in tdep_src_info.testsuite or self.has_autodep8(tdep_src_info):
-                        for pkg_id in tdep_src_info.binaries:
-                            if pkg_id.architecture == arch:
-                                tests.append((tdep_src, tdep_src_info.version))
-                                reported_pkgs.add(tdep_src)
-                                break
+            (binary_rdep_srcs, binary_tdep_srcs) = self.tests_for_binary(binary, arch)
+            rdep_srcs.update(binary_rdep_srcs)
+            tdep_srcs.update(binary_tdep_srcs)
+        # Don't re-trigger the package itself for its reverse dependencies;
+        # this should have been done above if the package still continues to
+        # have an autopkgtest in unstable.
+        rdep_srcs.discard(src)
+        for test_src in (rdep_srcs | tdep_srcs) - reported_pkgs:
+            tests.append((test_src, sources_info[test_src].version))
 
         tests.sort(key=lambda s_v: s_v[0])
         return tests
@@ -795,43 +932,99 @@ class AutopkgtestPolicy(BasePolicy):
         if not os.path.exists(self.pending_tests_file):
             self.logger.info('No %s, starting with no pending tests', self.pending_tests_file)
             self.pending_tests = {}
-            return
-        with open(self.pending_tests_file) as f:
-            self.pending_tests = json.load(f)
-        self.logger.info('Read pending requested tests from %s: %s', self.pending_tests_file, self.pending_tests)
+        else:
+            with open(self.pending_tests_file) as f:
+                self.pending_tests = json.load(f)
+            self.logger.info('Read pending requested tests from %s: %s', self.pending_tests_file, self.pending_tests)
+
+        # tests requested after pending_tests_file was written (by a run
+        # that didn't finish)
+        if os.path.exists(self.pending_journal_file):
+            count = 0
+            with open(self.pending_journal_file) as f:
+                for line in f:
+                    try:
+                        (trigger, src, arch) = json.loads(line)
+                    except ValueError:
+                        # incomplete last line
+                        continue
+                    arch_list = self.pending_tests.setdefault(trigger, {}).setdefault(src, [])
+                    if arch not in arch_list:
+                        arch_list.append(arch)
+                        arch_list.sort()
+                        count += 1
+            self.logger.info('Read %d pending requested tests from %s', count, self.pending_journal_file)
 
     def latest_run_for_package(self, src, arch):
         '''Return latest run ID for src on arch'''
 
-        # this requires iterating over all triggers and thus is expensive;
-        # cache the results
-        try:
-            return self.latest_run_for_package._cache[src][arch]
-        except KeyError:
-            pass
+        return max((result[2] for _, result in self.test_results.results_for(src, arch)), default='')
 
-        latest_run_id = ''
-        for srcmap in self.test_results.values():
-            try:
-                run_id = srcmap[src][arch][2]
-            except KeyError:
-                continue
-            if run_id > latest_run_id:
-                latest_run_id = run_id
-        self.latest_run_for_package._cache[arch] = latest_run_id
-        return latest_run_id
+    def prefetch_swift_results(self, swift_url, pairs):
+        '''Download new results for several source package/arch pairs from swift
 
-    latest_run_for_package._cache = collections.defaultdict(dict)
+        The listings and result files are downloaded in parallel (with up to
+        ADT_SWIFT_FETCH_THREADS connections), but processed in the same way
+        and order as fetch_swift_results would for each pair in sorted order.
+        Pairs fetched here are not fetched again by fetch_swift_results.
+        '''
+        listings = []
+        for (src, arch) in sorted(pairs):
+            url = self._swift_listing_url(swift_url, src, arch)
+            if url is not None:
+                listings.append((url, src, arch))
+        if not listings:
+            return
+
+        self.logger.info('Prefetching results of %d source package/arch pairs from swift', len(listings))
+        with ThreadPoolExecutor(max_workers=self.options.adt_swift_fetch_threads) as pool:
+            results = []
+            responses = pool.map(self._swift_download_pooled, (url for (url, _, _) in listings))
+            for (url, src, arch), response in zip(listings, responses):
+                for p in self._parse_swift_listing(url, response):
+                    results.append((os.path.join(swift_url, self.swift_container, p, 'result.tar'), src, arch))
+
+            responses = pool.map(self._swift_download_pooled, (url for (url, _, _) in results))
+            for (url, src, arch), response in zip(results, responses):
+                self._process_one_result(url, src, arch, response)
+
+    def pending_pairs_to_fetch(self):
+        '''Source package/arch pairs of pending tests for current triggers'''
+        pairs = set()
+        for trigger, srcs in self.pending_tests.items():
+            (trigsrc, trigver) = trigger.split('/', 1)
+            if not any(trigsrc in suite.sources and suite.sources[trigsrc].version == trigver
+                       for suite in self.suite_info):
+                continue
+            for src, arch_list in srcs.items():
+                pairs.update((src, arch) for arch in arch_list if arch in self.adt_arches)
+        return pairs
 
     def fetch_swift_results(self, swift_url, src, arch):
         '''Download new results for source package/arch from swift'''
 
+        url = self._swift_listing_url(swift_url, src, arch)
+        if url is None:
+            return
+
+        for p in self._parse_swift_listing(url, self._swift_download(url)):
+            self.fetch_one_result(
+                os.path.join(swift_url, self.swift_container, p, 'result.tar'), src, arch)
+
+    fetch_swift_results._done = set()
+
+    def _swift_listing_url(self, swift_url, src, arch):
+        '''The URL listing the new results for src/arch (or None if already fetched)'''
+
         # Download results for one particular src/arch at most once in every
         # run, as this is expensive
         done_entry = src + '/' + arch
         if done_entry in self.fetch_swift_results._done:
-            return
+            return None
         self.fetch_swift_results._done.add(done_entry)
+        if self._worker_log is not None:
+            # don't fetch them again in the main process
+            self._worker_log.append(('fetched', (src, arch)))
 
         # prepare query: get all runs with a timestamp later than the latest
         # run_id for this package/arch; '@' is at the end of each run id, to
@@ -849,63 +1042,109 @@ class AutopkgtestPolicy(BasePolicy):
         # request new results from swift
         url = os.path.join(swift_url, self.swift_container)
         url += '?' + urllib.parse.urlencode(query)
-        f = None
+        return url
+
+    def _swift_download(self, url):
+        '''Download url
+
+        Returns a (code, content, error) tuple, where error is the IOError
+        raised by the download (if any).
+        '''
         try:
-            f = urlopen(url, timeout=30)
-            if f.getcode() == 200:
-                result_paths = f.read().decode().strip().splitlines()
-            elif f.getcode() == 204:  # No content
-                result_paths = []
-            else:
-                # we should not ever end up here as we expect a HTTPError in
-                # other cases; e. g. 3XX is something that tells us to adjust
-                # our URLS, so fail hard on those
-                raise NotImplementedError('fetch_swift_results(%s): cannot handle HTTP code %i' %
-                                          (url, f.getcode()))
+            with urlopen(url, timeout=30) as f:
+                return (f.getcode(), f.read(), None)
         except IOError as e:
+            return (None, None, e)
+
+    def _swift_download_pooled(self, url):
+        '''Download url like _swift_download (can be called from several threads)
+
+        Each thread keeps its connection to the server open between the
+        downloads.  Downloads through a proxy are left to urlopen.
+        '''
+        parts = urllib.parse.urlsplit(url)
+        if (parts.scheme not in ('http', 'https') or
+                (parts.scheme in getproxies() and not proxy_bypass(parts.hostname))):
+            return self._swift_download(url)
+
+        connections = self._swift_connections.__dict__.setdefault('connections', {})
+        key = (parts.scheme, parts.netloc)
+        path = parts.path
+        if parts.query:
+            path += '?' + parts.query
+        # The server may have closed an idle connection, so retry once with a new one
+        for attempt in range(2):
+            conn = connections.get(key)
+            if conn is None:
+                conn_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+                conn = connections[key] = conn_class(parts.netloc, timeout=30)
+            reused = conn.sock is not None
+            try:
+                conn.request('GET', path)
+                response = conn.getresponse()
+                content = response.read()
+            except (http.client.HTTPException, IOError) as e:
+                conn.close()
+                del connections[key]
+                if reused and attempt == 0:
+                    continue
+                if not isinstance(e, IOError):
+                    e = IOError(str(e))
+                return (None, None, e)
+            if 300 <= response.status < 400:
+                # let urllib follow the redirection
+                return self._swift_download(url)
+            if response.status >= 400:
+                return (None, None, urllib.error.HTTPError(url, response.status, response.reason,
+                                                           response.headers, None))
+            return (response.status, content, None)
+
+    def _parse_swift_listing(self, url, response):
+        '''Return the result paths from the swift listing downloaded from url'''
+        code, content, error = response
+        if error is not None:
+            e = error
             # 401 "Unauthorized" is swift's way of saying "container does not exist"
             if hasattr(e, 'code') and e.code == 401:
                 self.logger.info('fetch_swift_results: %s does not exist yet or is inaccessible', url)
-                return
+                return []
             # Other status codes are usually a transient
             # network/infrastructure failure. Ignoring this can lead to
             # re-requesting tests which we already have results for, so
             # fail hard on this and let the next run retry.
             self.logger.error('Failure to fetch swift results from %s: %s', url, str(e))
             sys.exit(1)
-        finally:
-            if f is not None:
-                f.close()
-
-        for p in result_paths:
-            self.fetch_one_result(
-                os.path.join(swift_url, self.swift_container, p, 'result.tar'), src, arch)
-
-    fetch_swift_results._done = set()
+        if code == 200:
+            return content.decode().strip().splitlines()
+        elif code == 204:  # No content
+            return []
+        # we should not ever end up here as we expect a HTTPError in
+        # other cases; e. g. 3XX is something that tells us to adjust
+        # our URLS, so fail hard on those
+        raise NotImplementedError('fetch_swift_results(%s): cannot handle HTTP code %i' %
+                                  (url, code))
 
     def fetch_one_result(self, url, src, arch):
         '''Download one result URL for source/arch
 
         Remove matching pending_tests entries.
         '''
-        f = None
-        try:
-            f = urlopen(url, timeout=30)
-            if f.getcode() == 200:
-                tar_bytes = io.BytesIO(f.read())
-            else:
-                raise NotImplementedError('fetch_one_result(%s): cannot handle HTTP code %i' %
-                                          (url, f.getcode()))
-        except IOError as e:
+        self._process_one_result(url, src, arch, self._swift_download(url))
+
+    def _process_one_result(self, url, src, arch, response):
+        code, content, error = response
+        if error is not None:
+            e = error
             self.logger.error('Failure to fetch %s: %s', url, str(e))
             # we tolerate "not found" (something went wrong on uploading the
             # result), but other things indicate infrastructure problems
             if hasattr(e, 'code') and e.code == 404:
                 return
             sys.exit(1)
-        finally:
-            if f is not None:
-                f.close()
+        if code != 200:
+            raise NotImplementedError('fetch_one_result(%s): cannot handle HTTP code %i' %
+                                      (url, code))
+        tar_bytes = io.BytesIO(content)
         try:
             with tarfile.open(None, 'r', tar_bytes) as tar:
                 exitcode = int(tar.extractfile('exitcode').read().strip())
@@ -954,19 +1193,63 @@ class AutopkgtestPolicy(BasePolicy):
         for trigger in result_triggers:
             self.add_trigger_to_results(trigger, src, ver, arch, run_id, seen, result)
 
-    def remove_from_pending(self, trigger, src, arch):
+    def start_worker(self):
+        self._worker_log = []
+        # only count the lookups in this worker process
+        self.tests_for_binary_cache_hits = 0
+        self.tests_for_binary_cache_misses = 0
+        # don't share the connections of the main process
+        self._swift_connections = threading.local()
+
+    def worker_state(self):
+        self._worker_log.append(('cache-stats', (self.tests_for_binary_cache_hits,
+                                                 self.tests_for_binary_cache_misses)))
+        return self._worker_log
+
+    def merge_worker_state(self, state):
+        for (action, args) in state:
+            if action == 'result':
+                self.add_trigger_to_results(*args)
+            elif action == 'done':
+                self._remove_from_pending(*args)
+            elif action == 'fetched':
+                (src, arch) = args
+                self.fetch_swift_results._done.add(src + '/' + arch)
+            elif action == 'cache-stats':
+                self.tests_for_binary_cache_hits += args[0]
+                self.tests_for_binary_cache_misses += args[1]
+            else:
+                assert action == 'request'
+                (src, arch, trigger, all_triggers, huge) = args
+                arch_list = self.pending_tests.setdefault(trigger, {}).setdefault(src, [])
+                if arch not in arch_list:
+                    arch_list.append(arch)
+                    arch_list.sort()
+                    self.send_test_request(src, arch, all_triggers, huge=huge)
+
+    def _remove_from_pending(self, trigger, src, arch):
         try:
             arch_list = self.pending_tests[trigger][src]
             arch_list.remove(arch)
-            if not arch_list:
-                del self.pending_tests[trigger][src]
-            if not self.pending_tests[trigger]:
-                del self.pending_tests[trigger]
-            self.logger.info('-> matches pending request %s/%s for trigger %s', src, arch, trigger)
         except (KeyError, ValueError):
+            return False
+        if not arch_list:
+            del self.pending_tests[trigger][src]
+        if not self.pending_tests[trigger]:
+            del self.pending_tests[trigger]
+        if self._worker_log is not None:
+            self._worker_log.append(('done', (trigger, src, arch)))
+        return True
+
+    def remove_from_pending(self, trigger, src, arch):
+        if self._remove_from_pending(trigger, src, arch):
+            self.logger.info('-> matches pending request %s/%s for trigger %s', src, arch, trigger)
+        else:
             self.logger.info('-> does not match any pending request for %s/%s', src, arch)
 
     def add_trigger_to_results(self, trigger, src, ver, arch, run_id, timestamp, status_to_add):
+        if self._worker_log is not None:
+            self._worker_log.append(('result', (trigger, src, ver, arch, run_id, timestamp, status_to_add)))
         # Ensure that we got a new enough version
         try:
             (trigsrc, trigver) = trigger.split('/', 1)
@@ -977,8 +1260,8 @@ class AutopkgtestPolicy(BasePolicy):
             self.logger.debug('test trigger %s, but run for older version %s, ignoring', trigger, ver)
             return
 
-        stored_result = self.test_results.setdefault(trigger, {}).setdefault(
-            src, {}).setdefault(arch, [Result.FAIL, None, '', 0])
+        key = (trigger, src, arch)
+        stored_result = self.test_results.setdefault(key, [Result.FAIL, None, '', 0])
 
         # reruns shouldn't flip the result from PASS or NEUTRAL to
         # FAIL, so remember the most recent version of the best result
@@ -999,6 +1282,7 @@ class AutopkgtestPolicy(BasePolicy):
             stored_result[1] = ver
             stored_result[2] = run_id
             stored_result[3] = timestamp
+            self.test_results[key] = stored_result
 
     def send_test_request(self, src, arch, triggers, huge=False):
         '''Send out AMQP request for testing src/arch for triggers
@@ -1021,14 +1305,9 @@ class AutopkgtestPolicy(BasePolicy):
 
         if self.amqp_channel:
             params = json.dumps(params)
-            self.amqp_channel.basic_publish(amqp.Message(src + '\n' + params,
-                                                         delivery_mode=2),  # persistent
-                                            routing_key=qname)
-            # we save pending.json with every request, so that if britney
-            # crashes we don't re-request tests. This is only needed when using
-            # real amqp, as with file-based submission the pending tests are
-            # returned by debci along with the results each run.
-            self.save_pending_json()
+            self._queued_requests.append((qname, src + '\n' + params, (triggers[0], src, arch)))
+            if len(self._queued_requests) >= self.options.adt_amqp_batch_size:
+                self.flush_test_requests()
         else:
             # for file-based submission, triggers are space separated
             params['triggers'] = [' '.join(params['triggers'])]
@@ -1036,6 +1315,27 @@ class AutopkgtestPolicy(BasePolicy):
             assert self.amqp_file_handle
             self.amqp_file_handle.write('%s:%s %s\n' % (qname, src, params))
 
+    def flush_test_requests(self):
+        '''Publish the queued AMQP test requests
+
+        The requests are published in one transaction, which only returns
+        once the broker has accepted all of them, and then recorded in the
+        journal of the pending tests.  So if britney crashes, the tests that
+        were requested are not requested again in the next run, and the
+        requests that were not committed yet are not lost.  This is only
+        needed when using real amqp, as with file-based submission the
+        pending tests are returned by debci along with the results each run.
+        '''
+        if not self._queued_requests:
+            return
+        queued, self._queued_requests = self._queued_requests, []
+        for (qname, body, _) in queued:
+            self.amqp_channel.basic_publish(self.amqp_message(body, delivery_mode=2),  # persistent
+                                            routing_key=qname)
+        self.amqp_channel.tx_commit()
+        self.journal_pending_tests([entry for (_, _, entry) in queued])
+        self.logger.info('Sent %d test requests', len(queued))
+
     def pkg_test_request(self, src, arch, all_triggers, huge=False):
         '''Request one package test for a set of triggers
 
@@ -1055,7 +1355,7 @@ class AutopkgtestPolicy(BasePolicy):
         trigger = all_triggers[0]
         uses_swift = not self.options.adt_swift_url.startswith('file://')
         try:
-            result = self.test_results[trigger][src][arch]
+            result = self.test_results[trigger, src, arch]
             has_result = True
         except KeyError:
             has_result = False
@@ -1084,7 +1384,7 @@ class AutopkgtestPolicy(BasePolicy):
             self.fetch_swift_results(self.options.adt_swift_url, src, arch)
             # do we have one now?
             try:
-                self.test_results[trigger][src][arch]
+                self.test_results[trigger, src, arch]
                 return
             except KeyError:
                 pass
@@ -1103,7 +1403,11 @@ class AutopkgtestPolicy(BasePolicy):
             self.logger.info('Requesting %s autopkgtest on %s to verify %s', src, arch, trigger)
             arch_list.append(arch)
             arch_list.sort()
-            self.send_test_request(src, arch, all_triggers, huge=huge)
+            if self._worker_log is not None:
+                # sent by the main process (in merge_worker_state)
+                self._worker_log.append(('request', (src, arch, trigger, all_triggers, huge)))
+            else:
+                self.send_test_request(src, arch, all_triggers, huge=huge)
 
     def result_in_baseline(self, src, arch):
         '''Get the result for src on arch in the baseline
@@ -1121,7 +1425,7 @@ class AutopkgtestPolicy(BasePolicy):
         result_reference = [Result.NONE, None, '', 0]
         if self.options.adt_baseline == 'reference':
             try:
-                result_reference = self.test_results[REF_TRIG][src][arch]
+                result_reference = self.test_results[REF_TRIG, src, arch]
                 self.logger.debug('Found result for src %s in reference: %s',
                                   src, result_reference[0].name)
             except KeyError:
@@ -1131,17 +1435,14 @@ class AutopkgtestPolicy(BasePolicy):
             return result_reference
 
         result_ever = [Result.FAIL, None, '', 0]
-        for srcmap in self.test_results.values():
-            try:
-                if srcmap[src][arch][0] != Result.FAIL:
-                    result_ever = srcmap[src][arch]
-                # If we are not looking at a reference run, We don't really
-                # care about anything except the status, so we're done
-                # once we find a PASS.
-                if result_ever[0] == Result.PASS:
-                    break
-            except KeyError:
-                pass
+        for _, result in self.test_results.results_for(src, arch):
+            if result[0] != Result.FAIL:
+                result_ever = result
+            # If we are not looking at a reference run, We don't really
+            # care about anything except the status, so we're done
+            # once we find a PASS.
+            if result_ever[0] == Result.PASS:
+                break
 
         self.result_in_baseline_cache[src][arch] = deepcopy(result_ever)
         self.logger.debug('Result for src %s ever: %s', src, result_ever[0].name)
@@ -1172,7 +1473,7 @@ class AutopkgtestPolicy(BasePolicy):
         url = None
         run_id = None
         try:
-            r = self.test_results[trigger][src][arch]
+            r = self.test_results[trigger, src, arch]
             ver = r[1]
             run_id = r[2]
 
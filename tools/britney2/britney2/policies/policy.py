@@ -17,7 +17,7 @@ from britney2 import SuiteClass, PackageId, Suites
 from britney2.hints import Hint, split_into_one_hint_per_package
 from britney2.inputs.suiteloader import SuiteContentLoader
 from britney2.policies import PolicyVerdict, ApplySrcPolicy
-from britney2.utils import get_dependency_solvers, find_newer_binaries, is_smooth_update_allowed
+from britney2.utils import find_newer_binaries, is_smooth_update_allowed
 from britney2 import DependencyType
 from britney2.excusedeps import DependencySpec
 
@@ -57,9 +57,68 @@ class PolicyLoadRequest:
         return cls(policy_constructor, option_name, default_value)
 
 
+class PolicyStats(object):
+    """Wall time, number of calls and verdicts of each policy
+
+    The numbers are kept separately for the "src" phase (apply_src_policies,
+    including the per-architecture calls of policies running for each arch)
+    and the "srcarch" phase (apply_srcarch_policies).
+    """
+
+    PHASES = ('src', 'srcarch')
+
+    def __init__(self):
+        self._stats = {phase: {} for phase in self.PHASES}
+
+    def record(self, phase, policy_id, elapsed, verdict):
+        try:
+            stat = self._stats[phase][policy_id]
+        except KeyError:
+            stat = self._stats[phase][policy_id] = {'calls': 0, 'time': 0.0, 'verdicts': defaultdict(int)}
+        stat['calls'] += 1
+        stat['time'] += elapsed
+        stat['verdicts'][verdict.name] += 1
+
+    def merge(self, other):
+        """Add the numbers recorded by other (e.g. in a worker process)"""
+        for phase, policies in other._stats.items():
+            for policy_id, other_stat in policies.items():
+                try:
+                    stat = self._stats[phase][policy_id]
+                except KeyError:
+                    stat = self._stats[phase][policy_id] = {'calls': 0, 'time': 0.0, 'verdicts': defaultdict(int)}
+                stat['calls'] += other_stat['calls']
+                stat['time'] += other_stat['time']
+                for verdict, count in other_stat['verdicts'].items():
+                    stat['verdicts'][verdict] += count
+
+    def as_dict(self):
+        return {phase: {policy_id: {'calls': stat['calls'],
+                                    'time': round(stat['time'], 6),
+                                    'verdicts': dict(sorted(stat['verdicts'].items())),
+                                    }
+                        for policy_id, stat in sorted(policies.items())}
+                for phase, policies in self._stats.items()}
+
+    def write(self, filename):
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(self.as_dict(), f, indent=2, sort_keys=True)
+            f.write('\n')
+
+    def stats(self):
+        lines = []
+        for phase, policies in self.as_dict().items():
+            for policy_id, stat in policies.items():
+                verdicts = ', '.join('%s: %d' % v for v in stat['verdicts'].items())
+                lines.append("%s %s - calls: %d, time: %.3fs, verdicts: %s" %
+                             (phase, policy_id, stat['calls'], stat['time'], verdicts))
+        return lines
+
+
 class PolicyEngine(object):
     def __init__(self):
         self._policies = []
+        self.stats = PolicyStats()
 
     def add_policy(self, policy):
         self._policies.append(policy)
@@ -78,10 +137,31 @@ class PolicyEngine(object):
             policy.hints = hints
             policy.initialise(britney)
 
+    def excuses_computed(self):
+        for policy in self._policies:
+            policy.excuses_computed()
+
     def save_state(self, britney):
         for policy in self._policies:
             policy.save_state(britney)
 
+    def start_worker(self):
+        """Prepare the policies for being applied in a (forked) worker process"""
+        self.stats = PolicyStats()
+        for policy in self._policies:
+            policy.start_worker()
+
+    def worker_state(self):
+        """The changes made by the policies in this worker process (must be picklable)"""
+        return self.stats, [policy.worker_state() for policy in self._policies]
+
+    def merge_worker_state(self, state):
+        """Apply the changes returned by worker_state in a worker process"""
+        stats, policy_states = state
+        self.stats.merge(stats)
+        for policy, policy_state in zip(self._policies, policy_states):
+            policy.merge_worker_state(policy_state)
+
     def apply_src_policies(self, item, source_t, source_u, excuse):
         excuse_verdict = excuse.policy_verdict
         source_suite = item.suite
@@ -90,6 +170,7 @@ class PolicyEngine(object):
             pinfo = {}
             policy_verdict = PolicyVerdict.NOT_APPLICABLE
             if suite_class in policy.applicable_suites:
+                start = time.perf_counter()
                 if policy.src_policy.run_arch:
                     for arch in policy.options.architectures:
                         v = policy.apply_srcarch_policy_impl(pinfo, item, arch, source_t, source_u, excuse)
@@ -97,6 +178,7 @@ class PolicyEngine(object):
                 if policy.src_policy.run_src:
                     v = policy.apply_src_policy_impl(pinfo, item, source_t, source_u, excuse)
                     policy_verdict = PolicyVerdict.worst_of(policy_verdict, v)
+                self.stats.record('src', policy.policy_id, time.perf_counter() - start, policy_verdict)
             # The base policy provides this field, so the subclass should leave it blank
             assert 'verdict' not in pinfo
             if policy_verdict != PolicyVerdict.NOT_APPLICABLE:
@@ -112,7 +194,9 @@ class PolicyEngine(object):
         for policy in self._policies:
             pinfo = {}
             if suite_class in policy.applicable_suites:
+                start = time.perf_counter()
                 policy_verdict = policy.apply_srcarch_policy_impl(pinfo, item, arch, source_t, source_u, excuse)
+                self.stats.record('srcarch', policy.policy_id, time.perf_counter() - start, policy_verdict)
                 excuse_verdict = PolicyVerdict.worst_of(policy_verdict, excuse_verdict)
                 # The base policy provides this field, so the subclass should leave it blank
                 assert 'verdict' not in pinfo
@@ -165,6 +249,14 @@ class BasePolicy(object):
         """
         pass
 
+    def excuses_computed(self):
+        """Called once after the policy has been applied to all items
+
+        This is the place to e.g. send out requests that were collected
+        while applying the policy.  It is called in dry-runs as well.
+        """
+        pass
+
     def save_state(self, britney):  # pragma: no cover
         """Called once at the end of the run to make the policy save any persistent data
 
@@ -175,6 +267,34 @@ class BasePolicy(object):
         """
         pass
 
+    def start_worker(self):
+        """Called in a worker process before the policy is applied there
+
+        The policy can be applied to some of the items in forked worker
+        processes.  Changes to the state of the policy (or side effects
+        like requesting tests) in such a process must be recorded, so
+        they can be returned by worker_state.
+        """
+        pass
+
+    def worker_state(self):
+        """Return the changes of the state of the policy in this worker process
+
+        :return A picklable value, which is passed to merge_worker_state
+        in the main process (None by default)
+        """
+        return None
+
+    def merge_worker_state(self, state):
+        """Apply the changes made by a worker process to this policy
+
+        This is called in the main process for every worker process in the
+        same order as the items were processed.
+
+        :param state The value returned by worker_state in the worker
+        """
+        pass
+
     def apply_src_policy_impl(self, policy_info, item, source_data_tdist, source_data_srcdist, excuse):  # pragma: no cover
         """Apply a policy on a given source migration
 
@@ -320,6 +440,8 @@ class AgePolicy(BasePolicy):
 
         self._date_now = int(((time_now / (60*60)) - 19) / 24)
         self._dates = {}
+        # dates set in a worker process (see start_worker)
+        self._worker_dates = None
         self._urgencies = {}
         self._default_urgency = self.options.default_urgency
         self._penalty_immune_urgencies = frozenset()
@@ -368,6 +490,15 @@ class AgePolicy(BasePolicy):
         super().save_state(britney)
         self._write_dates_file()
 
+    def start_worker(self):
+        self._worker_dates = {}
+
+    def worker_state(self):
+        return self._worker_dates
+
+    def merge_worker_state(self, state):
+        self._dates.update(state)
+
     def apply_src_policy_impl(self, age_info, item, source_data_tdist, source_data_srcdist, excuse):
         # retrieve the urgency for the upload, ignoring it if this is a NEW package
         # (not present in the target suite)
@@ -386,10 +517,10 @@ class AgePolicy(BasePolicy):
                 }
                 urgency = self._default_urgency
 
-        if source_name not in self._dates:
-            self._dates[source_name] = (source_data_srcdist.version, self._date_now)
-        elif self._dates[source_name][0] != source_data_srcdist.version:
+        if source_name not in self._dates or self._dates[source_name][0] != source_data_srcdist.version:
             self._dates[source_name] = (source_data_srcdist.version, self._date_now)
+            if self._worker_dates is not None:
+                self._worker_dates[source_name] = self._dates[source_name]
 
         days_old = self._date_now - self._dates[source_name][1]
         min_days = self._min_days[urgency]
@@ -981,23 +1112,20 @@ class BuildDependsPolicy(BasePolicy):
         if hasattr(self.options, 'all_buildarch'):
             self._all_buildarch = SuiteContentLoader.config_str_as_list(self.options.all_buildarch, [])
 
-    def apply_src_policy_impl(self, build_deps_info, item, source_data_tdist, source_data_srcdist, excuse,
-                              get_dependency_solvers=get_dependency_solvers):
+    def apply_src_policy_impl(self, build_deps_info, item, source_data_tdist, source_data_srcdist, excuse):
         verdict = PolicyVerdict.PASS
 
         # analyze the dependency fields (if present)
         deps = source_data_srcdist.build_deps_arch
         if deps:
             v = self._check_build_deps(deps, DependencyType.BUILD_DEPENDS, build_deps_info, item,
-                                       source_data_tdist, source_data_srcdist, excuse,
-                                       get_dependency_solvers=get_dependency_solvers)
+                                       source_data_tdist, source_data_srcdist, excuse)
             verdict = PolicyVerdict.worst_of(verdict, v)
 
         ideps = source_data_srcdist.build_deps_indep
         if ideps:
             v = self._check_build_deps(ideps, DependencyType.BUILD_DEPENDS_INDEP, build_deps_info, item,
-                                       source_data_tdist, source_data_srcdist, excuse,
-                                       get_dependency_solvers=get_dependency_solvers)
+                                       source_data_tdist, source_data_srcdist, excuse)
             verdict = PolicyVerdict.worst_of(verdict, v)
 
         return verdict
@@ -1037,8 +1165,7 @@ class BuildDependsPolicy(BasePolicy):
 
         return verdict
 
-    def _check_build_deps(self, deps, dep_type, build_deps_info, item, source_data_tdist, source_data_srcdist, excuse,
-                          get_dependency_solvers=get_dependency_solvers):
+    def _check_build_deps(self, deps, dep_type, build_deps_info, item, source_data_tdist, source_data_srcdist, excuse):
         verdict = PolicyVerdict.PASS
         any_arch_ok = dep_type == DependencyType.BUILD_DEPENDS_INDEP
 
@@ -1046,14 +1173,11 @@ class BuildDependsPolicy(BasePolicy):
 
         # local copies for better performance
         parse_src_depends = apt_pkg.parse_src_depends
+        dependency_solvers = britney.dependency_solvers.solvers
 
         source_name = item.package
         source_suite = item.suite
         target_suite = self.suite_info.target_suite
-        binaries_s = source_suite.binaries
-        provides_s = source_suite.provides_table
-        binaries_t = target_suite.binaries
-        provides_t = target_suite.provides_table
         unsat_bd = {}
         relevant_archs = {binary.architecture for binary in source_data_srcdist.binaries
                           if britney.all_binaries[binary].architecture != 'all'}
@@ -1071,11 +1195,6 @@ class BuildDependsPolicy(BasePolicy):
             check_archs = self._get_check_archs(self.options.architectures, DependencyType.BUILD_DEPENDS_INDEP)
 
         for arch in check_archs:
-            # retrieve the binary package from the specified suite and arch
-            binaries_s_a = binaries_s[arch]
-            provides_s_a = provides_s[arch]
-            binaries_t_a = binaries_t[arch]
-            provides_t_a = provides_t[arch]
             arch_results[arch] = BuildDepResult.OK
             # for every dependency block (formed as conjunction of disjunction)
             for block_txt in deps.split(','):
@@ -1088,12 +1207,12 @@ class BuildDependsPolicy(BasePolicy):
                     continue
                 block = block[0]
                 # if the block is satisfied in the target suite, then skip the block
-                if get_dependency_solvers(block, binaries_t_a, provides_t_a, build_depends=True):
+                if dependency_solvers(block, target_suite, arch, build_depends=True):
                     # Satisfied in the target suite; all ok.
                     continue
 
                 # check if the block can be satisfied in the source suite, and list the solving packages
-                packages = get_dependency_solvers(block, binaries_s_a, provides_s_a, build_depends=True)
+                packages = dependency_solvers(block, source_suite, arch, build_depends=True)
                 sources = sorted(p.source for p in packages)
 
                 # if the dependency can be satisfied by the same source package, skip the block:
@@ -0,0 +1,198 @@
+import os
+import sqlite3
+from collections import defaultdict
+
+
+class AutopkgtestResults(object):
+    """The known autopkgtest results, indexed by trigger and by (src, arch)
+
+    Results are lists [status, version, run_id, seen] (see AutopkgtestPolicy)
+    keyed by (trigger, src, arch).  Besides the mapping trigger -> src ->
+    arch -> result, which is also the layout of the JSON results cache, the
+    results are indexed by (src, arch), so the results of a test for all
+    triggers can be found without looking at every trigger.
+
+    The keys of the results that were added or changed since the last call
+    to clear_changed are remembered, so only those need to be written to a
+    ResultsDatabase.  Results that are modified in place must be stored
+    again (results[key] = result) to be recorded as changed.
+    """
+
+    def __init__(self):
+        self._by_trigger = {}
+        self._by_src_arch = defaultdict(dict)
+        # Triggers in the order they were first seen; results_for uses this
+        # order so that it is the same as when iterating over all triggers
+        self._trigger_order = {}
+        self._changed = set()
+
+    @classmethod
+    def from_nested(cls, data):
+        """Create the results from a mapping trigger -> src -> arch -> result"""
+        results = cls()
+        for trigger, srcmap in data.items():
+            for src, archmap in srcmap.items():
+                for arch, result in archmap.items():
+                    results._add((trigger, src, arch), result)
+        return results
+
+    def _add(self, key, result):
+        trigger, src, arch = key
+        if trigger not in self._trigger_order:
+            self._trigger_order[trigger] = len(self._trigger_order)
+        self._by_trigger.setdefault(trigger, {}).setdefault(src, {})[arch] = result
+        self._by_src_arch[(src, arch)][trigger] = result
+
+    def __getitem__(self, key):
+        trigger, src, arch = key
+        return self._by_trigger[trigger][src][arch]
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def __setitem__(self, key, result):
+        self._add(key, result)
+        self._changed.add(key)
+
+    def __len__(self):
+        return sum(len(results) for results in self._by_src_arch.values())
+
+    def setdefault(self, key, default):
+        try:
+            return self[key]
+        except KeyError:
+            self[key] = default
+            return default
+
+    def items(self):
+        """Iterate over all ((trigger, src, arch), result) pairs"""
+        for trigger, srcmap in self._by_trigger.items():
+            for src, archmap in srcmap.items():
+                for arch, result in archmap.items():
+                    yield (trigger, src, arch), result
+
+    def results_for(self, src, arch):
+        """Iterate over the (trigger, result) pairs of src on arch (in the order of the triggers)"""
+        results = self._by_src_arch.get((src, arch))
+        if not results:
+            return iter(())
+        order = self._trigger_order
+        return iter(sorted(results.items(), key=lambda x: order[x[0]]))
+
+    def as_nested(self):
+        """The results as a mapping trigger -> src -> arch -> result (this is not a copy)"""
+        return self._by_trigger
+
+    def changed(self):
+        """The keys of all added or changed results (in the order of the triggers)"""
+        order = self._trigger_order
+        return sorted(self._changed, key=lambda key: (order[key[0]], key[1], key[2]))
+
+    def mark_all_changed(self):
+        self._changed.update(key for key, _ in self.items())
+
+    def clear_changed(self):
+        self._changed = set()
+
+
+class ResultsDatabase(object):
+    """autopkgtest results stored in a SQLite database
+
+    Unlike the JSON results cache, which has to be rewritten completely,
+    only the results that changed during a run are written.  The results
+    are indexed by (trigger) and by (src, arch) in the database as well, so
+    other tools can query it efficiently.
+    """
+
+    SCHEMA_VERSION = 1
+
+    SCHEMA = [
+        'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)',
+        # The id of a trigger reflects when it was first seen
+        'CREATE TABLE IF NOT EXISTS triggers (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)',
+        '''CREATE TABLE IF NOT EXISTS results (
+               trigger_id INTEGER NOT NULL REFERENCES triggers (id),
+               src TEXT NOT NULL,
+               arch TEXT NOT NULL,
+               status TEXT NOT NULL,
+               version TEXT,
+               run_id TEXT NOT NULL,
+               seen INTEGER NOT NULL,
+               PRIMARY KEY (trigger_id, src, arch)
+           )''',
+        'CREATE INDEX IF NOT EXISTS results_by_src_arch ON results (src, arch)',
+    ]
+
+    def __init__(self, filename):
+        self._filename = filename
+
+    def exists(self):
+        return os.path.exists(self._filename)
+
+    def _connect(self):
+        connection = sqlite3.connect(self._filename)
+        with connection:
+            for statement in self.SCHEMA:
+                connection.execute(statement)
+            row = connection.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+            if row is None:
+                connection.execute("INSERT INTO meta (key, value) VALUES ('schema_version', ?)",
+                                   (str(self.SCHEMA_VERSION),))
+            elif int(row[0]) != self.SCHEMA_VERSION:  # pragma: no cover
+                connection.close()
+                raise ValueError("%s has an unsupported schema version (%s)" % (self._filename, row[0]))
+        return connection
+
+    def load(self):
+        """Read all results
+
+        :return: An AutopkgtestResults instance with the status of the results as strings
+          (the names of the statuses) and no changed results
+        """
+        results = AutopkgtestResults()
+        connection = self._connect()
+        try:
+            rows = connection.execute('''SELECT triggers.name, src, arch, status, version, run_id, seen
+                                         FROM results JOIN triggers ON results.trigger_id = triggers.id
+                                         ORDER BY triggers.id, results.rowid''')
+            for trigger, src, arch, status, version, run_id, seen in rows:
+                results._add((trigger, src, arch), [status, version, run_id, seen])
+        finally:
+            connection.close()
+        return results
+
+    def write(self, results, keys=None):
+        """Write results to the database (in a single transaction)
+
+        :param results: An AutopkgtestResults instance
+        :param keys: The keys of the results to write (default: the changed results)
+        :return: The number of results written
+        """
+        if keys is None:
+            keys = results.changed()
+        connection = self._connect()
+        try:
+            with connection:
+                trigger_ids = {}
+                for key in keys:
+                    trigger, src, arch = key
+                    try:
+                        trigger_id = trigger_ids[trigger]
+                    except KeyError:
+                        connection.execute('INSERT OR IGNORE INTO triggers (name) VALUES (?)', (trigger,))
+                        trigger_id = connection.execute('SELECT id FROM triggers WHERE name = ?',
+                                                        (trigger,)).fetchone()[0]
+                        trigger_ids[trigger] = trigger_id
+                    status, version, run_id, seen = results[key]
+                    connection.execute('''INSERT OR REPLACE INTO results
+                                          (trigger_id, src, arch, status, version, run_id, seen)
+                                          VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                                       (trigger_id, src, arch, getattr(status, 'name', status), version, run_id,
+                                        seen))
+        finally:
+            connection.close()
+        return len(keys)
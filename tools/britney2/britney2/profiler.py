@@ -0,0 +1,202 @@
+import contextlib
+import json
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+from collections import defaultdict
+
+
+def _peak_rss():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _cpu_times():
+    times = os.times()
+    return times.user + times.system, times.children_user + times.children_system
+
+
+class StackSampler(object):
+    """Periodically record the stack of the main thread
+
+    The samples are aggregated by stack, so the memory needed does not grow
+    with the length of the run.  Each stack is prefixed with the phases
+    active when it was recorded.  Worker processes are not sampled.
+    """
+
+    def __init__(self, interval, phase_stack):
+        self._interval = interval
+        self._phase_stack = phase_stack
+        self._frames = {}
+        self.samples = defaultdict(int)
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='britney-stack-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop_event.set()
+            self._thread.join()
+            self._thread = None
+
+    def _frame_id(self, code):
+        try:
+            return self._frames[code]
+        except KeyError:
+            frame_id = self._frames[code] = (code.co_name, code.co_filename, code.co_firstlineno)
+            return frame_id
+
+    def _run(self):
+        main_thread_id = threading.main_thread().ident
+        frame_id = self._frame_id
+        samples = self.samples
+        while not self._stop_event.wait(self._interval):
+            frame = sys._current_frames().get(main_thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(frame_id(frame.f_code))
+                frame = frame.f_back
+            stack.reverse()
+            samples[(tuple(self._phase_stack), tuple(stack))] += 1
+
+    def _stacks(self):
+        """Yield the recorded stacks (root first) as lists of (name, file, line) and their number of samples"""
+        for (phases, stack), count in sorted(self.samples.items()):
+            yield [('[%s]' % phase, None, None) for phase in phases] + list(stack), count
+
+    def write_collapsed(self, filename):
+        """Write the samples in the "collapsed stack" format (as used by e.g. flamegraph.pl)"""
+        with open(filename, 'w', encoding='utf-8') as f:
+            for stack, count in self._stacks():
+                names = (name if file is None else '%s (%s:%d)' % (name, os.path.basename(file), line)
+                         for name, file, line in stack)
+                f.write('%s %d\n' % (';'.join(x.replace(';', ':') for x in names), count))
+
+    def write_speedscope(self, filename):
+        """Write the samples as a speedscope (https://www.speedscope.app) "sampled" profile"""
+        frames = []
+        frame_index = {}
+        samples = []
+        weights = []
+        for stack, count in self._stacks():
+            indices = []
+            for frame in stack:
+                try:
+                    index = frame_index[frame]
+                except KeyError:
+                    index = frame_index[frame] = len(frames)
+                    name, file, line = frame
+                    frames.append({'name': name} if file is None else {'name': name, 'file': file, 'line': line})
+                indices.append(index)
+            samples.append(indices)
+            weights.append(count * self._interval)
+        data = {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'exporter': 'britney2',
+            'name': 'britney',
+            'shared': {'frames': frames},
+            'profiles': [{
+                'type': 'sampled',
+                'name': 'britney (main thread)',
+                'unit': 'seconds',
+                'startValue': 0,
+                'endValue': sum(weights),
+                'samples': samples,
+                'weights': weights,
+            }],
+        }
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+
+
+class PhaseProfiler(object):
+    """Resource usage of the major phases of a britney run
+
+    For every phase, this records the wall and CPU time (also of waited for
+    worker processes), the peak RSS of the process at the end of the phase
+    and the number of memory blocks allocated (and not freed) by it.
+    Phases can nest, in which case the numbers of the inner phase are also
+    included in the outer one.
+
+    Optionally, the stack of the main thread is sampled as well.
+
+    A disabled profiler does nothing and is cheap enough to be left in place.
+    """
+
+    def __init__(self, enabled=False, sample_interval=None):
+        """Create a phase profiler
+
+        :param enabled: Whether to record anything at all
+        :param sample_interval: If not None, sample the stack every sample_interval
+          seconds (implies enabled)
+        """
+        self.enabled = enabled or sample_interval is not None
+        self._phase_stack = []
+        self._phases = {}
+        self._sampler = StackSampler(sample_interval, self._phase_stack) if sample_interval is not None else None
+        logger_name = ".".join((self.__class__.__module__, self.__class__.__name__))
+        self.logger = logging.getLogger(logger_name)
+
+    def start(self):
+        if self._sampler is not None:
+            self._sampler.start()
+
+    def stop(self):
+        if self._sampler is not None:
+            self._sampler.stop()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+        self._phase_stack.append(name)
+        start_wall = time.perf_counter()
+        start_cpu, start_children_cpu = _cpu_times()
+        start_blocks = sys.getallocatedblocks()
+        try:
+            yield
+        finally:
+            end_cpu, end_children_cpu = _cpu_times()
+            try:
+                stat = self._phases[name]
+            except KeyError:
+                stat = self._phases[name] = {'calls': 0, 'wall': 0.0, 'cpu': 0.0, 'children_cpu': 0.0,
+                                             'allocated_blocks': 0, 'peak_rss': 0}
+            stat['calls'] += 1
+            stat['wall'] += time.perf_counter() - start_wall
+            stat['cpu'] += end_cpu - start_cpu
+            stat['children_cpu'] += end_children_cpu - start_children_cpu
+            stat['allocated_blocks'] += sys.getallocatedblocks() - start_blocks
+            stat['peak_rss'] = max(stat['peak_rss'], _peak_rss())
+            self._phase_stack.pop()
+
+    def as_dict(self):
+        return {name: {key: round(value, 6) if isinstance(value, float) else value for key, value in stat.items()}
+                for name, stat in self._phases.items()}
+
+    def write(self, filename):
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(self.as_dict(), f, indent=2, sort_keys=True)
+            f.write('\n')
+
+    def write_stacks(self, filename, output_format='collapsed'):
+        """Write the sampled stacks in the "collapsed" or the "speedscope" format"""
+        if self._sampler is None:
+            return
+        if output_format == 'speedscope':
+            self._sampler.write_speedscope(filename)
+        else:
+            self._sampler.write_collapsed(filename)
+
+    def stats(self):
+        return ["%s - calls: %d, wall: %.3fs, cpu: %.3fs (workers: %.3fs), allocated blocks: %+d, peak RSS: %.1f MiB" %
+                (name, stat['calls'], stat['wall'], stat['cpu'], stat['children_cpu'], stat['allocated_blocks'],
+                 stat['peak_rss'] / (1024 * 1024))
+                for name, stat in self._phases.items()]
@@ -1,3 +1,120 @@
+from collections.abc import MutableMapping
+
+
+class LayeredDict(MutableMapping):
+    """A mapping with a stack of layers of changes on top of a base dict
+
+    While there are no layers, all changes are made to the base dict.
+    Otherwise they are recorded in the topmost layer, which can later be
+    discarded (undoing all of its changes at once) or merged into the
+    layer below it (or the base dict).
+    """
+
+    _DELETED = object()
+
+    def __init__(self, base=None):
+        self._base = dict(base) if base is not None else {}
+        self._layers = []
+
+    def push_layer(self):
+        self._layers.append({})
+
+    def discard_layer(self):
+        self._layers.pop()
+
+    def merge_layer(self):
+        layer = self._layers.pop()
+        if self._layers:
+            self._layers[-1].update(layer)
+            return
+        base = self._base
+        deleted = self._DELETED
+        for key, value in layer.items():
+            if value is deleted:
+                base.pop(key, None)
+            else:
+                base[key] = value
+
+    def __getitem__(self, key):
+        if self._layers:
+            for layer in reversed(self._layers):
+                if key in layer:
+                    value = layer[key]
+                    if value is self._DELETED:
+                        raise KeyError(key)
+                    return value
+        return self._base[key]
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key, value):
+        if self._layers:
+            self._layers[-1][key] = value
+        else:
+            self._base[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        if not self._layers:
+            del self._base[key]
+        elif self._in_lower_layers(key):
+            self._layers[-1][key] = self._DELETED
+        else:
+            # the key was only added in the topmost layer
+            del self._layers[-1][key]
+
+    def _in_lower_layers(self, key):
+        for layer in reversed(self._layers[:-1]):
+            if key in layer:
+                return layer[key] is not self._DELETED
+        return key in self._base
+
+    def _changes(self):
+        changes = {}
+        for layer in self._layers:
+            changes.update(layer)
+        return changes
+
+    def __iter__(self):
+        if not self._layers:
+            yield from self._base
+            return
+        changes = self._changes()
+        deleted = self._DELETED
+        for key in self._base:
+            if changes.get(key) is not deleted:
+                yield key
+        for key, value in changes.items():
+            if value is not deleted and key not in self._base:
+                yield key
+
+    def __len__(self):
+        if not self._layers:
+            return len(self._base)
+        return sum(1 for _ in self)
+
+    def keys(self):
+        return self._base.keys() if not self._layers else super().keys()
+
+    def values(self):
+        return self._base.values() if not self._layers else super().values()
+
+    def items(self):
+        return self._base.items() if not self._layers else super().items()
+
+
 class MigrationTransactionState(object):
 
     def __init__(self, suite_info, all_binaries, parent=None):
@@ -12,6 +129,11 @@ class MigrationTransactionState(object):
             # Transactions can only support one child transaction at a time
             assert not self.parent_transaction._pending_child
             self.parent_transaction._pending_child = True
+        # With layers, the changes are made in a layer of the target suite,
+        # which is simply discarded on rollback
+        self._uses_layers = suite_info.target_suite.uses_layers
+        if self._uses_layers:
+            suite_info.target_suite.push_layer()
 
     def add_undo_item(self, undo, updated_binaries):
         # We do not accept any changes to this transaction while it has a child transaction
@@ -40,6 +162,8 @@ class MigrationTransactionState(object):
         """
         self._assert_open_transaction()
         self._is_committed = True
+        if self._uses_layers:
+            self._suite_info.target_suite.merge_layer()
         if self.parent_transaction:
             self.parent_transaction._pending_child = False
             for undo_item in self._undo_items:
@@ -53,6 +177,12 @@ class MigrationTransactionState(object):
 
         self._assert_open_transaction()
         self._is_rolled_back = True
+        if self._uses_layers:
+            self._suite_info.target_suite.discard_layer()
+            if self.parent_transaction:
+                self.parent_transaction._pending_child = False
+            return
+
         lundo = self._undo_items
         lundo.reverse()
 
@@ -23,11 +23,16 @@
 
 import apt_pkg
 import errno
+import gzip
+import json
 import logging
+import lzma
+import multiprocessing
 import os
 import sys
 import time
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from functools import partial
 from itertools import filterfalse, chain
@@ -300,22 +305,42 @@ def write_heidi_delta(filename, all_selected):
                                            item.version, item.architecture))
 
 
+# The libyaml based dumper is a lot faster than the pure python one, so use it
+# when available.  Both represent python types (like tuples) the same way.
+YAML_DUMPER = getattr(yaml, 'CDumper', yaml.Dumper)
+
+
 def write_excuses(excuses, dest_file, output_format="yaml"):
     """Write the excuses to dest_file
 
     Writes a list of excuses in a specified output_format to the
-    path denoted by dest_file.  The output_format can either be "yaml"
-    or "legacy-html".
+    path denoted by dest_file.  The output_format can either be "yaml",
+    "jsonl" (one JSON document per excuse and line) or "legacy-html".
+
+    The "yaml" and "jsonl" output is written one excuse at a time, so
+    the rendered excuses are never kept in memory at the same time.
+    The "jsonl" output is compressed if dest_file ends with ".gz" or
+    ".xz".
     """
     excuselist = sorted(excuses.values(), key=lambda x: x.sortkey())
     if output_format == "yaml":
         with open(dest_file, 'w', encoding='utf-8') as f:
-            edatalist = [e.excusedata(excuses) for e in excuselist]
-            excusesdata = {
-                'sources': edatalist,
-                'generated-date': datetime.utcnow(),
-            }
-            f.write(yaml.dump(excusesdata, default_flow_style=False, allow_unicode=True))
+            # Emit the same document as dumping {'generated-date': ..., 'sources': [...]}
+            # in one go, but render the excuses one by one.
+            f.write(yaml.dump({'generated-date': datetime.utcnow()}, Dumper=YAML_DUMPER,
+                              default_flow_style=False, allow_unicode=True))
+            if not excuselist:
+                f.write("sources: []\n")
+            else:
+                f.write("sources:\n")
+            for e in excuselist:
+                yaml.dump([e.excusedata(excuses)], f, Dumper=YAML_DUMPER,
+                          default_flow_style=False, allow_unicode=True)
+    elif output_format == "jsonl":
+        with _open_possibly_compressed(dest_file) as f:
+            for e in excuselist:
+                f.write(json.dumps(e.excusedata(excuses), ensure_ascii=False, sort_keys=True))
+                f.write("\n")
     elif output_format == "legacy-html":
         with open(dest_file, 'w', encoding='utf-8') as f:
             f.write("<!DOCTYPE HTML PUBLIC \"-//W3C//DTD HTML 4.01//EN\" \"http://www.w3.org/TR/REC-html40/strict.dtd\">\n")
@@ -327,7 +352,15 @@ def write_excuses(excuses, dest_file, output_format="yaml"):
                 f.write("<li>%s" % e.html(excuses))
             f.write("</ul></body></html>\n")
     else:   # pragma: no cover
-        raise ValueError('Output format must be either "yaml or "legacy-html"')
+        raise ValueError('Output format must be either "yaml", "jsonl" or "legacy-html"')
+
+
+def _open_possibly_compressed(filename):
+    if filename.endswith('.gz'):
+        return gzip.open(filename, 'wt', encoding='utf-8')
+    if filename.endswith('.xz'):
+        return lzma.open(filename, 'wt', encoding='utf-8')
+    return open(filename, 'w', encoding='utf-8')
 
 
 def old_libraries(mi_factory, suite_info, outofsync_arches=frozenset()):
@@ -581,8 +614,8 @@ def read_sources_file(filename, sources=None, intern=sys.intern):
                                              False,
                                              build_deps_arch,
                                              build_deps_indep,
-                                             get_field('Testsuite', '').split(),
-                                             get_field('Testsuite-Triggers', '').replace(',', '').split(),
+                                             tuple(get_field('Testsuite', '').split()),
+                                             tuple(get_field('Testsuite-Triggers', '').replace(',', '').split()),
                                              )
     return sources
 
@@ -652,6 +685,103 @@ def get_dependency_solvers(block, binaries_s_a, provides_s_a, *, build_depends=F
     return packages
 
 
+class DependencySolverCache(object):
+    """Memoized get_dependency_solvers for the (suite, architecture) pairs
+
+    The result of a lookup is kept until one of the packages named in the
+    relation (or one of the packages that provided a solution) is added to
+    or removed from the suite and architecture in question.  The suite must
+    report such changes via "invalidate" (the TargetSuite does that when it
+    has a cache assigned).
+
+    Note that the returned sequences are shared between lookups, so callers
+    must not modify them.
+    """
+
+    def __init__(self):
+        # (suite name, arch) -> {(block, build_depends): solvers}
+        self._cache = defaultdict(dict)
+        # (suite name, arch) -> {package name: keys of the entries using it}
+        self._users = defaultdict(lambda: defaultdict(set))
+        self._stats = DependencySolverStats()
+
+    @property
+    def stats(self):
+        return self._stats
+
+    def solvers(self, block, suite, arch, *, build_depends=False):
+        """Find the packages which satisfy a dependency block (cached)
+
+        :param block: The dependency block (see get_dependency_solvers)
+        :param suite: The suite in which the block must be satisfied
+        :param arch: The architecture in which the block must be satisfied
+        :param build_depends: See get_dependency_solvers
+        :return a sequence of BinaryPackages solving the relation
+        """
+        suite_arch = (suite.name, arch)
+        cache = self._cache[suite_arch]
+        key = (tuple(block), build_depends)
+        try:
+            result = cache[key]
+        except KeyError:
+            pass
+        else:
+            self._stats.cache_hits += 1
+            return result
+
+        self._stats.cache_misses += 1
+        result = tuple(get_dependency_solvers(block, suite.binaries[arch], suite.provides_table[arch],
+                                              build_depends=build_depends))
+        cache[key] = result
+        users = self._users[suite_arch]
+        for name, _, _ in block:
+            users[name.split(":", 1)[0]].add(key)
+        for pkg in result:
+            users[pkg.pkg_id.package_name].add(key)
+        return result
+
+    def invalidate(self, suite, arch, names):
+        """Drop all cached results that may be affected by a change to the named packages
+
+        :param suite: The suite that changed
+        :param arch: The architecture that changed
+        :param names: The names of the binaries that were added or removed, including
+          the names of the virtual packages they provide
+        """
+        suite_arch = (suite.name, arch)
+        users = self._users.get(suite_arch)
+        if not users:
+            return
+        cache = self._cache[suite_arch]
+        for name in names:
+            keys = users.pop(name, None)
+            if not keys:
+                continue
+            for key in keys:
+                if cache.pop(key, None) is not None:
+                    self._stats.cache_invalidations += 1
+
+
+class DependencySolverStats(object):
+
+    def __init__(self):
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_invalidations = 0
+
+    @property
+    def hit_rate(self):
+        lookups = self.cache_hits + self.cache_misses
+        return self.cache_hits / lookups if lookups else 0.0
+
+    def stats(self):
+        formats = [
+            "Cache - hits: {cache_hits}, misses: {cache_misses}, hit rate: {hit_rate:.1%}",
+            "Cache invalidation - entries dropped: {cache_invalidations}",
+        ]
+        return [x.format(hit_rate=self.hit_rate, **self.__dict__) for x in formats]
+
+
 def invalidate_excuses(excuses, valid, invalid, invalidated):
     """Invalidate impossible excuses
 
@@ -730,36 +860,140 @@ def invalidate_excuses(excuses, valid, invalid, invalidated):
                     invalid.append(x)
 
 
-def compile_nuninst(target_suite, architectures, nobreakall_arches):
+# The function run by a ForkedProcessPool.  It is inherited by the
+# worker processes via fork, so it does not have to be picklable.
+_forked_function = None
+
+
+def _call_forked_function(arg):
+    return _forked_function(arg)
+
+
+class ForkedProcessPool(object):
+    """A pool of forked worker processes calling one function
+
+    The workers are forked when the pool is used for the first time (or,
+    depending on the Python version, when another one is needed), so they
+    see a copy of the caller's state as it is at that time.  Unlike
+    map_in_forked_processes, the workers are kept for the following calls
+    of "map", which saves forking them again as long as that state is
+    still the relevant one.  Close the pool once it is not.
+    """
+
+    def __init__(self, function, processes):
+        self._function = function
+        self._processes = processes
+        self._pool = None
+        self._previous_function = None
+
+    def map(self, args):
+        """Call the function with each of args in the workers
+
+        :param args: The values to call function with (they must be picklable)
+        :return: A list of the return values of function in the same order as args
+        """
+        global _forked_function
+        if self._pool is None:
+            # A worker may use a pool as well, in which case it has inherited
+            # the function of its parent.  The workers may be forked on demand,
+            # so the function is kept until the pool is closed.
+            self._previous_function = _forked_function
+            _forked_function = self._function
+            self._pool = ProcessPoolExecutor(max_workers=self._processes,
+                                             mp_context=multiprocessing.get_context('fork'))
+        return list(self._pool.map(_call_forked_function, args))
+
+    def close(self):
+        global _forked_function
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+            _forked_function = self._previous_function
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+
+def map_in_forked_processes(function, args, processes):
+    """Map a function over args using forked worker processes
+
+    The worker processes are forked after this function is called, so
+    they see a copy of the caller's state (e.g. the package universe and
+    the installability tester) as it is at the time of the call.  Any
+    changes made by function in a worker are lost, so the relevant
+    results must be returned (and be picklable).
+
+    :param function: A function taking a single argument
+    :param args: The values to call function with
+    :param processes: The maximum number of worker processes
+    :return: A list of the return values of function in the same order as args
+    """
+    args = list(args)
+    if processes < 2 or len(args) < 2:
+        return [function(x) for x in args]
+    with ForkedProcessPool(function, min(processes, len(args))) as pool:
+        return pool.map(args)
+
+
+def _compile_nuninst_arch(target_suite, nobreakall_arches, arch):
+    # if it is in the nobreakall ones, check arch-independent packages too
+    check_archall = arch in nobreakall_arches
+
+    # check all the packages for this architecture
+    nuninst_arch = set()
+    packages_t_a = target_suite.binaries[arch]
+    for pkg_name, pkg_data in packages_t_a.items():
+        r = target_suite.is_installable(pkg_data.pkg_id)
+        if not r:
+            nuninst_arch.add(pkg_name)
+
+    # if they are not required, remove architecture-independent packages
+    nuninst_arch_all = nuninst_arch.copy()
+    if not check_archall:
+        for pkg_name in nuninst_arch_all:
+            pkg_data = packages_t_a[pkg_name]
+            if pkg_data.architecture == 'all':
+                nuninst_arch.remove(pkg_name)
+
+    return nuninst_arch, nuninst_arch_all
+
+
+def _compile_nuninst_arch_in_worker(target_suite, nobreakall_arches, arch):
+    inst_tester = target_suite.inst_tester
+    inst_tester.compute_installability(architecture=arch)
+    nuninst_arch, nuninst_arch_all = _compile_nuninst_arch(target_suite, nobreakall_arches, arch)
+    return nuninst_arch, nuninst_arch_all, inst_tester.cached_results(arch)
+
+
+def compile_nuninst(target_suite, architectures, nobreakall_arches, *, processes=1):
     """Compile a nuninst dict from the current testing
 
     :param target_suite: The target suite
     :param architectures: List of architectures
     :param nobreakall_arches: List of architectures where arch:all packages must be installable
+    :param processes: If larger than 1, the architectures are checked in parallel by up to this
+      many forked worker processes.  The installability results computed by the workers are
+      merged into the installability tester of target_suite.
     """
     nuninst = {}
-    binaries_t = target_suite.binaries
+
+    if processes > 1 and len(architectures) > 1:
+        worker = partial(_compile_nuninst_arch_in_worker, target_suite, nobreakall_arches)
+        results = map_in_forked_processes(worker, architectures, processes)
+        inst_tester = target_suite.inst_tester
+        for arch, (nuninst_arch, nuninst_arch_all, cached_results) in zip(architectures, results):
+            inst_tester.merge_cached_results(arch, cached_results)
+            nuninst[arch] = nuninst_arch
+            nuninst[arch + "+all"] = nuninst_arch_all
+        return nuninst
 
     # for all the architectures
     for arch in architectures:
-        # if it is in the nobreakall ones, check arch-independent packages too
-        check_archall = arch in nobreakall_arches
-
-        # check all the packages for this architecture
-        nuninst[arch] = set()
-        packages_t_a = binaries_t[arch]
-        for pkg_name, pkg_data in packages_t_a.items():
-            r = target_suite.is_installable(pkg_data.pkg_id)
-            if not r:
-                nuninst[arch].add(pkg_name)
-
-        # if they are not required, remove architecture-independent packages
-        nuninst[arch + "+all"] = nuninst[arch].copy()
-        if not check_archall:
-            for pkg_name in nuninst[arch + "+all"]:
-                pkg_data = packages_t_a[pkg_name]
-                if pkg_data.architecture == 'all':
-                    nuninst[arch].remove(pkg_name)
+        nuninst[arch], nuninst[arch + "+all"] = _compile_nuninst_arch(target_suite, nobreakall_arches, arch)
 
     return nuninst
 
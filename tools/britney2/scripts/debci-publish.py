@@ -3,52 +3,181 @@
 # TODO: parse DSA?
 
 import argparse
-import datetime
-import json
+import codecs
 import logging
 import os.path
 import requests
+import sqlite3
 import sys
+import time
+from datetime import datetime, timezone
 
 from lib.common import get_secret_headers, SECRET_HEADERS_FILE
+from lib.jsonstream import iter_members
+
+
+DEBCI_INDEX_FILE = 'debci-results.db'
+# size of the pieces in which the results are read and parsed
+CHUNK_SIZE = 64 * 1024
+
+
+class ResultsIndex:
+    '''debci results stored in a SQLite database, indexed by trigger
+
+    Also keeps the "since" watermark, i.e. the time up to which the results
+    have been fetched, so the next run only fetches the newer ones.
+    '''
+
+    def __init__(self, filename):
+        self.connection = sqlite3.connect(filename)
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+            self.connection.execute('''CREATE TABLE IF NOT EXISTS results (
+                                           run_id INTEGER PRIMARY KEY,
+                                           trigger TEXT,
+                                           package TEXT,
+                                           arch TEXT,
+                                           date INTEGER NOT NULL
+                                       )''')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS results_by_trigger ON results (trigger)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS results_by_date ON results (date)')
+
+    def close(self):
+        self.connection.close()
+
+    def watermark(self):
+        row = self.connection.execute("SELECT value FROM meta WHERE key = 'since'").fetchone()
+        return int(row[0]) if row else None
+
+    def set_watermark(self, since):
+        self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('since', ?)", (str(since),))
+
+    def add(self, result, date):
+        self.connection.execute('INSERT OR REPLACE INTO results (run_id, trigger, package, arch, date) '
+                                'VALUES (?, ?, ?, ?, ?)',
+                                (result['run_id'], result.get('trigger'), result.get('package'),
+                                 result.get('arch'), date))
+
+    def expire(self, before):
+        "Forget the results dated before the given time"
+        return self.connection.execute('DELETE FROM results WHERE date < ?', (before,)).rowcount
+
+    def run_ids_for_trigger(self, trigger):
+        rows = self.connection.execute('SELECT run_id FROM results WHERE trigger = ? ORDER BY run_id',
+                                       (trigger,))
+        return [run_id for (run_id,) in rows]
 
 
 # functions
-def fetch_results(days_ago, secret_headers_file, debci_url, debci_cache_file):
-    if debci_cache_file and os.path.isfile(debci_cache_file):
-        logging.info('loading debci results from {}'.format(debci_cache_file))
-        with open(debci_cache_file) as f:
-            return json.load(f)['results']
+def iter_text(chunks):
+    "Decode chunks of UTF-8 encoded bytes"
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    for chunk in chunks:
+        yield decoder.decode(chunk)
+    yield decoder.decode(b'', final=True)
 
-    ts_now = datetime.datetime.now()
-    ts_start = ts_now - datetime.timedelta(days=days_ago)
-    since = ts_start.strftime('%s')
-    url = '{}/api/v1/test?since={}'.format(debci_url, since)
 
-    try:
-        headers = get_secret_headers(secret_headers_file)
-        logging.info('fetching {} days of results from {}'.format(days_ago, debci_url))
-        response = requests.get(url, headers=headers,
-                                verify=True)
-        response.raise_for_status()
-    except Exception as e:
-        logging.exception('could not fetch results')
-        sys.exit(1)
+def tee(chunks, f):
+    for chunk in chunks:
+        f.write(chunk)
+        yield chunk
+
+
+def result_date(result, default):
+    """The time (in seconds since the epoch) at which a result was finished
+
+    debci gives it in the "date" field, as an ISO 8601 date (in UTC unless
+    stated otherwise) or a timestamp.  Returns default if the result has no
+    usable date.
+    """
+    date = result.get('date')
+    if isinstance(date, (int, float)) and not isinstance(date, bool):
+        return int(date)
+    if isinstance(date, str):
+        try:
+            parsed = datetime.fromisoformat(date.replace('Z', '+00:00').replace(' UTC', '+00:00'))
+        except ValueError:
+            logging.warning('ignoring unknown date {!r} of run {}'.format(date, result.get('run_id')))
+            return default
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return int(parsed.timestamp())
+    return default
+
+
+def ingest_results(chunks, index, now):
+    """Add the results in a debci response (as chunks of bytes) to the index
 
-    data = response.json()
+    Results without a date are stored as finished now.  Returns the number
+    of results, the "until" time of the response (if it has one) and the
+    date of the newest result (None if there are no results).
+    """
+    count = 0
+    until = None
+    newest = None
+    for key, value in iter_members(iter_text(chunks), 'results'):
+        if key == 'results':
+            date = result_date(value, now)
+            index.add(value, date)
+            newest = date if newest is None else max(newest, date)
+            count += 1
+        elif key == 'until':
+            until = value
+    return count, until, newest
 
-    if debci_cache_file:
-        logging.info('saving debci results to {}'.format(debci_cache_file))
-        with open(debci_cache_file, 'w') as f:
-            json.dump(data, f)
 
-    return data['results']
+def fetch_results(days_ago, secret_headers_file, debci_url, debci_cache_file, index):
+    """Add the results that are new since the last run to the index
 
+    On the first run (i.e. with an empty index), the results of the last
+    days_ago days are fetched.  Results that finished more than days_ago
+    days ago are removed from the index.
+    """
+    now = int(time.time())
+    expire_before = now - days_ago * 24 * 60 * 60
+    with index.connection:
+        if debci_cache_file and os.path.isfile(debci_cache_file):
+            logging.info('loading debci results from {}'.format(debci_cache_file))
+            with open(debci_cache_file, 'rb') as f:
+                count, _, _ = ingest_results(iter(lambda: f.read(CHUNK_SIZE), b''), index, now)
+            expired = index.expire(expire_before)
+            logging.info('loaded {} results, forgot {} old ones'.format(count, expired))
+            return
 
-def get_run_ids_for_trigger(results, trigger):
-    matches = [r for r in results if r['trigger'] == trigger]
-    run_ids = [m['run_id'] for m in matches]
-    return run_ids
+        since = index.watermark()
+        if since is None:
+            since = expire_before
+        url = '{}/api/v1/test?since={}'.format(debci_url, since)
+
+        try:
+            headers = get_secret_headers(secret_headers_file)
+            logging.info('fetching results since {} from {}'.format(since, debci_url))
+            with requests.get(url, headers=headers, verify=True, stream=True) as response:
+                response.raise_for_status()
+                chunks = response.iter_content(chunk_size=CHUNK_SIZE)
+                if debci_cache_file:
+                    logging.info('saving debci results to {}'.format(debci_cache_file))
+                    with open(debci_cache_file, 'wb') as f:
+                        count, until, newest = ingest_results(tee(chunks, f), index, now)
+                else:
+                    count, until, newest = ingest_results(chunks, index, now)
+        except Exception:
+            logging.exception('could not fetch results')
+            sys.exit(1)
+
+        # the results are fetched again if the run is interrupted before
+        # this is committed (along with them).  Without an "until" time in
+        # the response, continue from the newest result: results finishing
+        # while the response was generated may be dated before now.
+        if until is None:
+            until = newest if newest is not None else since
+        index.set_watermark(until)
+        expired = index.expire(expire_before)
+        logging.info('fetched {} new results, forgot {} old ones'.format(count, expired))
+
+
+def get_run_ids_for_trigger(index, trigger):
+    return index.run_ids_for_trigger(trigger)
 
 
 def publish_runs(run_ids, secret_headers_file, debci_url, simulate=False):
@@ -72,13 +201,17 @@ def publish_runs(run_ids, secret_headers_file, debci_url, simulate=False):
 
 
 def run(source_package, version, secret_headers_file,
-        debci_url, debci_cache_file, days, simulate):
+        debci_url, debci_cache_file, debci_index_file, days, simulate):
     trigger = '{}/{}'.format(source_package, version)
     logging.info('working on trigger {}'.format(trigger))
 
-    results = fetch_results(days, secret_headers_file, debci_url,
-                            debci_cache_file)
-    runs_ids = get_run_ids_for_trigger(results, trigger)
+    index = ResultsIndex(debci_index_file)
+    try:
+        fetch_results(days, secret_headers_file, debci_url,
+                      debci_cache_file, index)
+        runs_ids = get_run_ids_for_trigger(index, trigger)
+    finally:
+        index.close()
 
     publish_runs(runs_ids, secret_headers_file, debci_url, simulate)
 
@@ -115,6 +248,13 @@ parser.add_argument('--debci-cache-file',
                     default=None,
                     metavar='DEBCI_CACHE_FILE',
                     help='local debci cache file to store results in: won''t query debci if it exists')
+parser.add_argument('--debci-index-file',
+                    dest='debci_index_file',
+                    action='store',
+                    required=False,
+                    default=DEBCI_INDEX_FILE,
+                    metavar='DEBCI_INDEX_FILE',
+                    help='index of the results fetched so far; only newer results are fetched')
 parser.add_argument('--secret-headers-file',
                     dest='secret_headers_file',
                     action='store',
@@ -134,4 +274,4 @@ if __name__ == '__main__':
     run(args.source_package, args.version,
         args.secret_headers_file,
         args.debci_url, args.debci_cache_file,
-        args.days, args.simulate)
+        args.debci_index_file, args.days, args.simulate)
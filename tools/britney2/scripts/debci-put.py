@@ -1,12 +1,15 @@
 #!/usr/bin/python3
 
 import argparse
+import concurrent.futures
+import hashlib
 import itertools
 import json
 import logging
 import os
 import re
 import requests
+import requests.adapters
 import sys
 
 from lib.common import get_secret_headers, SECRET_HEADERS_FILE
@@ -16,6 +19,9 @@ from lib.common import get_secret_headers, SECRET_HEADERS_FILE
 DEBCI_RE = re.compile(r'^(?:[^-]+)-(?P<suite>.+)-(?P<arch>[^-]+):(?P<pkg>[^\s]+) .*triggers": \["(?P<triggers>.+)"\]')
 
 TMP_FILE = 'debci.tmp'
+# appended to the name of the input file; records the chunks that were posted
+# while some others failed, so they are not posted again
+CHECKPOINT_SUFFIX = '.checkpoint'
 
 
 # functions
@@ -64,33 +70,128 @@ def britney2debci(debci_input, source_suite, debci_max_requests,
             yield suite, arch, debci_jobs
 
 
+def chunk_key(url, debci_priority, debci_jobs):
+    "Identify a chunk of jobs in the checkpoint file"
+    data = json.dumps([url, debci_priority, debci_jobs])
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def file_hash(filename):
+    sha256 = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def read_checkpoint(checkpoint_file, input_hash):
+    """The keys of the chunks recorded in checkpoint_file
+
+    The first line of the checkpoint is the hash of the input it was written
+    for.  Returns None if there is no checkpoint for this input.
+    """
+    if not os.path.isfile(checkpoint_file):
+        return None
+    with open(checkpoint_file) as f:
+        if f.readline().strip() != 'input ' + input_hash:
+            logging.info('ignoring {}, it was written for a different input'.format(checkpoint_file))
+            return None
+        done = set(line.strip() for line in f)
+    logging.info('{} chunks were already posted according to {}'.format(len(done), checkpoint_file))
+    return done
+
+
+def post_jobs(session, url, headers, data):
+    response = session.post(url, headers=headers, data=data,
+                            verify=True)
+    text = response.text
+    if text.strip():
+        logging.info(text)
+    response.raise_for_status()
+
+
+def post_chunks(chunks, debci_url, headers, debci_priority, checkpoint_file,
+                input_hash, parallel):
+    """Post the chunks of jobs, up to parallel of them at the same time
+
+    The chunks that were posted are recorded in checkpoint_file, and the
+    chunks recorded there already (for the same input) are skipped.  Returns
+    the number of chunks that could not be posted.
+    """
+    done = read_checkpoint(checkpoint_file, input_hash)
+    failed = 0
+    in_flight = {}
+
+    with requests.Session() as session, \
+            concurrent.futures.ThreadPoolExecutor(max_workers=parallel) as pool, \
+            open(checkpoint_file, 'a' if done is not None else 'w') as checkpoint:
+        if done is None:
+            done = set()
+            checkpoint.write('input {}\n'.format(input_hash))
+            checkpoint.flush()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=parallel)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+
+        def wait(return_when):
+            nonlocal failed
+            finished, _ = concurrent.futures.wait(in_flight, return_when=return_when)
+            for future in finished:
+                key, suite, arch = in_flight.pop(future)
+                try:
+                    future.result()
+                except Exception:
+                    logging.exception('could not post jobs for {}/{}'.format(suite, arch))
+                    failed += 1
+                else:
+                    checkpoint.write(key + '\n')
+                    checkpoint.flush()
+
+        for suite, arch, debci_jobs in chunks:
+            url = '{}/api/v1/test/{}/{}'.format(debci_url, suite, arch)
+            key = chunk_key(url, debci_priority, debci_jobs)
+            if key in done:
+                logging.info('skipping jobs for {}/{}, already posted'.format(suite, arch))
+                continue
+            data = {'tests': debci_jobs, 'priority': debci_priority}
+            logging.debug('job to post: {}'.format(data))
+            # don't read ahead too much of the input
+            if len(in_flight) >= 2 * parallel:
+                wait(concurrent.futures.FIRST_COMPLETED)
+            logging.info('about to post')
+            in_flight[pool.submit(post_jobs, session, url, headers, data)] = (key, suite, arch)
+        wait(concurrent.futures.ALL_COMPLETED)
+
+    return failed
+
+
 def submit_jobs(infile, source_suite, debci_url, secret_headers_file,
                 debci_priority, debci_max_requests, simulate,
-                debci_private_runs):
+                debci_private_runs, parallel=1):
     directory = os.path.dirname(infile)
+    checkpoint_file = infile + CHECKPOINT_SUFFIX
 
-    # read all requests
+    # read the requests as they are posted
     tmp_file = os.path.join(directory, TMP_FILE)
     os.rename(infile, tmp_file)
-    with open(tmp_file, 'r') as f:
-        debci_input = f.readlines()
 
     try:
         headers = get_secret_headers(secret_headers_file)
-        for suite, arch, debci_jobs in britney2debci(
-                debci_input, source_suite,
-                debci_max_requests, debci_private_runs):
-            url = '{}/api/v1/test/{}/{}'.format(debci_url, suite, arch)
-            data = {'tests': debci_jobs, 'priority': debci_priority}
-            logging.debug('job to post: {}'.format(data))
-            if not simulate:
-                logging.info('about to post')
-                response = requests.post(url, headers=headers, data=data,
-                                         verify=True)
-                text = response.text
-                if text.strip():
-                    logging.info(response.text)
-                response.raise_for_status()
+        with open(tmp_file, 'r') as debci_input:
+            chunks = britney2debci(debci_input, source_suite,
+                                   debci_max_requests, debci_private_runs)
+            if simulate:
+                for suite, arch, debci_jobs in chunks:
+                    logging.debug('job to post: {}'.format(debci_jobs))
+                failed = 0
+            else:
+                failed = post_chunks(chunks, debci_url, headers, debci_priority,
+                                     checkpoint_file, file_hash(tmp_file), parallel)
+        if failed:
+            # only the failed chunks are posted again in the next run
+            logging.error('could not post {} chunks'.format(failed))
+            os.rename(tmp_file, infile)
+            sys.exit(1)
     except Exception:
         logging.exception('could not post')
         os.rename(tmp_file, infile)
@@ -101,6 +202,8 @@ def submit_jobs(infile, source_suite, debci_url, secret_headers_file,
                 os.rename(tmp_file, infile)
             else:
                 os.remove(tmp_file)
+                if os.path.isfile(checkpoint_file):
+                    os.remove(checkpoint_file)
 
 
 # CL options
@@ -140,6 +243,14 @@ parser.add_argument('--debci-max-requests',
                     default=500,
                     type=int,
                     metavar='DEBCI_MAX_REQUESTS')
+parser.add_argument('--parallel',
+                    dest='parallel',
+                    action='store',
+                    required=False,
+                    default=4,
+                    type=int,
+                    metavar='PARALLEL',
+                    help='number of chunks posted at the same time')
 parser.add_argument('--secret-headers-file',
                     dest='secret_headers_file',
                     action='store',
@@ -167,4 +278,4 @@ if __name__ == '__main__':
         submit_jobs(infile, args.source_suite, args.debci_url,
                     args.secret_headers_file, args.debci_priority,
                     args.debci_max_requests, args.simulate,
-                    args.debci_private_runs)
+                    args.debci_private_runs, args.parallel)
@@ -0,0 +1,91 @@
+import json
+
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+
+
+class _Buffer:
+    "Text read from chunks, consumed from the front"
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self.text = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        "Read the next chunk; returns False at the end of the input"
+        for chunk in self._chunks:
+            if chunk:
+                self.text = self.text[self.pos:] + chunk
+                self.pos = 0
+                return True
+        self.eof = True
+        return False
+
+    def skip_whitespace(self):
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.text) or not self.fill():
+                return
+
+    def peek(self):
+        self.skip_whitespace()
+        if self.pos >= len(self.text):
+            raise ValueError('unexpected end of JSON input')
+        return self.text[self.pos]
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError('expected {!r} at {!r}'.format(char, self.text[self.pos:self.pos + 20]))
+        self.pos += 1
+
+    def value(self):
+        "Decode the next complete JSON value"
+        self.skip_whitespace()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.text, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            # a number (or literal) at the end of the text might continue
+            # in the next chunk
+            if end < len(self.text) or self.eof or not self.fill():
+                self.pos = end
+                return value
+
+
+def iter_members(chunks, stream_key):
+    """Parse a JSON object from chunks of text, one member at a time
+
+    Yields (key, value) for the members of the object, except for the array
+    stream_key, for which (stream_key, item) is yielded for each item.  So
+    only one item of it needs to be held in memory at a time.
+    """
+    buf = _Buffer(chunks)
+    buf.fill()
+    buf.expect('{')
+    if buf.peek() == '}':
+        return
+    while True:
+        key = buf.value()
+        buf.expect(':')
+        if key == stream_key and buf.peek() == '[':
+            buf.expect('[')
+            if buf.peek() != ']':
+                while True:
+                    yield key, buf.value()
+                    if buf.peek() != ',':
+                        break
+                    buf.expect(',')
+            buf.expect(']')
+        else:
+            yield key, buf.value()
+        if buf.peek() != ',':
+            break
+        buf.expect(',')
+    buf.expect('}')
@@ -0,0 +1,104 @@
+# Mock the debci API used by the scripts in scripts/
+
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+
+class DebciHTTPRequestHandler(BaseHTTPRequestHandler):
+    '''Mock debci API
+
+    This accepts posting jobs (/api/v1/test/<suite>/<arch>) or run ids to
+    publish (/api/v1/test/publish) and fetching the results finished since a
+    given time (/api/v1/test?since=<time>).  The requests are recorded in the
+    server.  Posts to the paths in the server's failing set are answered
+    with an error.  The results are served with their date, and along with
+    the time of the newest one ("until") unless the server's send_until is
+    False.
+    '''
+
+    def do_GET(self):
+        p = urlparse(self.path)
+        query = parse_qs(p.query)
+        with self.server.lock:
+            self.server.requests.append((p.path, query, dict(self.headers)))
+        if p.path != '/api/v1/test':
+            self.send_error(404, 'Not found')
+            return
+        since = int(query['since'][0])
+        with self.server.lock:
+            results = [dict(result, date=time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(finished)))
+                       for (finished, result) in self.server.results if finished >= since]
+            until = max([finished for (finished, _) in self.server.results], default=since)
+            data = {'until': until} if self.server.send_until else {}
+        data['results'] = results
+        self.send_response(200)
+        self.send_header('Content-type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps(data).encode('UTF-8'))
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        data = parse_qs(self.rfile.read(length).decode('UTF-8'))
+        path = urlparse(self.path).path
+        with self.server.lock:
+            self.server.requests.append((path, data, dict(self.headers)))
+        if path in self.server.failing:
+            self.send_error(500, 'Internal Server Error')
+            return
+        self.send_response(200)
+        self.send_header('Content-type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps({}).encode('UTF-8'))
+
+    def log_message(self, format, *args):
+        pass
+
+
+class DebciServer:
+    def __init__(self):
+        self.server = None
+        self.thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d' % self.server.server_address[1]
+
+    @property
+    def requests(self):
+        '''Requests received so far: (path, form data or query, headers)'''
+        with self.server.lock:
+            return list(self.server.requests)
+
+    def add_results(self, results):
+        '''Serve these results; a list of (time finished, result)'''
+        with self.server.lock:
+            self.server.results.extend(results)
+
+    def set_failing(self, paths):
+        '''Answer posts to these paths with an error'''
+        self.server.failing = set(paths)
+
+    def set_send_until(self, send_until):
+        '''Whether to tell the time of the newest result along with the results'''
+        self.server.send_until = send_until
+
+    def start(self):
+        assert self.server is None, 'already started'
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), DebciHTTPRequestHandler)
+        self.server.lock = threading.Lock()
+        self.server.requests = []
+        self.server.failing = set()
+        self.server.send_until = True
+        self.server.results = []
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        assert self.server, 'not running'
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        self.server = None
@@ -10,8 +10,10 @@ import os
 import sys
 import fileinput
 import unittest
+import unittest.mock
 import json
 import pprint
+import sqlite3
 import urllib.parse
 
 import apt_pkg
@@ -317,6 +319,82 @@ class T(TestBase):
         # but the set of pending tests doesn't change
         self.assertEqual(self.pending_requests, expected_pending)
 
+    def test_pending_journal(self):
+        '''Tests requested by an unfinished run are read from the journal'''
+
+        self.data.add_default_packages(green=False)
+
+        # a previous run requested some tests before it crashed (the last
+        # line was not written completely)
+        state_dir = os.path.join(self.data.path, 'data/testing/state')
+        os.makedirs(state_dir, exist_ok=True)
+        journal = os.path.join(state_dir, 'autopkgtest-pending.json.journal')
+        with open(journal, 'w') as f:
+            f.write('["green/2", "lightgreen", "amd64"]\n')
+            f.write('["green/2", "lightgreen", "i386"]\n')
+            f.write('["green/2", "darkgr')
+
+        self.run_it(
+            [('libgreen1', {'Version': '2', 'Source': 'green', 'Depends': 'libc6'}, 'autopkgtest')],
+            {'green': (True, {'green': {'amd64': 'RUNNING-ALWAYSFAIL', 'i386': 'RUNNING-ALWAYSFAIL'},
+                              'lightgreen': {'amd64': 'RUNNING-ALWAYSFAIL', 'i386': 'RUNNING-ALWAYSFAIL'},
+                              'darkgreen': {'amd64': 'RUNNING-ALWAYSFAIL', 'i386': 'RUNNING-ALWAYSFAIL'},
+                              })
+             })
+
+        # the tests in the journal are not requested again
+        self.assertEqual(
+            self.amqp_requests,
+            set(['debci-testing-i386:green {"triggers": ["green/2"]}',
+                 'debci-testing-amd64:green {"triggers": ["green/2"]}',
+                 'debci-testing-i386:darkgreen {"triggers": ["green/2"]}',
+                 'debci-testing-amd64:darkgreen {"triggers": ["green/2"]}']))
+
+        # ... and the journal is merged into the pending tests
+        self.assertEqual(self.pending_requests,
+                         {'green/2': {'darkgreen': ['amd64', 'i386'],
+                                      'green': ['amd64', 'i386'],
+                                      'lightgreen': ['amd64', 'i386']}})
+        self.assertFalse(os.path.exists(journal))
+
+    def test_multi_rdepends_with_tests_all_running_in_workers(self):
+        '''Tests requested while computing the excuses in worker processes'''
+
+        with open(self.britney_conf, 'a') as f:
+            f.write('EXCUSE_PROCESSES = 2\n')
+
+        self.data.add_default_packages(green=False, darkgreen=False)
+
+        out = self.run_it(
+            [('libgreen1', {'Version': '2', 'Source': 'green', 'Depends': 'libc6'}, 'autopkgtest'),
+             ('darkgreen', {'Version': '2', 'Depends': 'libc6 (>= 0.9), libgreen1'}, 'autopkgtest')],
+            {'green': (True, {'green': {'amd64': 'RUNNING-ALWAYSFAIL', 'i386': 'RUNNING-ALWAYSFAIL'},
+                              'lightgreen': {'amd64': 'RUNNING-ALWAYSFAIL', 'i386': 'RUNNING-ALWAYSFAIL'},
+                              'darkgreen': {'amd64': 'RUNNING-ALWAYSFAIL', 'i386': 'RUNNING-ALWAYSFAIL'},
+                              }),
+             'darkgreen': (True, {'darkgreen': {'amd64': 'RUNNING-ALWAYSFAIL', 'i386': 'RUNNING-ALWAYSFAIL'}}),
+             })[0]
+        self.assertIn('worker processes', out)
+        # the lookups in the workers are counted as well
+        self.assertRegex(out, r'Tests for binaries: \d+ cache hits, [1-9]\d* misses')
+
+        # the requests of the workers are sent by the main process
+        self.assertEqual(
+            self.amqp_requests,
+            set(['debci-testing-i386:green {"triggers": ["green/2"]}',
+                 'debci-testing-amd64:green {"triggers": ["green/2"]}',
+                 'debci-testing-i386:lightgreen {"triggers": ["green/2"]}',
+                 'debci-testing-amd64:lightgreen {"triggers": ["green/2"]}',
+                 'debci-testing-i386:darkgreen {"triggers": ["green/2"]}',
+                 'debci-testing-amd64:darkgreen {"triggers": ["green/2"]}',
+                 'debci-testing-i386:darkgreen {"triggers": ["darkgreen/2"]}',
+                 'debci-testing-amd64:darkgreen {"triggers": ["darkgreen/2"]}']))
+        self.assertEqual(self.pending_requests,
+                         {'green/2': {'darkgreen': ['amd64', 'i386'],
+                                      'green': ['amd64', 'i386'],
+                                      'lightgreen': ['amd64', 'i386']},
+                          'darkgreen/2': {'darkgreen': ['amd64', 'i386']}})
+
     def test_multi_rdepends_with_tests_all_pass(self):
         '''Multiple reverse dependencies with tests (all pass)'''
 
@@ -397,6 +475,96 @@ class T(TestBase):
         self.assertEqual(self.pending_requests, {})
         self.assertNotIn('Failure', out, out)
 
+    def test_multi_rdepends_with_tests_all_pass_prefetched(self):
+        '''Results of pending tests are prefetched from swift in parallel'''
+
+        with open(self.britney_conf, 'a') as f:
+            f.write('ADT_SWIFT_FETCH_THREADS = 4\n')
+
+        self.data.add_default_packages(green=False)
+
+        # first run requests tests and marks them as pending
+        self.run_it(
+            [('libgreen1', {'Version': '2', 'Source': 'green', 'Depends': 'libc6'}, 'autopkgtest')],
+            {'green': (True, {'green': {'amd64': 'RUNNING-ALWAYSFAIL', 'i386': 'RUNNING-ALWAYSFAIL'},
+                              'lightgreen': {'amd64': 'RUNNING-ALWAYSFAIL', 'i386': 'RUNNING-ALWAYSFAIL'},
+                              'darkgreen': {'amd64': 'RUNNING-ALWAYSFAIL', 'i386': 'RUNNING-ALWAYSFAIL'},
+                              })
+             })
+
+        # second run collects the results
+        self.swift.set_results({'autopkgtest-testing': {
+            'testing/i386/d/darkgreen/20150101_100000@': (0, 'darkgreen 1', tr('green/2')),
+            'testing/amd64/d/darkgreen/20150101_100001@': (0, 'darkgreen 1', tr('green/2')),
+            'testing/i386/l/lightgreen/20150101_100100@': (0, 'lightgreen 1', tr('green/2')),
+            'testing/amd64/l/lightgreen/20150101_100101@': (0, 'lightgreen 1', tr('green/2')),
+            'testing/i386/g/green/20150101_100200@': (0, 'green 2', tr('green/2')),
+            'testing/amd64/g/green/20150101_100201@': (0, 'green 2', tr('green/2')),
+        }})
+
+        out = self.run_it(
+            [],
+            {'green': (True, {'green/2': {'amd64': 'PASS', 'i386': 'PASS'},
+                              'lightgreen/1': {'amd64': 'PASS', 'i386': 'PASS'},
+                              'darkgreen/1': {'amd64': 'PASS', 'i386': 'PASS'},
+                              })
+             })[0]
+
+        self.assertIn('Prefetching results of 6 source package/arch pairs from swift', out)
+        self.assertEqual(self.pending_requests, {})
+        self.assertNotIn('Failure', out, out)
+
+    def test_swift_results_through_proxy(self):
+        '''Results are fetched from swift through the configured http proxy'''
+
+        # swift can only be reached through the proxy (the mock swift server
+        # serves the absolute URLs of proxy requests as well)
+        for line in fileinput.input(self.britney_conf, inplace=True):
+            if line.startswith('ADT_SWIFT_URL'):
+                print('ADT_SWIFT_URL     = http://swift.invalid:18085')
+            else:
+                sys.stdout.write(line)
+        environ = {k: v for (k, v) in os.environ.items() if k.lower() not in ('no_proxy', 'http_proxy')}
+        environ['http_proxy'] = 'http://localhost:18085'
+
+        self.data.add_default_packages(green=False)
+        results = {
+            'testing/i386/l/lightgreen/20150101_100100@': (0, 'lightgreen 1', tr('green/2')),
+            'testing/amd64/l/lightgreen/20150101_100101@': (0, 'lightgreen 1', tr('green/2')),
+        }
+        self.swift.set_results({'autopkgtest-testing': results})
+
+        with unittest.mock.patch.dict(os.environ, environ, clear=True):
+            # results fetched one at a time
+            out = self.run_it(
+                [('libgreen1', {'Version': '2', 'Source': 'green', 'Depends': 'libc6'}, 'autopkgtest')],
+                {'green': (True, {'green': {'amd64': 'RUNNING-ALWAYSFAIL', 'i386': 'RUNNING-ALWAYSFAIL'},
+                                  'lightgreen/1': {'amd64': 'PASS', 'i386': 'PASS'},
+                                  'darkgreen': {'amd64': 'RUNNING-ALWAYSFAIL', 'i386': 'RUNNING-ALWAYSFAIL'},
+                                  })
+                 })[0]
+            self.assertNotIn('Failure', out, out)
+
+            # results of the pending tests prefetched in parallel
+            results.update({
+                'testing/i386/d/darkgreen/20150101_100000@': (0, 'darkgreen 1', tr('green/2')),
+                'testing/amd64/d/darkgreen/20150101_100001@': (0, 'darkgreen 1', tr('green/2')),
+                'testing/i386/g/green/20150101_100200@': (0, 'green 2', tr('green/2')),
+                'testing/amd64/g/green/20150101_100201@': (0, 'green 2', tr('green/2')),
+            })
+            self.swift.set_results({'autopkgtest-testing': results})
+            with open(self.britney_conf, 'a') as f:
+                f.write('ADT_SWIFT_FETCH_THREADS = 4\n')
+            out = self.run_it(
+                [],
+                {'green': (True, {'green/2': {'amd64': 'PASS', 'i386': 'PASS'},
+                                  'lightgreen/1': {'amd64': 'PASS', 'i386': 'PASS'},
+                                  'darkgreen/1': {'amd64': 'PASS', 'i386': 'PASS'},
+                                  })
+                 })[0]
+            self.assertIn('Prefetching results of 4 source package/arch pairs from swift', out)
+            self.assertNotIn('Failure', out, out)
+
     def test_multi_rdepends_with_tests_mixed(self):
         '''Multiple reverse dependencies with tests (mixed results)'''
 
@@ -2386,6 +2554,10 @@ class T(TestBase):
                 print('ADT_SHARED_RESULTS_CACHE = %s' % shared_path)
             else:
                 sys.stdout.write(line)
+        # the results database is not written with a shared cache either
+        db_path = os.path.join(self.data.path, 'data/testing/state/autopkgtest-results.db')
+        with open(self.britney_conf, 'a') as f:
+            f.write('ADT_RESULTS_DB = %s\n' % db_path)
 
         # second run, should now not update cache
         self.swift.set_results({'autopkgtest-testing': {
@@ -2401,9 +2573,66 @@ class T(TestBase):
 
         # leaves autopkgtest-results.cache untouched
         self.assertFalse(os.path.exists(local_path))
+        self.assertFalse(os.path.exists(db_path))
         with open(shared_path) as f:
             self.assertEqual(orig_contents, f.read())
 
+    def test_results_database(self):
+        '''Results are moved from autopkgtest-results.cache to ADT_RESULTS_DB'''
+
+        self.data.add_default_packages(lightgreen=False)
+
+        # first run to create autopkgtest-results.cache
+        self.swift.set_results({'autopkgtest-testing': {
+            'testing/i386/l/lightgreen/20150101_100000@': (0, 'lightgreen 2', tr('lightgreen/2')),
+            'testing/amd64/l/lightgreen/20150101_100000@': (4, 'lightgreen 2', tr('lightgreen/2')),
+        }})
+
+        self.run_it(
+            [('lightgreen', {'Version': '2', 'Depends': 'libc6'}, 'autopkgtest')],
+            {'lightgreen': (True, {'lightgreen/2': {'i386': 'PASS', 'amd64': 'ALWAYSFAIL'}})},
+        )
+
+        cache_path = os.path.join(self.data.path, 'data/testing/state/autopkgtest-results.cache')
+        db_path = os.path.join(self.data.path, 'data/testing/state/autopkgtest-results.db')
+        with open(cache_path) as f:
+            orig_contents = f.read()
+        with open(self.britney_conf, 'a') as f:
+            f.write('ADT_RESULTS_DB = %s\n' % db_path)
+
+        # second run imports the cache and adds the new results
+        self.swift.set_results({'autopkgtest-testing': {
+            'testing/i386/l/lightgreen/20150101_100100@': (0, 'lightgreen 3', tr('lightgreen/3')),
+            'testing/amd64/l/lightgreen/20150101_100100@': (0, 'lightgreen 3', tr('lightgreen/3')),
+        }})
+
+        self.data.remove_all(True)
+        self.run_it(
+            [('lightgreen', {'Version': '3', 'Depends': 'libc6'}, 'autopkgtest')],
+            {'lightgreen': (True, {'lightgreen/3': {'i386': 'PASS', 'amd64': 'PASS'}})},
+        )
+
+        with open(cache_path) as f:
+            self.assertEqual(orig_contents, f.read())
+        with sqlite3.connect(db_path) as db:
+            rows = db.execute('''SELECT triggers.name, src, arch, status, version, run_id
+                                 FROM results JOIN triggers ON results.trigger_id = triggers.id''').fetchall()
+        self.assertEqual(sorted(rows), [
+            ('lightgreen/2', 'lightgreen', 'amd64', 'FAIL', '2', '20150101_100000@'),
+            ('lightgreen/2', 'lightgreen', 'i386', 'PASS', '2', '20150101_100000@'),
+            ('lightgreen/3', 'lightgreen', 'amd64', 'PASS', '3', '20150101_100100@'),
+            ('lightgreen/3', 'lightgreen', 'i386', 'PASS', '3', '20150101_100100@'),
+        ])
+
+        # third run only uses the database
+        os.unlink(cache_path)
+        self.swift.set_results({})
+        self.run_it(
+            [],
+            {'lightgreen': (True, {'lightgreen/3': {'i386': 'PASS', 'amd64': 'PASS'}})},
+        )
+        self.assertFalse(os.path.exists(cache_path))
+
     ################################################################
     # Tests for source ppa grouping
     ################################################################
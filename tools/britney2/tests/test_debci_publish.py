@@ -0,0 +1,164 @@
+import importlib.util
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS_DIR = os.path.join(PROJECT_DIR, 'scripts')
+sys.path.insert(0, PROJECT_DIR)
+sys.path.insert(0, SCRIPTS_DIR)
+
+from lib.jsonstream import iter_members  # noqa: E402
+from tests import mock_debci  # noqa: E402
+
+try:
+    import requests  # noqa: F401
+except ImportError:  # pragma: no cover
+    debci_publish = None
+else:
+    spec = importlib.util.spec_from_file_location('debci_publish', os.path.join(SCRIPTS_DIR, 'debci-publish.py'))
+    debci_publish = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(debci_publish)
+
+
+def result(run_id, trigger, package='lightgreen', arch='amd64'):
+    return {'run_id': run_id, 'trigger': trigger, 'package': package, 'arch': arch,
+            'status': 'pass', 'version': '1', 'message': 'Tests passed ✓'}
+
+
+class JSONStreamTest(unittest.TestCase):
+
+    def test_iter_members(self):
+        doc = {'until': 1700000123,
+               'results': [result(i, 'green/%d' % i) for i in range(20)],
+               'other': {'results': [1, 2.5, None, True, 'x"\\']}}
+        text = json.dumps(doc)
+        for size in (1, 2, 3, 10, len(text)):
+            chunks = [text[i:i + size] for i in range(0, len(text), size)]
+            members = list(iter_members(chunks, 'results'))
+            self.assertEqual([value for (key, value) in members if key == 'results'], doc['results'])
+            self.assertEqual([(key, value) for (key, value) in members if key != 'results'],
+                             [('until', 1700000123), ('other', doc['other'])])
+
+    def test_iter_members_empty(self):
+        self.assertEqual(list(iter_members([' {} '], 'results')), [])
+        self.assertEqual(list(iter_members(['{"results": [ ]}'], 'results')), [])
+
+    def test_iter_members_truncated(self):
+        with self.assertRaises(ValueError):
+            list(iter_members(['{"results": [1, ', '2'], 'results'))
+
+
+@unittest.skipIf(debci_publish is None, 'requests is not installed')
+class T(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix='debci-publish.')
+        self.index_file = os.path.join(self.dir, 'debci-results.db')
+        self.secret_headers_file = os.path.join(self.dir, 'secret-headers')
+        with open(self.secret_headers_file, 'w') as f:
+            f.write('Auth-Key: s3cr3t\n')
+        self.debci = mock_debci.DebciServer()
+        self.debci.start()
+        # parse the results in tiny pieces
+        self.chunk_size = debci_publish.CHUNK_SIZE
+        debci_publish.CHUNK_SIZE = 7
+        self.now = int(time.time())
+
+    def tearDown(self):
+        debci_publish.CHUNK_SIZE = self.chunk_size
+        self.debci.stop()
+        shutil.rmtree(self.dir)
+
+    def publish(self, trigger, cache_file=None, days=7):
+        '''Publish the runs for trigger; returns the since parameter (None if not fetched) and the run ids'''
+        seen = len(self.debci.requests)
+        debci_publish.run(*trigger.split('/'), self.secret_headers_file, self.debci.url, cache_file,
+                          self.index_file, days=days, simulate=False)
+        since = None
+        run_ids = None
+        for path, data, headers in self.debci.requests[seen:]:
+            self.assertEqual(headers['Auth-Key'], 's3cr3t')
+            if path == '/api/v1/test':
+                since = int(data['since'][0])
+            else:
+                self.assertEqual(path, '/api/v1/test/publish')
+                run_ids = data.get('run_ids', [''])[0]
+        return since, run_ids
+
+    def test_incremental(self):
+        self.debci.add_results([(self.now - 200, result(1, 'green/2')),
+                                (self.now - 100, result(2, 'green/2', arch='i386')),
+                                (self.now - 100, result(3, 'darkgreen/2'))])
+
+        # the first run fetches the results of the last days
+        since, run_ids = self.publish('green/2')
+        self.assertAlmostEqual(since, self.now - 7 * 24 * 60 * 60, delta=60)
+        self.assertEqual(run_ids, '1,2')
+
+        # the next one starts where the previous one ended
+        self.debci.add_results([(self.now + 100, result(4, 'green/2')),
+                                (self.now + 100, result(5, 'lightgreen/2'))])
+        since, run_ids = self.publish('green/2')
+        self.assertEqual(since, self.now - 100)
+        self.assertEqual(run_ids, '1,2,4')
+
+        since, run_ids = self.publish('darkgreen/2')
+        self.assertEqual(since, self.now + 100)
+        self.assertEqual(run_ids, '3')
+
+    def test_expire_by_date(self):
+        day = 24 * 60 * 60
+        self.debci.add_results([(self.now - 6 * day, result(1, 'green/2')),
+                                (self.now - 100, result(2, 'green/2'))])
+        since, run_ids = self.publish('green/2')
+        self.assertEqual(run_ids, '1,2')
+
+        # results are forgotten once they finished more than --days ago,
+        # however recently they were fetched
+        since, run_ids = self.publish('green/2', days=1)
+        self.assertEqual(since, self.now - 100)
+        self.assertEqual(run_ids, '2')
+
+    def test_without_until(self):
+        self.debci.set_send_until(False)
+
+        # keep the watermark when there are no results
+        first_since, run_ids = self.publish('green/2')
+        self.assertEqual(run_ids, '')
+        since, run_ids = self.publish('green/2')
+        self.assertEqual(since, first_since)
+
+        # continue from the newest result instead of the time of the request
+        self.debci.add_results([(self.now - 200, result(1, 'green/2')),
+                                (self.now - 300, result(2, 'green/2', arch='i386'))])
+        since, run_ids = self.publish('green/2')
+        self.assertEqual(run_ids, '1,2')
+        since, run_ids = self.publish('green/2')
+        self.assertEqual(since, self.now - 200)
+        self.assertEqual(run_ids, '1,2')
+
+    def test_cache_file(self):
+        self.debci.add_results([(self.now - 200, result(1, 'green/2')),
+                                (self.now - 100, result(2, 'darkgreen/2'))])
+        cache_file = os.path.join(self.dir, 'debci.json')
+
+        since, run_ids = self.publish('green/2', cache_file)
+        self.assertIsNotNone(since)
+        self.assertEqual(run_ids, '1')
+        with open(cache_file) as f:
+            self.assertEqual(len(json.load(f)['results']), 2)
+
+        # results are read from the cache file instead of debci now
+        os.unlink(self.index_file)
+        since, run_ids = self.publish('darkgreen/2', cache_file)
+        self.assertIsNone(since)
+        self.assertEqual(run_ids, '2')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import importlib.util
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS_DIR = os.path.join(PROJECT_DIR, 'scripts')
+sys.path.insert(0, PROJECT_DIR)
+sys.path.insert(0, SCRIPTS_DIR)
+
+from tests import mock_debci  # noqa: E402
+
+try:
+    import requests  # noqa: F401
+except ImportError:  # pragma: no cover
+    debci_put = None
+else:
+    spec = importlib.util.spec_from_file_location('debci_put', os.path.join(SCRIPTS_DIR, 'debci-put.py'))
+    debci_put = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(debci_put)
+
+
+REQUESTS = [
+    'debci-testing-amd64:green {"triggers": ["green/2"]}',
+    'debci-testing-amd64:lightgreen {"triggers": ["green/2"]}',
+    'debci-testing-amd64:darkgreen {"triggers": ["green/2 darkgreen/2"]}',
+    'debci-testing-i386:green {"triggers": ["green/2"]}',
+    'debci-testing-i386:lightgreen {"triggers": ["green/2"]}',
+    'debci-testing-i386:darkgreen {"triggers": ["green/2 darkgreen/2"]}',
+]
+
+
+@unittest.skipIf(debci_put is None, 'requests is not installed')
+class T(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix='debci-put.')
+        self.infile = os.path.join(self.dir, 'debci.input')
+        with open(self.infile, 'w') as f:
+            for line in REQUESTS:
+                f.write(line + '\n')
+        self.secret_headers_file = os.path.join(self.dir, 'secret-headers')
+        with open(self.secret_headers_file, 'w') as f:
+            f.write('Auth-Key: s3cr3t\n')
+        self.debci = mock_debci.DebciServer()
+        self.debci.start()
+
+    def tearDown(self):
+        self.debci.stop()
+        shutil.rmtree(self.dir)
+
+    def submit(self, simulate=False):
+        debci_put.submit_jobs(self.infile, 'unstable', self.debci.url, self.secret_headers_file,
+                              debci_priority=5, debci_max_requests=2, simulate=simulate,
+                              debci_private_runs=False, parallel=3)
+
+    def posted(self):
+        '''Map of the posted paths to the list of posted packages'''
+        posted = {}
+        for path, data, headers in self.debci.requests:
+            self.assertEqual(headers['Auth-Key'], 's3cr3t')
+            self.assertEqual(data['priority'], ['5'])
+            posted.setdefault(path, []).extend(job['package'] for job in json.loads(data['tests'][0]))
+        return {path: sorted(packages) for path, packages in posted.items()}
+
+    def test_submit(self):
+        self.submit()
+
+        self.assertEqual(self.posted(),
+                         {'/api/v1/test/testing/amd64': ['darkgreen', 'green', 'lightgreen'],
+                          '/api/v1/test/testing/i386': ['darkgreen', 'green', 'lightgreen']})
+        # one post per chunk of 2 requests and architecture
+        self.assertEqual(len(self.debci.requests), 4)
+        self.assertEqual(os.listdir(self.dir), ['secret-headers'])
+
+    def test_submit_simulate(self):
+        self.submit(simulate=True)
+
+        self.assertEqual(self.debci.requests, [])
+        self.assertEqual(sorted(os.listdir(self.dir)), ['debci.input', 'secret-headers'])
+
+    def test_retry_failed_chunks(self):
+        self.debci.set_failing({'/api/v1/test/testing/i386'})
+        with self.assertRaises(SystemExit):
+            self.submit()
+        self.assertEqual(len(self.debci.requests), 4)
+
+        # the input is kept for the next run, along with the chunks that
+        # were posted
+        self.assertEqual(sorted(os.listdir(self.dir)),
+                         ['debci.input', 'debci.input.checkpoint', 'secret-headers'])
+        with open(self.infile) as f:
+            self.assertEqual(f.read().splitlines(), REQUESTS)
+        with open(self.infile + debci_put.CHECKPOINT_SUFFIX) as f:
+            self.assertEqual(len(f.readlines()), 3)
+
+        # only the failed chunks are posted again
+        self.debci.set_failing(set())
+        self.submit()
+        retried = self.debci.requests[4:]
+        self.assertEqual([path for path, _, _ in retried],
+                         ['/api/v1/test/testing/i386'] * 2)
+        self.assertEqual(self.posted()['/api/v1/test/testing/amd64'], ['darkgreen', 'green', 'lightgreen'])
+        self.assertEqual(os.listdir(self.dir), ['secret-headers'])
+
+    def test_checkpoint_of_other_input(self):
+        self.debci.set_failing({'/api/v1/test/testing/i386'})
+        with self.assertRaises(SystemExit):
+            self.submit()
+
+        # britney wrote a new request file in the meantime, which starts
+        # with the same chunk as the previous one
+        with open(self.infile, 'w') as f:
+            for line in REQUESTS[:2]:
+                f.write(line + '\n')
+        self.debci.set_failing(set())
+        self.submit()
+        self.assertEqual([path for path, _, _ in self.debci.requests[4:]],
+                         ['/api/v1/test/testing/amd64'])
+        self.assertEqual(os.listdir(self.dir), ['secret-headers'])
+
+
+if __name__ == '__main__':
+    unittest.main()
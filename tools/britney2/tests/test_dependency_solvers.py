@@ -0,0 +1,169 @@
+import unittest
+
+from britney2 import BinaryPackage, SuiteClass, TargetSuite
+from britney2.utils import DependencySolverCache, create_provides_map
+
+from . import new_pkg_universe_builder
+
+ARCH = 'amd64'
+
+
+def new_binary(pkg_id, provides=()):
+    name, version, arch = pkg_id
+    return BinaryPackage(version, 'misc', name, version, arch, None, None, None,
+                         [(provided, '', '') for provided in provides], False, pkg_id, [])
+
+
+def block(*names):
+    return [(name, '', '') for name in names]
+
+
+class TestDependencySolverCache(unittest.TestCase):
+
+    def setUp(self):
+        builder = new_pkg_universe_builder()
+        self.perl = builder.new_package('perl').pkg_id
+        self.mawk = builder.new_package('mawk').pkg_id
+        self.gawk = builder.new_package('gawk').not_in_testing().pkg_id
+        self.nano = builder.new_package('nano').not_in_testing().pkg_id
+        _, inst_tester = builder.build()
+        self.binaries = {
+            self.perl: new_binary(self.perl),
+            self.mawk: new_binary(self.mawk, provides=['awk']),
+            self.gawk: new_binary(self.gawk, provides=['awk']),
+            self.nano: new_binary(self.nano, provides=['editor']),
+        }
+
+        self.suite = TargetSuite(SuiteClass.TARGET_SUITE, 'testing', '/nonexistent')
+        packages = {pkg_id.package_name: self.binaries[pkg_id] for pkg_id in (self.perl, self.mawk)}
+        self.suite.binaries = {ARCH: packages}
+        self.suite.provides_table = {ARCH: create_provides_map(packages)}
+        self.suite.inst_tester = inst_tester
+        self.cache = DependencySolverCache()
+        self.suite.dependency_solvers = self.cache
+
+    def solvers(self, *names):
+        return [pkg.pkg_id for pkg in self.cache.solvers(block(*names), self.suite, ARCH)]
+
+    def add_binary(self, pkg_id):
+        # Like migration.py, update the tables before telling the suite
+        pkg = self.binaries[pkg_id]
+        provides_t_a = self.suite.provides_table[ARCH]
+        self.suite.binaries[ARCH][pkg_id.package_name] = pkg
+        for provided, provided_version, _ in pkg.provides:
+            providers = provides_t_a.get(provided, frozenset())
+            provides_t_a[provided] = providers | {(pkg_id.package_name, provided_version)}
+        self.suite.add_binary(pkg_id)
+
+    def remove_binary(self, pkg_id):
+        # Like migration.py, the binaries table is updated before remove_binary is called
+        pkg = self.binaries[pkg_id]
+        provides_t_a = self.suite.provides_table[ARCH]
+        for provided, provided_version, _ in pkg.provides:
+            providers = provides_t_a[provided] - {(pkg_id.package_name, provided_version)}
+            if providers:
+                provides_t_a[provided] = providers
+            else:
+                del provides_t_a[provided]
+        del self.suite.binaries[ARCH][pkg_id.package_name]
+        self.suite.remove_binary(pkg_id)
+
+    def test_hits_and_misses(self):
+        stats = self.cache.stats
+        assert stats.hit_rate == 0.0
+        assert self.solvers('perl') == [self.perl]
+        assert (stats.cache_hits, stats.cache_misses) == (0, 1)
+        assert self.solvers('perl') == [self.perl]
+        assert (stats.cache_hits, stats.cache_misses) == (1, 1)
+
+        # The block, not just its names, and the build_depends flag are part of the key
+        assert self.solvers('perl', 'awk') == [self.perl, self.mawk]
+        self.cache.solvers(block('perl'), self.suite, ARCH, build_depends=True)
+        assert (stats.cache_hits, stats.cache_misses) == (1, 3)
+        self.cache.solvers(block('perl'), self.suite, ARCH, build_depends=True)
+        assert (stats.cache_hits, stats.cache_misses) == (2, 3)
+        assert stats.hit_rate == 0.4
+        assert stats.cache_invalidations == 0
+
+    def test_invalidate(self):
+        stats = self.cache.stats
+        assert self.solvers('perl') == [self.perl]
+        assert self.solvers('awk') == [self.mawk]
+        assert self.solvers('editor') == []
+
+        # Names that no lookup used (and other architectures) are ignored
+        self.cache.invalidate(self.suite, ARCH, ['gawk'])
+        self.cache.invalidate(self.suite, 'i386', ['perl', 'awk'])
+        assert stats.cache_invalidations == 0
+
+        # by the name in the block
+        self.cache.invalidate(self.suite, ARCH, ['perl'])
+        assert stats.cache_invalidations == 1
+        # by the name of a solver
+        self.cache.invalidate(self.suite, ARCH, ['mawk'])
+        assert stats.cache_invalidations == 2
+        # by a provided virtual name without any solvers
+        self.cache.invalidate(self.suite, ARCH, ['editor'])
+        assert stats.cache_invalidations == 3
+
+        hits = stats.cache_hits
+        self.solvers('perl')
+        self.solvers('awk')
+        self.solvers('editor')
+        assert stats.cache_hits == hits
+        self.solvers('perl')
+        assert stats.cache_hits == hits + 1
+
+    def test_real_package(self):
+        assert self.solvers('perl') == [self.perl]
+        self.remove_binary(self.perl)
+        assert self.solvers('perl') == []
+        self.add_binary(self.perl)
+        assert self.solvers('perl') == [self.perl]
+
+    def test_virtual_package(self):
+        assert self.solvers('awk') == [self.mawk]
+        assert self.solvers('editor') == []
+
+        # A new provider is found via the names it provides
+        self.add_binary(self.gawk)
+        self.add_binary(self.nano)
+        assert sorted(self.solvers('awk')) == [self.gawk, self.mawk]
+        assert self.solvers('editor') == [self.nano]
+
+        # A removed provider is gone from the tables already, so its provides
+        # are unknown; the entries it solved are found by its name
+        self.remove_binary(self.mawk)
+        self.remove_binary(self.nano)
+        assert self.solvers('awk') == [self.gawk]
+        assert self.solvers('editor') == []
+
+    def test_discard_layer(self):
+        self.suite.use_layers()
+        assert self.solvers('perl') == [self.perl]
+        assert self.solvers('awk') == [self.mawk]
+        assert self.solvers('editor') == []
+
+        self.suite.push_layer()
+        self.remove_binary(self.perl)
+        self.remove_binary(self.mawk)
+        self.add_binary(self.gawk)
+        self.add_binary(self.nano)
+        assert self.solvers('perl') == []
+        assert self.solvers('awk') == [self.gawk]
+        assert self.solvers('editor') == [self.nano]
+        self.suite.discard_layer()
+
+        assert self.solvers('perl') == [self.perl]
+        assert self.solvers('awk') == [self.mawk]
+        assert self.solvers('editor') == []
+
+        # A merged layer keeps its changes (and the cache agrees)
+        self.suite.push_layer()
+        self.add_binary(self.nano)
+        self.suite.merge_layer()
+        assert self.solvers('editor') == [self.nano]
+
+
+if __name__ == '__main__':
+    unittest.main()
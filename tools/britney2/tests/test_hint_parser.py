@@ -76,6 +76,51 @@ class HintParsing(unittest.TestCase):
         assert not hints.search(type='alias1', package='foo', version='1.0')
         assert not hints.search(type='alias2', package='bar', version='2.0')
 
+    def test_search(self):
+        hint_parser = new_hint_parser()
+        hint_parser.parse_hints(TEST_HINTER,
+                                HINTS_ALL,
+                                'test-parse-hint',
+                                [
+                                    'unblock foo/1.0 bar/2.0',
+                                    'block foo',
+                                    'remove foo/1.0',
+                                    'unblock foo/2.0',
+                                    'force-hint foo/1.0 baz/1.0',
+                                    'unblock baz/1.0/amd64',
+                                    'remove -foo/1.0',
+                                ])
+        hints = hint_parser.hints
+        all_hints = hints.search(onlyactive=False)
+        assert len(all_hints) == 8
+        all_hints[1].set_active(False)
+
+        queries = [
+            {},
+            {'type': 'unblock'},
+            {'package': 'foo'},
+            {'package': 'foo', 'onlyactive': False},
+            {'package': 'foo', 'version': '1.0'},
+            {'type': 'unblock', 'package': 'foo', 'version': '1.0'},
+            {'type': 'unblock', 'architecture': 'amd64'},
+            {'type': 'remove', 'package': 'foo', 'removal': True},
+            {'type': 'remove', 'package': 'foo', 'version': '1.0', 'removal': False},
+            {'type': 'block', 'package': 'unknown'},
+            {'type': 'unknown'},
+        ]
+        for query in queries:
+            onlyactive = query.get('onlyactive', True)
+            # The expected result is computed by a plain scan over all hints (in order)
+            expected = [hint for hint in all_hints if
+                        query.get('type', hint.type) == hint.type and
+                        (hint.active or not onlyactive) and
+                        query.get('package', hint.packages[0].package) == hint.packages[0].package and
+                        query.get('version', hint.packages[0].version) == hint.packages[0].version and
+                        query.get('architecture', hint.packages[0].architecture) == hint.packages[0].architecture and
+                        query.get('removal', hint.packages[0].is_removal) == hint.packages[0].is_removal]
+            assert hints.search(**query) == expected, query
+        assert hints['unblock'] == hints.search(type='unblock')
+
 
 if __name__ == '__main__':
     unittest.main()
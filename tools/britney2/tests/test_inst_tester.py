@@ -1,10 +1,14 @@
+import os
 import sys
+import tempfile
 import unittest
 
 from collections import OrderedDict
 
 from . import new_pkg_universe_builder
 from britney2.installability.solver import compute_scc, InstallabilitySolver, OrderNode
+from britney2.installability.warmstart import WarmStartCache
+from britney2.utils import ForkedProcessPool, map_in_forked_processes
 
 
 class TestInstTester(unittest.TestCase):
@@ -418,6 +422,193 @@ class TestInstTester(unittest.TestCase):
         assert inst_tester.stats.eqv_table_reduced_to_one == 0
         assert inst_tester.stats.eqv_table_reduced_by_zero == 1
 
+    def test_partial_cache_invalidation(self):
+        builder = new_pkg_universe_builder()
+        lib = builder.new_package('lib')
+        app = builder.new_package('app').depends_on(lib)
+        tool = builder.new_package('tool').depends_on('helper')
+        unrelated = builder.new_package('unrelated')
+        helper = builder.new_package('helper').not_in_testing()
+
+        universe, inst_tester = builder.build()
+        inst_tester.compute_installability()
+
+        assert inst_tester.is_installable(app.pkg_id)
+        assert inst_tester.is_installable(unrelated.pkg_id)
+        assert not inst_tester.is_installable(tool.pkg_id)
+
+        # Removing lib must only evict lib and its reverse dependencies
+        inst_tester.remove_binary(lib.pkg_id)
+        assert inst_tester.stats.cache_evicted == 2
+        hits = inst_tester.stats.cache_hits
+        assert inst_tester.is_installable(unrelated.pkg_id)
+        assert inst_tester.stats.cache_hits == hits + 1
+        assert not inst_tester.is_installable(app.pkg_id)
+
+        # Adding helper fixes tool without throwing out the cache
+        inst_tester.add_binary(helper.pkg_id)
+        assert inst_tester.stats.cache_broken_readded == 1
+        assert inst_tester.is_installable(tool.pkg_id)
+        inst_tester.add_binary(lib.pkg_id)
+        assert inst_tester.is_installable(app.pkg_id)
+
+        for line in inst_tester.stats.stats():
+            print(line)
+        assert inst_tester.stats.cache_drops == 0
+
+    def test_add_binary_fixes_package_broken_by_conflict(self):
+        builder = new_pkg_universe_builder()
+        x1 = builder.new_package('x1').depends_on('a').depends_on('b')
+        x2 = builder.new_package('x2').depends_on('a').depends_on('b')
+        builder.new_package('y').depends_on_any_of(x1, x2)
+        builder.new_package('a').depends_on_any_of('c', 'p')
+        builder.new_package('b').conflicts_with('c')
+        builder.new_package('c')
+        p = builder.new_package('p').not_in_testing()
+
+        universe, inst_tester = builder.build()
+        assert universe.are_equivalent(x1.pkg_id, x2.pkg_id)
+        inst_tester.compute_installability()
+        assert not inst_tester.is_installable(x1.pkg_id)
+        assert not inst_tester.is_installable(x2.pkg_id)
+
+        # x1 and x2 are broken due to a conflict and p does not reach them
+        # through broken packages, but they are installable now
+        inst_tester.add_binary(p.pkg_id)
+        assert inst_tester.is_installable(x1.pkg_id)
+        assert inst_tester.is_installable(x2.pkg_id)
+
+    def test_discard_layer(self):
+        builder = new_pkg_universe_builder()
+        lib = builder.new_package('lib')
+        app = builder.new_package('app').depends_on(lib)
+        tool = builder.new_package('tool').depends_on('helper')
+        helper = builder.new_package('helper').not_in_testing()
+
+        universe, inst_tester = builder.build()
+        inst_tester.compute_installability()
+        contents = set(inst_tester._suite_contents)
+        cache_inst = set(inst_tester._cache_inst)
+
+        inst_tester.push_layer()
+        inst_tester.remove_binary(lib.pkg_id)
+        inst_tester.add_binary(helper.pkg_id)
+        assert not inst_tester.is_installable(app.pkg_id)
+        assert inst_tester.is_installable(tool.pkg_id)
+        inst_tester.discard_layer()
+
+        assert inst_tester._suite_contents == contents
+        assert inst_tester._cache_inst == cache_inst
+        assert inst_tester.is_installable(app.pkg_id)
+        assert not inst_tester.is_pkg_in_the_suite(helper.pkg_id)
+        assert not inst_tester.is_installable(tool.pkg_id)
+
+        # A merged layer keeps its changes
+        inst_tester.push_layer()
+        inst_tester.add_binary(helper.pkg_id)
+        inst_tester.merge_layer()
+        assert inst_tester.is_installable(tool.pkg_id)
+
+    def test_warm_start_cache(self):
+        def build(helper_in_testing):
+            builder = new_pkg_universe_builder()
+            builder.new_package('base').is_essential()
+            pkgs = [
+                builder.new_package('lib'),
+                builder.new_package('app').depends_on('lib'),
+                builder.new_package('tool').depends_on('helper'),
+                builder.new_package('unrelated'),
+            ]
+            helper = builder.new_package('helper')
+            if helper_in_testing:
+                pkgs.append(helper)
+            else:
+                helper.not_in_testing()
+            pkgs.append(builder.update_package('base'))
+            universe, inst_tester = builder.build()
+            return universe, inst_tester, [x.pkg_id for x in pkgs]
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'warm-start-cache')
+            universe, inst_tester, pkg_ids = build(False)
+            cache = WarmStartCache(filename, universe, inst_tester, pkg_ids, ['amd64'], [])
+            assert cache.load() is None
+            inst_tester.compute_installability()
+            cache.save({'amd64': {'tool'}})
+
+            # Only tool is affected by the migration of helper
+            universe, inst_tester, pkg_ids = build(True)
+            cache = WarmStartCache(filename, universe, inst_tester, pkg_ids, ['amd64'], [])
+            assert cache.load() is None
+            assert cache.changed_packages == 1
+            assert cache.reused_results == 4
+            assert cache.discarded_results == 1
+            for pkg_id in pkg_ids:
+                if pkg_id.package_name not in ('tool', 'helper'):
+                    assert inst_tester.is_installable(pkg_id)
+            assert inst_tester.stats.cache_misses == 0
+            inst_tester.compute_installability()
+            assert all(inst_tester.is_installable(pkg_id) for pkg_id in pkg_ids)
+            cache.save({'amd64': set()})
+
+            # Nothing changed since then
+            universe, inst_tester, pkg_ids = build(True)
+            cache = WarmStartCache(filename, universe, inst_tester, pkg_ids, ['amd64'], [])
+            assert cache.load() == {'amd64': set()}
+            assert all(inst_tester.is_installable(pkg_id) for pkg_id in pkg_ids)
+            assert inst_tester.stats.cache_misses == 0
+
+            # The cache is not used for other architectures
+            cache = WarmStartCache(filename, universe, inst_tester, pkg_ids, ['amd64', 'i386'], [])
+            assert cache.load() is None
+            assert cache.reused_results == 0
+
+    def test_merge_cached_results_from_worker(self):
+        builder = new_pkg_universe_builder()
+        lib = builder.new_package('lib')
+        app = builder.new_package('app').depends_on(lib)
+        tool = builder.new_package('tool').depends_on('helper')
+        builder.new_package('helper').not_in_testing()
+
+        universe, inst_tester = builder.build()
+        arch = app.pkg_id.architecture
+
+        def compute(architecture):
+            inst_tester.compute_installability(architecture=architecture)
+            return inst_tester.cached_results(architecture)
+
+        results, _ = map_in_forked_processes(compute, [arch, 'no-such-arch'], 2)
+        # The workers did not touch the tester of this process
+        assert inst_tester.stats.cache_misses == 0
+        assert inst_tester.is_pkg_in_the_suite(tool.pkg_id)
+
+        inst_tester.merge_cached_results(arch, results)
+        assert inst_tester.is_installable(app.pkg_id)
+        assert inst_tester.is_installable(lib.pkg_id)
+        assert not inst_tester.is_installable(tool.pkg_id)
+        assert inst_tester.stats.cache_misses == 0
+
+    def test_forked_process_pool(self):
+        builder = new_pkg_universe_builder()
+        app = builder.new_package('app').depends_on('lib')
+        builder.new_package('lib')
+
+        universe, inst_tester = builder.build()
+
+        def check(pkg_id):
+            return os.getpid(), inst_tester.is_installable(pkg_id)
+
+        with ForkedProcessPool(check, 2) as pool:
+            first = pool.map([app.pkg_id, app.pkg_id])
+            second = pool.map([app.pkg_id, app.pkg_id, app.pkg_id])
+        assert all(installable for _, installable in first + second)
+        # The workers are reused rather than forked again for every call
+        pids = {pid for pid, _ in first + second}
+        assert len(pids) <= 2
+        assert os.getpid() not in pids
+        # and the tester of this process was not touched
+        assert inst_tester.stats.cache_misses == 0
+
     def test_solver_recursion_limit(self):
         builder = new_pkg_universe_builder()
         recursion_limit = 200
@@ -500,6 +691,34 @@ class TestInstTester(unittest.TestCase):
         print("ACTUAL  : %s" % str(actual))
         assert expected == actual
 
+    def test_solver_reuses_order_between_calls(self):
+        builder = new_pkg_universe_builder()
+        pkga = builder.new_package('pkg-a').not_in_testing()
+        pkgb = builder.new_package('pkg-b').not_in_testing()
+        pkgc = builder.new_package('pkg-c').not_in_testing()
+        pkga.depends_on(pkgb)
+        pkgb.depends_on(pkgc)
+        pkgc.depends_on(pkgb)
+
+        universe, inst_tester = builder.build()
+        solver = InstallabilitySolver(universe, inst_tester)
+        groups = [(pkg.pkg_id.package_name, {pkg.pkg_id}, set()) for pkg in (pkga, pkgb, pkgc)]
+
+        def solve(groups):
+            actual = [set(x) for x in solver.solve_groups(groups)]
+            expected = [set(x) for x in InstallabilitySolver(universe, inst_tester).solve_groups(groups)]
+            assert actual == expected
+            return actual
+
+        assert solve(groups) == [{'pkg-b', 'pkg-c'}, {'pkg-a'}]
+        # pkg-c is dropped
+        assert solve(groups[:2]) == [{'pkg-b'}, {'pkg-a'}]
+        # pkg-b and pkg-c migrated on their own
+        inst_tester.add_binary(pkgb.pkg_id)
+        inst_tester.add_binary(pkgc.pkg_id)
+        assert solve(groups[:1]) == [{'pkg-a'}]
+        assert solve(groups) == [{'pkg-a'}, {'pkg-b'}, {'pkg-c'}]
+
     def test_solver_no_scc_stack_bug(self):
         """
         This whitebox test is designed to trigger a bug in Tarjan's algorithm
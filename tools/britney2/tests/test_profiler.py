@@ -0,0 +1,70 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from britney2.profiler import PhaseProfiler
+
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+class PhaseProfilerTest(unittest.TestCase):
+
+    def test_disabled_profiler_records_nothing(self):
+        profiler = PhaseProfiler()
+        with profiler.phase('load_suites'):
+            pass
+        assert not profiler.enabled
+        assert profiler.as_dict() == {}
+        assert profiler.stats() == []
+
+    def test_nested_phases(self):
+        profiler = PhaseProfiler(enabled=True)
+        with profiler.phase('outer'):
+            for _ in range(2):
+                with profiler.phase('inner'):
+                    busy(0.01)
+        phases = profiler.as_dict()
+        assert phases['outer']['calls'] == 1
+        assert phases['inner']['calls'] == 2
+        assert phases['outer']['wall'] >= phases['inner']['wall'] >= 0.02
+        assert phases['inner']['peak_rss'] > 0
+        assert len(profiler.stats()) == 2
+
+    def test_sampled_stacks(self):
+        profiler = PhaseProfiler(sample_interval=0.001)
+        assert profiler.enabled
+        profiler.start()
+        with profiler.phase('upgrade_testing'):
+            busy(0.2)
+        profiler.stop()
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            collapsed = os.path.join(tmpdir, 'stacks.txt')
+            profiler.write_stacks(collapsed)
+            with open(collapsed) as fd:
+                lines = [line.rsplit(' ', 1) for line in fd]
+            assert any(stack.startswith('[upgrade_testing];') and 'busy (test_profiler.py:' in stack
+                       for stack, _ in lines)
+            samples = sum(int(count) for _, count in lines)
+            assert samples > 0
+
+            speedscope = os.path.join(tmpdir, 'stacks.json')
+            profiler.write_stacks(speedscope, 'speedscope')
+            with open(speedscope) as fd:
+                data = json.load(fd)
+            frames = data['shared']['frames']
+            profile = data['profiles'][0]
+            assert profile['type'] == 'sampled'
+            assert len(profile['samples']) == len(profile['weights']) == len(lines)
+            assert {'name': '[upgrade_testing]'} in frames
+            assert all(0 <= index < len(frames) for sample in profile['samples'] for index in sample)
+
+
+if __name__ == '__main__':
+    unittest.main()
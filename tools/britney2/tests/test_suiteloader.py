@@ -0,0 +1,103 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import apt_pkg
+
+from britney2 import BinaryPackageId, SuiteClass
+from britney2.inputs.suiteloader import DebMirrorLikeSuiteContentLoader
+
+from . import MockObject
+
+apt_pkg.init()
+
+SOURCES = {
+    'testing': '',
+    'unstable': '''Package: foo
+Version: 2
+Maintainer: Foo Maintainer <foo@example.org>
+Section: misc
+
+''',
+}
+
+# Out-of-date arch:all binaries may be listed more than once, built from
+# different sources (foo-old is not in Sources, so it gets a faux source)
+PACKAGES = {
+    'testing': '',
+    'unstable': '''Package: foo-data
+Version: 1
+Architecture: all
+Source: foo-old
+Section: misc
+
+Package: foo-data
+Version: 2
+Architecture: all
+Source: foo
+Section: misc
+
+Package: foo
+Version: 2
+Architecture: amd64
+Section: misc
+Depends: foo-data (= 2)
+
+''',
+}
+
+
+class SuiteLoaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix='suiteloader.')
+        for suite in ('testing', 'unstable'):
+            os.mkdir(os.path.join(self.dir, suite))
+            with open(os.path.join(self.dir, suite, 'Sources'), 'w') as f:
+                f.write(SOURCES[suite])
+            with open(os.path.join(self.dir, suite, 'Packages_amd64'), 'w') as f:
+                f.write(PACKAGES[suite])
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def load(self, snapshot_dir=None):
+        config = MockObject(testing=os.path.join(self.dir, 'testing'),
+                            unstable=os.path.join(self.dir, 'unstable'),
+                            architectures='amd64',
+                            nobreakall_arches='amd64',
+                            outofsync_arches=None,
+                            break_arches=None,
+                            new_arches=None,
+                            suite_snapshot_dir=snapshot_dir)
+        loader = DebMirrorLikeSuiteContentLoader(config)
+        suites = loader.load_suites()
+        contents = {}
+        for suite in suites:
+            contents[suite.suite_class] = (
+                {name: (src.version, src.is_fakesrc, sorted(src.binaries)) for name, src in suite.sources.items()},
+                {name: (pkg.version, pkg.source) for name, pkg in suite.binaries['amd64'].items()},
+            )
+        return loader, contents
+
+    def test_snapshot(self):
+        """Loading from the snapshot gives the same suites as parsing"""
+        _, expected = self.load()
+        sources, binaries = expected[SuiteClass.PRIMARY_SOURCE_SUITE]
+        assert binaries['foo-data'] == ('2', 'foo')
+        # the superseded foo-data is replaced by the newer one (see #709460)
+        assert sources['foo-old'] == ('1', True, [BinaryPackageId('foo-data', '2', 'amd64')])
+
+        snapshot_dir = os.path.join(self.dir, 'snapshot')
+        loader, contents = self.load(snapshot_dir)
+        assert loader._snapshot.hits == 0
+        assert contents == expected
+
+        loader, contents = self.load(snapshot_dir)
+        assert loader._snapshot.misses == 0
+        assert contents == expected
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from britney2.policies.autopkgtest import Result
+from britney2.policies.testresults import AutopkgtestResults, ResultsDatabase
+
+
+def nested_results():
+    return {
+        'green/2': {
+            'green': {'amd64': [Result.PASS, '2', '100', 1000],
+                      'i386': [Result.FAIL, '2', '101', 1001]},
+            'lightgreen': {'amd64': [Result.PASS, '1', '102', 1002]},
+        },
+        'darkgreen/2': {
+            'green': {'amd64': [Result.NEUTRAL, '2', '103', 1003]},
+        },
+    }
+
+
+class TestAutopkgtestResults(unittest.TestCase):
+
+    def test_indexes(self):
+        results = AutopkgtestResults.from_nested(nested_results())
+        assert len(results) == 4
+        assert ('green/2', 'green', 'i386') in results
+        assert ('green/2', 'green', 's390x') not in results
+        assert ('blue/1', 'green', 'amd64') not in results
+        assert results['green/2', 'lightgreen', 'amd64'][2] == '102'
+        assert [trigger for trigger, _ in results.results_for('green', 'amd64')] == ['green/2', 'darkgreen/2']
+        assert list(results.results_for('green', 's390x')) == []
+        assert results.as_nested() == nested_results()
+
+        # Both indexes see added and replaced results
+        results['blue/1', 'green', 'amd64'] = [Result.PASS, '2', '104', 1004]
+        results['green/2', 'green', 'amd64'] = [Result.OLD_PASS, '2', '105', 1005]
+        assert len(results) == 5
+        assert [(trigger, result[2]) for trigger, result in results.results_for('green', 'amd64')] == \
+            [('green/2', '105'), ('darkgreen/2', '103'), ('blue/1', '104')]
+        assert results.as_nested()['green/2']['green']['amd64'][2] == '105'
+        assert sorted(key for key, _ in results.items()) == sorted([
+            ('blue/1', 'green', 'amd64'),
+            ('darkgreen/2', 'green', 'amd64'),
+            ('green/2', 'green', 'amd64'),
+            ('green/2', 'green', 'i386'),
+            ('green/2', 'lightgreen', 'amd64'),
+        ])
+
+        # setdefault only adds missing results
+        result = results.setdefault(('green/2', 'green', 'i386'), [Result.PASS, '3', '106', 1006])
+        assert result[2] == '101'
+        result = results.setdefault(('blue/1', 'blue', 'amd64'), [Result.PASS, '1', '107', 1007])
+        assert results['blue/1', 'blue', 'amd64'] is result
+        assert len(results) == 6
+
+    def test_changed(self):
+        results = AutopkgtestResults.from_nested(nested_results())
+        assert results.changed() == []
+
+        results['blue/1', 'green', 'amd64'] = [Result.PASS, '2', '104', 1004]
+        results['green/2', 'green', 'i386'] = [Result.PASS, '2', '105', 1005]
+        results.setdefault(('green/2', 'green', 'amd64'), None)
+        # in the order of the triggers
+        assert results.changed() == [('green/2', 'green', 'i386'), ('blue/1', 'green', 'amd64')]
+
+        results.clear_changed()
+        assert results.changed() == []
+
+        results.mark_all_changed()
+        assert len(results.changed()) == len(results) == 5
+
+
+class TestResultsDatabase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.dir.name, 'autopkgtest-results.db')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_round_trip(self):
+        db = ResultsDatabase(self.filename)
+        assert not db.exists()
+        assert len(db.load()) == 0
+        assert db.exists()
+
+        results = AutopkgtestResults.from_nested(nested_results())
+        # nothing changed yet
+        assert db.write(results) == 0
+        results.mark_all_changed()
+        assert db.write(results) == 4
+
+        # The statuses are stored by name
+        with sqlite3.connect(self.filename) as connection:
+            statuses = connection.execute('SELECT DISTINCT status FROM results ORDER BY status').fetchall()
+        assert statuses == [('FAIL',), ('NEUTRAL',), ('PASS',)]
+
+        loaded = db.load()
+        assert loaded.changed() == []
+        expected = nested_results()
+        for archmap in (archmap for srcmap in expected.values() for archmap in srcmap.values()):
+            for result in archmap.values():
+                result[0] = result[0].name
+        assert loaded.as_nested() == expected
+        assert [trigger for trigger, _ in loaded.results_for('green', 'amd64')] == ['green/2', 'darkgreen/2']
+
+        # Only the changed results are written again
+        results.clear_changed()
+        results['green/2', 'green', 'i386'] = [Result.PASS, '2', '105', 1005]
+        results['blue/1', 'green', 'amd64'] = [Result.PASS, '2', '104', 1004]
+        assert db.write(results) == 2
+        loaded = db.load()
+        assert len(loaded) == 5
+        assert loaded['green/2', 'green', 'i386'] == ['PASS', '2', '105', 1005]
+        assert [trigger for trigger, _ in loaded.results_for('green', 'amd64')] == \
+            ['green/2', 'darkgreen/2', 'blue/1']
+
+        # or the given ones
+        assert db.write(results, keys=[('green/2', 'green', 'amd64')]) == 1
+
+
+if __name__ == '__main__':
+    unittest.main()
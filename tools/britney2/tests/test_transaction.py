@@ -0,0 +1,57 @@
+import unittest
+
+from britney2.transaction import LayeredDict
+
+
+class TestLayeredDict(unittest.TestCase):
+
+    def test_discard_layer(self):
+        d = LayeredDict({'a': 1, 'b': 2})
+        d.push_layer()
+        d['a'] = 3
+        del d['b']
+        d['c'] = 4
+        assert dict(d) == {'a': 3, 'c': 4}
+        d.discard_layer()
+        assert dict(d) == {'a': 1, 'b': 2}
+
+    def test_add_then_delete(self):
+        d = LayeredDict({'a': 1})
+        d.push_layer()
+        d['new'] = 2
+        del d['new']
+        assert 'new' not in d
+        d.merge_layer()
+        assert dict(d) == {'a': 1}
+
+    def test_add_then_delete_in_nested_layers(self):
+        d = LayeredDict({'a': 1})
+        d.push_layer()
+        d['new'] = 2
+        d['other'] = 3
+        d.push_layer()
+        del d['new']
+        del d['a']
+        d.push_layer()
+        d['other'] = 4
+        del d['other']
+        d.merge_layer()
+        d.merge_layer()
+        assert dict(d) == {}
+        d.merge_layer()
+        assert dict(d) == {}
+        assert len(d) == 0
+
+        # the deleted markers of keys that only exist in a layer are dropped
+        d.push_layer()
+        d['new'] = 5
+        d.push_layer()
+        del d['new']
+        d.merge_layer()
+        d['new'] = 6
+        d.merge_layer()
+        assert dict(d) == {'new': 6}
+
+
+if __name__ == '__main__':
+    unittest.main()
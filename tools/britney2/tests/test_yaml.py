@@ -7,11 +7,15 @@
 # (at your option) any later version.
 
 import fileinput
+import gzip
 import json
 import os
 import pprint
 import sys
+import tempfile
 import unittest
+import unittest.mock
+from datetime import datetime
 
 import apt_pkg
 import yaml
@@ -19,6 +23,7 @@ import yaml
 PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, PROJECT_DIR)
 
+from britney2.utils import write_excuses  # noqa: E402
 from tests import TestBase, mock_swift
 
 apt_pkg.init()
@@ -115,6 +120,70 @@ class YamlTest(TestBase):
         excuse = self.do_test([pkg])
         assert excuse['libc6']['policy_info']['depends']['verdict'] == 'REJECTED_PERMANENTLY'
 
+    def test_jsonl_output(self):
+        """JSON Lines output has the same excuses as the yaml output"""
+        jsonl_output = os.path.join(self.data.path, 'output', 'excuses.jsonl.gz')
+        with open(self.britney_conf, 'a') as f:
+            f.write('EXCUSES_JSONL_OUTPUT = %s\n' % jsonl_output)
+        pkg = ('libc6', {'Version': '2',
+                         'Depends': 'notavailable (>= 2)'},
+               6)
+
+        excuses_dict = self.do_test([pkg])
+        with gzip.open(jsonl_output, 'rt', encoding='utf-8') as f:
+            jsonl_excuses = [json.loads(line) for line in f]
+        assert {s['source']: s for s in jsonl_excuses} == excuses_dict
+
+
+class FakeExcuse:
+    def __init__(self, name, data):
+        self.name = name
+        self.data = data
+
+    def sortkey(self):
+        return self.name
+
+    def excusedata(self, excuses):
+        return self.data
+
+
+class WriteExcusesTest(unittest.TestCase):
+    """Validate the yaml written by write_excuses"""
+
+    def test_same_as_dumping_all_at_once(self):
+        """The excuses are dumped one by one, but the document is unchanged"""
+        date = datetime(2020, 2, 29, 12, 0, 0)
+        excuses = {
+            'green': FakeExcuse('green', {
+                'source': 'green',
+                'excuses': ['Migration status: OK ✓'],
+                'policy_info': {'autopkgtest': {'verdict': 'PASS',
+                                                'green/2': ('PASS', 'log', 'history')}},
+            }),
+            'darkgreen': FakeExcuse('darkgreen', {
+                'source': 'darkgreen',
+                'policy_info': {'age': {'age-requirement': 5, 'current-age': (1, 2)}},
+            }),
+        }
+        with tempfile.TemporaryDirectory() as tmpdir:
+            dest_file = os.path.join(tmpdir, 'excuses.yaml')
+            with unittest.mock.patch('britney2.utils.datetime') as mock_datetime:
+                mock_datetime.utcnow.return_value = date
+                write_excuses(excuses, dest_file)
+                write_excuses({}, dest_file + '.empty')
+            with open(dest_file, encoding='utf-8') as f:
+                written = f.read()
+            with open(dest_file + '.empty', encoding='utf-8') as f:
+                written_empty = f.read()
+
+        expected = yaml.dump({'sources': [excuses['darkgreen'].data, excuses['green'].data],
+                              'generated-date': date},
+                             default_flow_style=False, allow_unicode=True)
+        self.assertEqual(written, expected)
+        self.assertIn('!!python/tuple', written)
+        self.assertEqual(written_empty, yaml.dump({'sources': [], 'generated-date': date},
+                                                  default_flow_style=False, allow_unicode=True))
+
 
 if __name__ == '__main__':
     unittest.main()